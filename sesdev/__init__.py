@@ -1,25 +1,29 @@
-import fnmatch
+import inspect
 import json
 import logging
 from os import environ, path
 import re
 import sys
+import time
 import requests
 
 from prettytable import PrettyTable
 
 import click
 import pkg_resources
+import yaml
 
 from sesdev.box import box_list_handler, box_remove_handler
 from seslib.constant import Constant
-from seslib.deployment import Deployment
+from seslib.deployment import Deployment, DeploymentRecord
 from seslib.exceptions import \
                               SesDevException, \
                               AddRepoNoUpdateWithExplicitRepo, \
                               BoxDoesNotExist, \
                               CmdException, \
                               DebugWithoutLogFileDoesNothing, \
+                              DeploymentAlreadyExists, \
+                              ManifestInvalid, \
                               NodeDoesNotExist, \
                               NoExplicitRolesWithSingleNode, \
                               NoNodeWithRole, \
@@ -31,6 +35,7 @@ from seslib.exceptions import \
                               VersionNotKnown, \
                               YouMustProvide
 from seslib.log import Log
+from seslib.pool import DeploymentPool
 from seslib.settings import Settings
 from seslib import tools
 from seslib.zypper import ZypperRepo
@@ -157,6 +162,19 @@ def common_create_options(func):
                      help="Whether to provision the VMs (e.g., deploy Ceph on them) "
                           "after creation"
                     ),
+        click.option('--vm-engine', type=click.Choice(['libvirt', 'libvirt-native']),
+                     default=None,
+                     help='Create the VMs with Vagrant ("libvirt") or with libvirt directly '
+                          '("libvirt-native")'),
+        click.option('--cloud-init-seed/--no-cloud-init-seed', default=None,
+                     help='With "--vm-engine libvirt-native", provision the nodes at first '
+                          'boot from a cloud-init seed ISO'),
+        click.option('--use-baked-image/--no-use-baked-image', default=None,
+                     help='With "--vm-engine libvirt-native", boot the nodes from the image '
+                          'made by "sesdev bake", if there is a matching one (default)'),
+        click.option('--parallel-bringup', type=click.IntRange(min=0), default=None,
+                     help='Bring up and provision at most this many nodes at once, each with '
+                          'its own log file (0: leave it to Vagrant)'),
         click.option('--cpus', default=None, type=int,
                      help='Number of virtual CPUs for the VMs'),
         click.option('--ram', default=None, type=int,
@@ -192,6 +210,9 @@ def common_create_options(func):
                      help='Set synced-folder to be mounted on the master node. <str:dest>'),
         click.option('--dry-run/--no-dry-run', is_flag=True, default=False,
                      help='Dry run (do not create any VMs)'),
+        click.option('--wait/--no-wait', 'wait_for_capacity', default=None,
+                     help='Wait in line until the libvirt host has the RAM, vCPUs and '
+                          'storage pool space for the deployment (default), or fail'),
         click.option('--ssd', is_flag=True, default=False,
                      help='On VMS with additional disks, make one disk non-rotational'),
         click.option('--fqdn', is_flag=True, default=False,
@@ -287,6 +308,9 @@ def _maybe_munge_repo_url(repo_url):
               help='Configuration file location')
 @click.option('-d', '--debug/--no-debug', default=False,
               help='Whether to emit DEBUG-level log messages')
+@click.option('-j', '--jobs', type=click.IntRange(min=1), default=None,
+              help='Maximum number of deployments (or nodes) to work on concurrently '
+                   '(default: {})'.format(Constant.JOBS))
 @click.option('--log-file', type=str, default=None,
               help='Whether to append log messages to a file (and which file)')
 @click.option('--vagrant-debug/--no-vagrant-debug', default=False,
@@ -297,6 +321,7 @@ def _maybe_munge_repo_url(repo_url):
 def cli(
         config_file=None,
         debug=None,
+        jobs=None,
         log_file=None,
         vagrant_debug=None,
         verbose=None,
@@ -353,6 +378,10 @@ $ sesdev create octopus --roles="[master, mon, mgr], \\
     if vagrant_debug:
         Log.info("vagrant will be run with --debug option")
 
+    if jobs:
+        Log.info("Jobs: {}".format(jobs))
+        Constant.JOBS = jobs  # set once here, never to change again
+
     if work_path:
         Log.info("Working path: {}".format(work_path))
         Constant.A_WORKING_DIR = work_path  # set once here, never to change again
@@ -386,6 +415,7 @@ def _gen_settings_dict(
         ceph_repo=None,
         ceph_salt_branch=None,
         ceph_salt_repo=None,
+        cloud_init_seed=None,
         cpus=None,
         deepsea_branch=None,
         deepsea_repo=None,
@@ -416,6 +446,7 @@ def _gen_settings_dict(
         non_interactive=None,
         num_disks=None,
         os=None,
+        parallel_bringup=None,
         provision=None,
         qa_test_opt=None,
         ram=None,
@@ -437,7 +468,10 @@ def _gen_settings_dict(
         stop_before_install_deps=None,
         stop_before_run_make_check=None,
         synced_folder=None,
+        use_baked_image=None,
         username=None,
+        vm_engine=None,
+        wait_for_capacity=None,
         msgr2_secure_mode=None,
         msgr2_prefer_secure=None,
         k3s_version=None,
@@ -585,6 +619,21 @@ def _gen_settings_dict(
     if ssd is not None:
         settings_dict['ssd'] = ssd
 
+    if parallel_bringup is not None:
+        settings_dict['parallel_bringup'] = parallel_bringup
+
+    if vm_engine is not None:
+        settings_dict['vm_engine'] = vm_engine
+
+    if wait_for_capacity is not None:
+        settings_dict['wait_for_capacity'] = wait_for_capacity
+
+    if cloud_init_seed is not None:
+        settings_dict['cloud_init_seed'] = cloud_init_seed
+
+    if use_baked_image is not None:
+        settings_dict['use_baked_image'] = use_baked_image
+
     if fqdn is not None:
         settings_dict['fqdn'] = fqdn
 
@@ -775,8 +824,9 @@ def _create_command(deployment_id, settings_dict):
             if dep.settings.dry_run:
                 click.echo("Dry run. Stopping now, before creating any VMs.")
                 raise click.Abort()
-            dep.start(_print_log)
-            dep.user_provision()
+            with dep.admitted(_print_log):
+                dep.start(_print_log)
+            dep.user_provision(log_handler=_print_log)
             click.echo("=== Deployment Finished ===")
             click.echo()
             click.echo("You can login into the cluster with:")
@@ -1054,10 +1104,8 @@ def makecheck(deployment_id, **kwargs):
 def _maybe_glob_deps(deployment_id):
     matching_deployments = None
     if tools.is_a_glob(deployment_id):
-        deps = Deployment.list(True)
-        dep_ids = [d.dep_id for d in deps]
-        matching_dep_ids = fnmatch.filter(dep_ids, deployment_id)
-        matching_deployments = [d for d in deps if d.dep_id in matching_dep_ids]
+        records = DeploymentRecord.list(pattern=deployment_id)
+        matching_deployments = Deployment.load_many([r.dep_id for r in records])
     else:
         matching_deployments = [Deployment.load(deployment_id)]
     return matching_deployments
@@ -1134,6 +1182,202 @@ def remove_box(box_name, **kwargs):
     box_remove_handler(box_name, **kwargs)
 
 
+@cli.command()
+@click.argument('version', type=click.Choice(Constant.CORE_VERSIONS))
+@click.option('--os', type=str, default=None,
+              help='OS (open)SUSE distro (default: the preferred one for VERSION)')
+@click.option('--devel/--product', default=True,
+              help='Include the devel repos, if applicable, like "sesdev create" does')
+@libvirt_options
+def bake(version, **kwargs):
+    """
+    Bakes a base image for deployments of Ceph VERSION created with
+    "--vm-engine libvirt-native": a VM is booted from the Vagrant Box and
+    given the repos and packages every node of such a deployment gets, and its
+    disk is kept as a storage volume. New deployments of VERSION on the same OS
+    then boot from that image, and skip that part of provisioning, as long as
+    their repos are the ones the image was baked with.
+    """
+    settings_dict = _gen_settings_dict(version, synced_folder=(), **kwargs)
+    volume_name = Deployment.bake_image(_print_log, Settings(**settings_dict))
+    click.echo("Image {} baked".format(volume_name))
+
+
+@cli.command()
+@click.argument('source_id')
+@click.argument('new_id')
+def clone(source_id, new_id):
+    """
+    Clones the stopped deployment SOURCE_ID (of the libvirt-native VM engine)
+    into a new deployment NEW_ID. The disks of the clone are qcow2 overlays
+    of the disks of SOURCE_ID, which keeps writing to overlays of its own from
+    then on. The clone gets networks of its own, and its nodes are moved to
+    their new addresses when they boot.
+    """
+    dep = Deployment.load(source_id)
+    dep.clone(_print_log, new_id)
+    click.echo("Deployment {} cloned into {}".format(source_id, new_id))
+
+
+@cli.group()
+def pool():
+    """
+    Commands to keep deployments of a version fully provisioned and parked,
+    ready to be claimed
+    """
+
+
+@pool.command(name='fill')
+@click.argument('version', type=click.Choice(list(Constant.VERSION_PREFERRED_OS)))
+@click.option('--size', type=click.IntRange(min=0), default=None,
+              help='Number of deployments to keep in the pool (default: as set by the last '
+                   'fill with --size)')
+@common_create_options
+@deepsea_options
+@ceph_salt_options
+@libvirt_options
+@ipv6_options
+def pool_fill(version, size, **kwargs):
+    """
+    Creates deployments of VERSION (of the libvirt-native VM engine) until
+    the VERSION pool has SIZE of them, and shuts them off once they are
+    provisioned. Along with --size, the options of "sesdev create VERSION"
+    set up the pool deployments; a fill without --size creates them the way
+    the last one with it did. Deployments the pool has too many, or that an
+    interrupted fill left behind, are destroyed.
+    """
+    settings_dict = None
+    if size is not None:
+        _prep_kwargs(kwargs)
+        settings_dict = _gen_settings_dict(version, **kwargs)
+    results = DeploymentPool(version).fill(_print_log, size, settings_dict)
+    failed = sorted(dep_id for (dep_id, result) in results.items()
+                    if result['status'] != 'running')
+    click.echo("Pool {}: {} deployment(s) added".format(version, len(results) - len(failed)))
+    if failed:
+        click.echo("Failed to create deployment(s) {}".format(', '.join(failed)))
+        sys.exit(1)
+
+
+@pool.command(name='claim')
+@click.argument('version', type=click.Choice(list(Constant.VERSION_PREFERRED_OS)))
+@click.argument('new_id')
+@click.option('--refill/--no-refill', default=True,
+              help='Fill the pool up again in the background (default)')
+def pool_claim(version, new_id, refill):
+    """
+    Turns a parked deployment of the VERSION pool into the new deployment
+    NEW_ID, up and running: NEW_ID is a clone of it (see "sesdev clone"), and
+    it leaves the pool, to be destroyed along with NEW_ID. Then, a "sesdev pool
+    fill VERSION" runs in the background to make up for it.
+    """
+    deployment_pool = DeploymentPool(version)
+    deployment_pool.configuration()  # fails unless the pool was ever filled
+    try:
+        dep = deployment_pool.claim(new_id, _print_log)
+    finally:
+        if refill:
+            deployment_pool.refill_in_background()
+    click.echo("Deployment {} claimed from the {} pool".format(dep.dep_id, version))
+
+
+def _manifest_deployments(manifest, wait_for_capacity=None):
+    """
+    Validate the entries of the create-many manifest "manifest" (see
+    create_many()) and return the list of (entry, Deployment or None, error)
+    tuples. An error in the manifest as a whole raises ManifestInvalid.
+    """
+    try:
+        with open(manifest, 'r', encoding='utf-8') as file:
+            tree = yaml.safe_load(file) or {}
+    except yaml.YAMLError as error:
+        raise ManifestInvalid(manifest, error) from error
+    if not isinstance(tree, dict) or not isinstance(tree.get('deployments'), list) \
+            or not isinstance(tree.get('defaults', {}), dict):
+        raise ManifestInvalid(manifest, 'expected a "deployments" list and an optional '
+                                        '"defaults" mapping')
+    known_options = set(inspect.signature(_gen_settings_dict).parameters) - {'version'}
+    dep_ids = set()
+    entries = []
+    for (index, entry) in enumerate(tree['deployments']):
+        if not isinstance(entry, dict):
+            raise ManifestInvalid(manifest, 'deployment #{} is not a mapping'.format(index + 1))
+        options = {key.replace('-', '_'): value
+                   for (key, value) in dict(tree.get('defaults', {}), **entry).items()}
+        version = options.pop('version', None)
+        dep_id = options.pop('id', None)
+        options.setdefault('synced_folder', ())
+        if isinstance(options.get('roles'), list):
+            # a YAML list of lists, rather than the --roles string
+            options['roles'] = ','.join('[{}]'.format(','.join(node))
+                                        for node in options['roles'])
+        if wait_for_capacity is not None:
+            options['wait_for_capacity'] = wait_for_capacity
+        dep = None
+        error = None
+        try:
+            if version not in Constant.VERSION_PREFERRED_OS:
+                raise VersionNotKnown(version)
+            unknown = sorted(set(options) - known_options)
+            if unknown:
+                raise ManifestInvalid(manifest, 'unknown option(s) {}'.format(', '.join(unknown)))
+            settings_dict = _gen_settings_dict(version, **options)
+            settings_dict['non_interactive'] = True
+            dep_id = _maybe_gen_dep_id(version, dep_id, settings_dict)
+            if dep_id in dep_ids:
+                raise DeploymentAlreadyExists(dep_id)
+            dep_ids.add(dep_id)
+            dep = Deployment.prepare(dep_id, Settings(**settings_dict))
+            if not dep.settings.devel_repo and version not in Constant.CORE_VERSIONS:
+                raise OptionNotSupportedInVersion('--product', version)
+            dep.vet_configuration()
+        except (SesDevException, TypeError, ValueError) as exc:
+            (dep, error) = (None, str(exc))
+        entries.append(({'id': dep_id, 'version': version}, dep, error))
+    return entries
+
+
+@cli.command(name='create-many')
+@click.argument('manifest', type=click.Path(exists=True, dir_okay=False))
+@click.option('--summary', type=click.Path(dir_okay=False), default=None,
+              help='Write the results (JSON) to this file instead of the standard output')
+@click.option('--dry-run', is_flag=True, default=False,
+              help='Only validate the manifest')
+@click.option('--wait/--no-wait', 'wait_for_capacity', default=None,
+              help='Wait in line until the libvirt host has the RAM, vCPUs and storage '
+                   'pool space for each deployment (default), or fail it')
+def create_many(manifest, summary, dry_run, wait_for_capacity):
+    """
+    Creates all deployments described in the YAML file MANIFEST at once. Its
+    "deployments" list has one mapping per deployment, with the "version" to
+    deploy, an optional "id", and any options of "sesdev create <version>"
+    (e.g. "roles", "os", "ram", "vm-engine"); an optional "defaults" mapping
+    holds options for all of them. All entries are validated before anything
+    is created. Finally, the result for each deployment is printed as JSON.
+    """
+    entries = _manifest_deployments(manifest, wait_for_capacity)
+    invalid = [entry for (entry, _, error) in entries if error]
+    results = {}
+    if not invalid and not dry_run:
+        results = Deployment.create_many([dep for (_, dep, _) in entries], _print_log)
+    summary_list = []
+    for (entry, dep, error) in entries:
+        result = dict(entry, status='invalid' if error else 'valid', stage=None,
+                      error=error, seconds=0, public_network=None)
+        if dep:
+            result['public_network'] = dep.public_network_segment
+            result.update(results.get(dep.dep_id, {}))
+        summary_list.append(result)
+    output = json.dumps(summary_list, indent=2)
+    if summary:
+        with open(summary, 'w', encoding='utf-8') as file:
+            file.write(output + '\n')
+    else:
+        click.echo(output)
+    if invalid or [result for result in results.values() if result['status'] != 'running']:
+        sys.exit(1)
+
+
 @cli.command()
 @click.argument('deployment_id')
 @click.option('--non-interactive', '-n', '--force', '-f',
@@ -1160,11 +1404,14 @@ def destroy(deployment_id, **kwargs):
         )
         if not really_want_to:
             raise click.Abort()
+    Log.debug("destroy deployments: '{}', destroy networks: {}"
+              .format(deployment_id, destroy_networks))
+    failed = Deployment.destroy_many(matching_deployments, _print_log, destroy_networks)
     for dep in matching_deployments:
-        Log.debug("destroy deployment: '{}', destroy networks: {}"
-                  .format(deployment_id, destroy_networks))
-        dep.destroy(_print_log, destroy_networks)
-        click.echo("Deployment {} destroyed!".format(dep.dep_id))
+        if dep.dep_id not in failed:
+            click.echo("Deployment {} destroyed!".format(dep.dep_id))
+    if failed:
+        sys.exit(1)
 
 
 def _link_load_deployment(dep_id):
@@ -1181,20 +1428,19 @@ def _link_load_deployment(dep_id):
 
 def _link_populate_files(dep_1, dep_2, dep_2_ssh_public_key):
     click.echo()
-    for (dep_1_node_name, _) in dep_1.nodes.items():
-        click.echo("=> populating /etc/hosts and ~/.ssh/authorized_keys on "
-                   "node \"{}\" of deployment \"{}\""
-                   .format(dep_1_node_name, dep_1.dep_id)
-                  )
-        for (_, dep_2_node_obj) in dep_2.nodes.items():
-            dep_1.ssh(dep_1_node_name,
-                      ["echo {} {} >> /etc/hosts ; echo {} >> ~/.ssh/authorized_keys"
-                       .format(dep_2_node_obj.public_address,
-                               dep_2_node_obj.fqdn,
-                               dep_2_ssh_public_key
-                              )
-                      ],
-                     )
+    click.echo("=> populating /etc/hosts and ~/.ssh/authorized_keys on "
+               "nodes {} of deployment \"{}\""
+               .format(dep_1.node_list, dep_1.dep_id)
+              )
+    populate_cmd = ' ; '.join(
+        "echo {} {} >> /etc/hosts ; echo {} >> ~/.ssh/authorized_keys"
+        .format(dep_2_node_obj.public_address,
+                dep_2_node_obj.fqdn,
+                dep_2_ssh_public_key
+               )
+        for dep_2_node_obj in dep_2.nodes.values()
+    )
+    dep_1.for_each_node(lambda _: [populate_cmd], log_handler=_print_log)
 
 
 @cli.command(name='link')
@@ -1206,8 +1452,8 @@ def link(dep_id_1, dep_id_2):
 
     See README.md for more information on using this feature.
     """
-    (dep_1, dep_1_ssh_public_key) = _link_load_deployment(dep_id_1)
-    (dep_2, dep_2_ssh_public_key) = _link_load_deployment(dep_id_2)
+    ((dep_1, dep_1_ssh_public_key), (dep_2, dep_2_ssh_public_key)) = \
+        tools.parallel_map(_link_load_deployment, [dep_id_1, dep_id_2])
     _link_populate_files(dep_1, dep_2, dep_2_ssh_public_key)
     _link_populate_files(dep_2, dep_1, dep_1_ssh_public_key)
     click.echo()
@@ -1241,6 +1487,77 @@ def list_deps(**kwargs):
     _show_status_of_all_deployments(**kwargs)
 
 
+@cli.group()
+def snapshot():
+    """
+    Commands to take and restore snapshots of all nodes of a deployment
+    """
+
+
+@snapshot.command(name='save')
+@click.argument('deployment_id')
+@click.argument('name')
+def snapshot_save(deployment_id, name):
+    """
+    Takes snapshot NAME of all nodes of deployment DEPLOYMENT_ID, OSD disks
+    and memory included. The running nodes are paused while the snapshots are
+    taken.
+    """
+    dep = Deployment.load(deployment_id)
+    dep.snapshot_save(_print_log, name)
+    click.echo("Snapshot {} of deployment {} taken".format(name, deployment_id))
+
+
+@snapshot.command(name='restore')
+@click.argument('deployment_id')
+@click.argument('name')
+@click.option('--non-interactive', '-n', '--force', '-f',
+              is_flag=True,
+              callback=_abort_if_false,
+              default=False,
+              expose_value=False,
+              help='Allow to restore the snapshot without user confirmation',
+              prompt='Are you sure you want to discard the current state of the deployment?')
+def snapshot_restore(deployment_id, name):
+    """
+    Reverts all nodes of deployment DEPLOYMENT_ID to snapshot NAME (requires
+    libvirt 9.9.0 or newer on the libvirt host), and sets the clocks of the
+    nodes.
+    """
+    dep = Deployment.load(deployment_id)
+    dep.snapshot_restore(_print_log, name)
+    click.echo("Deployment {} restored to snapshot {}".format(deployment_id, name))
+
+
+@snapshot.command(name='list')
+@click.argument('deployment_id')
+def snapshot_list(deployment_id):
+    """
+    Lists the snapshots of deployment DEPLOYMENT_ID
+    """
+    dep = Deployment.load(deployment_id, load_status=False)
+    p_table = PrettyTable(["Name", "Created", "Nodes"])
+    p_table.align = "l"
+    for entry in dep.snapshot_list():
+        p_table.add_row([entry['name'],
+                         time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(entry['created'])),
+                         ', '.join(entry['nodes'])])
+    click.echo(p_table)
+
+
+@snapshot.command(name='delete')
+@click.argument('deployment_id')
+@click.argument('name')
+def snapshot_delete(deployment_id, name):
+    """
+    Deletes snapshot NAME of deployment DEPLOYMENT_ID, keeping the current
+    state of the nodes
+    """
+    dep = Deployment.load(deployment_id)
+    dep.snapshot_delete(_print_log, name)
+    click.echo("Snapshot {} of deployment {} deleted".format(name, deployment_id))
+
+
 @cli.command(name='qa-test')
 @click.argument('deployment_id')
 def qa_test(deployment_id):
@@ -1286,7 +1603,20 @@ def redeploy(deployment_id, **kwargs):
     dep = Deployment.load(deployment_id)
     dep.destroy(_print_log)
     dep = Deployment.create(deployment_id, _print_log, dep.settings)
-    dep.start(_print_log)
+    with dep.admitted(_print_log):
+        dep.start(_print_log)
+
+
+@cli.command()
+def reindex():
+    """
+    Rebuilds the deployment state index (state.db in the sesdev working
+    directory) from the deployment directories. Only needed if the index has
+    gone out of sync, e.g. because deployment directories were created or
+    removed by hand.
+    """
+    records = DeploymentRecord.reindex()
+    click.echo("Indexed {} deployment(s)".format(len(records)))
 
 
 @cli.command(name='replace-ceph-salt')
@@ -1483,10 +1813,12 @@ def report(deployment_id):
 
 
 @cli.command()
+@click.option('--close-masters', is_flag=True, default=False,
+              help='Close the shared SSH connections (and tunnels) to NODE, or to all nodes')
 @click.argument('deployment_id')
 @click.argument('node', required=False)
 @click.argument('command', required=False, nargs=-1, type=click.Path())
-def ssh(deployment_id, node=None, command=None):
+def ssh(deployment_id, node=None, command=None, close_masters=False):
     """
     Opens an SSH shell to, or runs optional COMMAND on, node NODE in deployment
     DEPLOYMENT_ID.
@@ -1496,7 +1828,11 @@ def ssh(deployment_id, node=None, command=None):
     Note: You can check the existing node names with the command
     "sesdev show <deployment_id>"
     """
-    dep = Deployment.load(deployment_id)
+    dep = Deployment.load(deployment_id, load_status=False)
+    if close_masters:
+        closed = dep.close_ssh_masters(node)
+        click.echo("Closed {} SSH master connection(s)".format(closed))
+        return
     node_name = 'master' if node is None else node
 
     cmd = ' '.join(['\"' + s + '\"' if " " in s else s for s in list(command)])
@@ -1528,7 +1864,7 @@ def status(**kwargs):
     format_opt = kwargs.get('format_opt')
     node_list = []
     if deployment_id:
-        dep = Deployment.load(deployment_id)
+        dep = DeploymentRecord.load(deployment_id, load_status=True)
         node_found = False
         if format_opt not in ['json']:
             p_table = PrettyTable(["Node", "Status", "Public Address",
@@ -1541,7 +1877,7 @@ def status(**kwargs):
                     if format_opt in ['json']:
                         click.echo("\"{}\"".format(node_obj.status))
                         return
-                    p_table.add_row([node_name, node_obj.status,
+                    p_table.add_row([node_name, _node_status(node_obj),
                                      node_obj.public_address,
                                      node_obj.cluster_address])
             else:
@@ -1553,7 +1889,7 @@ def status(**kwargs):
                         "cluster_address": node_obj.cluster_address,
                     })
                 else:
-                    p_table.add_row([node_name, node_obj.status,
+                    p_table.add_row([node_name, _node_status(node_obj),
                                      node_obj.public_address,
                                      node_obj.cluster_address])
         if node_opt:
@@ -1588,11 +1924,18 @@ def status(**kwargs):
         _show_status_of_all_deployments(format_opt=format_opt)
 
 
+def _node_status(node):
+    if node.status_updated is None:
+        return node.status
+    return "{} (last known, {})".format(
+        node.status, time.strftime('%Y-%m-%d %H:%M', time.localtime(node.status_updated)))
+
+
 def _show_status_of_all_deployments(**kwargs):
     format_opt = kwargs.get('format_opt')
     p_table = None
     deployments_list = []
-    deps = Deployment.list(True)
+    deps = DeploymentRecord.list(load_status=True)
     if deps:
         Log.info("list_deps: Found deployments: {}".format(", ".join(d.dep_id for d in deps)))
     else:
@@ -1615,10 +1958,14 @@ def _show_status_of_all_deployments(**kwargs):
                 status_str = 'partially running'
             elif node.status == 'suspended' and status_str == 'running':
                 status_str = 'partially running'
+            elif node.status == 'saved' and status_str == 'running':
+                status_str = 'partially running'
             elif node.status == 'running' and status_str == 'stopped':
                 status_str = 'partially running'
             elif node.status == 'running' and status_str == 'suspended':
                 status_str = 'partially running'
+            elif node.status == 'running' and status_str == 'saved':
+                status_str = 'partially running'
         return status_str
 
     if format_opt not in ['json']:
@@ -1680,18 +2027,34 @@ def start(deployment_id, node=None):
     if len(matching_deployments) > 1 and node:
         click.echo("Ignoring node advice because DEPLOYMENT_SPEC is a glob")
         node = None
-    for dep in matching_deployments:
+
+    def _start(dep):
         dep.start(_print_log, node=node)
         click.echo("Deployment {} started!".format(dep.dep_id))
 
+    # restoring saved nodes takes seconds, so saved deployments are started
+    # all at once
+    saved = [dep for dep in matching_deployments
+             if all(_node.status == 'saved' for _node in dep.nodes.values())]
+    tools.parallel_map(_start, saved)
+    for dep in matching_deployments:
+        if dep not in saved:
+            _start(dep)
+
 
 @cli.command()
 @click.argument('deployment_id')
 @click.argument('node', required=False)
-def stop(deployment_id, node=None):
+@click.option('--suspend', is_flag=True, default=False,
+              help='Save the memory of the VMs to disk instead of shutting them down')
+def stop(deployment_id, node=None, suspend=False):
     """
     Stops the VMs of the deployment DEPLOYMENT_SPEC, where DEPLOYMENT_SPEC
     might be either a literal deployment ID or a glob ("octopus_*").
+
+    With --suspend, the VMs are not shut down, but saved to disk (libvirt
+    managed save) all at once, and "sesdev start" resumes them where they
+    left off, instead of booting them.
     """
     matching_deployments = _maybe_glob_deps(deployment_id)
     click.echo("Stopping {} {}".format(
@@ -1701,10 +2064,17 @@ def stop(deployment_id, node=None):
     if len(matching_deployments) > 1 and node:
         click.echo("Ignoring node advice because DEPLOYMENT_SPEC is a glob")
         node = None
-    for dep in matching_deployments:
-        dep.stop(_print_log, node)
+
+    def _stop(dep):
+        dep.stop(_print_log, node, suspend)
         click.echo("Deployment {} stopped!".format(dep.dep_id))
 
+    if suspend:
+        tools.parallel_map(_stop, matching_deployments)
+    else:
+        for dep in matching_deployments:
+            _stop(dep)
+
 
 @cli.command()
 @click.argument('deployment_id')
@@ -1789,7 +2159,7 @@ def upgrade(deployment_id, node, devel_repos, to_version):
 @click.argument('node', required=False)
 def user_provision(deployment_id, node):
     dep = Deployment.load(deployment_id)
-    dep.user_provision(node)
+    dep.user_provision(node, log_handler=_print_log)
 
 
 @cli.command()
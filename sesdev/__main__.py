@@ -0,0 +1,5 @@
+import sys
+
+from sesdev import sesdev_main
+
+sys.exit(sesdev_main())
@@ -1,7 +1,7 @@
 import click
 
 from seslib.box import Box
-from seslib.deployment import Deployment
+from seslib.deployment import DeploymentRecord
 from seslib.log import Log
 from seslib.settings import Settings
 
@@ -48,7 +48,7 @@ def box_remove_handler(box_name, **kwargs):
             click.echo()
     #
     # remove the boxes
-    deps = Deployment.list(True)
+    deps = DeploymentRecord.list()
     problems_encountered = False
     boxes_removed_count = 0
     for box_being_removed in boxes_to_remove:
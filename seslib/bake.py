@@ -0,0 +1,73 @@
+import json
+import os
+
+from .constant import Constant
+from .lock import atomic_write
+from .log import Log
+
+
+class BakedImages():
+    """
+    The base images made by "sesdev bake", recorded in a JSON file in the
+    sesdev working directory. Each record names the storage volume holding the
+    image, the template sections of the provisioning script that are already
+    done in it, and a fingerprint of the repos it was made with: an image is
+    only used for a new deployment with the same fingerprint.
+    """
+
+    # the sections of the provisioning script an image can have done (see
+    # zypper.j2 and bake.sh.j2)
+    SECTIONS = ['zypper-config', 'repos', 'base-packages', 'salt-minion', 'ceph-packages']
+
+    # installed in advance for deployments that run cephadm
+    CEPH_PACKAGES = ['podman', 'cephadm', 'ceph-common']
+
+    def __init__(self, path=None):
+        self.path = path if path else \
+            os.path.join(Constant.A_WORKING_DIR, Constant.BAKED_IMAGES_FILENAME)
+
+    @staticmethod
+    def volume_name(version, os_name, timestamp):
+        return 'sesdev-baked-{}-{}-{}.qcow2'.format(version, os_name, timestamp)
+
+    def load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return []
+
+    def _write(self, images):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        atomic_write(self.path, json.dumps(images, indent=4, sort_keys=True), mode=0o600)
+
+    def find(self, uri, pool, version, os_name):
+        """
+        Return the record of the image baked for "version" on "os_name" in
+        storage pool "pool" of libvirt host "uri", or None
+        """
+        for image in self.load():
+            if (image['uri'], image['pool'], image['version'], image['os']) == \
+                    (uri, pool, version, os_name):
+                return image
+        return None
+
+    def record(self, image):
+        """
+        Record "image" (a dict), replacing the record of the image baked
+        earlier for the same version, OS and storage pool. Returns the replaced
+        record, or None.
+        """
+        images = self.load()
+        key = (image['uri'], image['pool'], image['version'], image['os'])
+        replaced = None
+        for old_image in images:
+            if (old_image['uri'], old_image['pool'], old_image['version'],
+                    old_image['os']) == key:
+                replaced = old_image
+        if replaced:
+            images.remove(replaced)
+        images.append(image)
+        self._write(images)
+        Log.info("Recorded baked image {} in {}".format(image['volume'], self.path))
+        return replaced
@@ -1,16 +1,46 @@
 import fnmatch
 import os
-from xml.dom import minidom
+import re
+import threading
 import libvirt
 
 from . import tools
 from .constant import Constant
+from .inventory import LibvirtInventory
 from .log import Log
 from .tools import is_a_glob
 
 
 class Box():
     # pylint: disable=no-member
+
+    # Parsed "vagrant box list" output, shared by all Box instances in the
+    # process. Running "vagrant box list" costs a Ruby startup, so it is run at
+    # most once per change of the Vagrant boxes directory.
+    _inventory = None
+    _inventory_mtime = None
+    _inventory_lock = threading.Lock()
+
+    # libvirt connections, shared by all Box instances in the process and keyed
+    # by URI. Opening a qemu+ssh connection costs an SSH handshake.
+    _connections = {}
+    _connections_lock = threading.Lock()
+    _event_loop_started = False
+    # callbacks to call with the new connection when the one to a URI, found
+    # dead, is re-opened (see add_reconnect_callback())
+    _reconnect_callbacks = {}
+
+    # libvirt domain states mapped to the node statuses "vagrant status" yields
+    _DOMAIN_STATUS = {
+        libvirt.VIR_DOMAIN_RUNNING: 'running',
+        libvirt.VIR_DOMAIN_BLOCKED: 'running',
+        libvirt.VIR_DOMAIN_SHUTDOWN: 'running',
+        libvirt.VIR_DOMAIN_PAUSED: 'suspended',
+        libvirt.VIR_DOMAIN_PMSUSPENDED: 'suspended',
+        libvirt.VIR_DOMAIN_SHUTOFF: 'stopped',
+        libvirt.VIR_DOMAIN_CRASHED: 'stopped',
+    }
+
     def __init__(self, settings):
         self.libvirt_use_ssh = settings.libvirt_use_ssh
         self.libvirt_private_key_file = settings.libvirt_private_key_file
@@ -22,55 +52,217 @@ class Box():
         self.libvirt_conn = None
         self.libvirt_uri = None
         self.pool = None
+        self._libvirt_inventory = None
         self.all_possible_boxes = list(settings.os_box.keys()) + \
             list(Constant.OS_ALIASED_BOXES.keys())
         self._populate_box_list()
 
-    def _build_libvirt_uri(self):
+    @staticmethod
+    def libvirt_private_key_path(settings):
+        """
+        The path of the libvirt_private_key_file setting, where a bare file
+        name is one in ~/.ssh (None if not set)
+        """
+        private_key_file = settings.libvirt_private_key_file
+        if private_key_file and '/' not in private_key_file:
+            private_key_file = os.path.join(os.path.expanduser('~'), '.ssh', private_key_file)
+        return private_key_file or None
+
+    @staticmethod
+    def libvirt_uri_from_settings(settings):
         uri = None
-        if self.libvirt_use_ssh:
+        if settings.libvirt_use_ssh:
             uri = 'qemu+ssh://'
-            if self.libvirt_user:
-                uri += "{}@".format(self.libvirt_user)
-            assert self.libvirt_host, "Cannot use qemu+ssh without a host"
-            uri += "{}/system".format(self.libvirt_host)
-            if self.libvirt_private_key_file:
-                if '/' not in self.libvirt_private_key_file:
-                    self.libvirt_private_key_file = os.path.join(
-                        os.path.expanduser('~'),
-                        '.ssh',
-                        self.libvirt_private_key_file
-                    )
-                uri += '?keyfile={}'.format(self.libvirt_private_key_file)
+            if settings.libvirt_user:
+                uri += "{}@".format(settings.libvirt_user)
+            assert settings.libvirt_host, "Cannot use qemu+ssh without a host"
+            uri += "{}/system".format(settings.libvirt_host)
+            private_key_file = Box.libvirt_private_key_path(settings)
+            if private_key_file:
+                uri += '?keyfile={}'.format(private_key_file)
         else:
             uri = 'qemu:///system'
-        self.libvirt_uri = uri
+        return uri
+
+    def _build_libvirt_uri(self):
+        self.libvirt_uri = self.libvirt_uri_from_settings(self)
+
+    @staticmethod
+    def _run_event_loop():
+        while True:
+            libvirt.virEventRunDefaultImpl()
+
+    @classmethod
+    def _start_event_loop(cls):
+        """
+        Register the default libvirt event loop implementation, which has to be
+        done before opening the connections to get domain events from, and run
+        it on a thread of its own
+        """
+        if cls._event_loop_started:
+            return
+        libvirt.virEventRegisterDefaultImpl()
+        threading.Thread(target=cls._run_event_loop, name='libvirt-events', daemon=True).start()
+        cls._event_loop_started = True
+
+    @staticmethod
+    def libvirt_connection_alive(conn):
+        try:
+            return bool(conn.isAlive())
+        except libvirt.libvirtError:
+            return False
+
+    @classmethod
+    def libvirt_connection(cls, uri):
+        """
+        Return the process-wide libvirt connection to "uri", opening it if
+        necessary, or re-opening it if it died (e.g. the libvirt daemon was
+        restarted, or the SSH connection to the libvirt host dropped)
+        """
+        callbacks = []
+        with cls._connections_lock:
+            conn = cls._connections.get(uri)
+            if conn is not None and not cls.libvirt_connection_alive(conn):
+                Log.warning("The libvirt connection to ->{}<- is dead, re-opening it"
+                            .format(uri))
+                callbacks = list(cls._reconnect_callbacks.get(uri, []))
+                conn = None
+            if conn is None:
+                cls._start_event_loop()
+                Log.debug("Opening libvirt connection to ->{}<-".format(uri))
+                conn = libvirt.open(uri)
+                cls._connections[uri] = conn
+        # outside the lock, as the callbacks may well get the connection again
+        for callback in callbacks:
+            callback(conn)
+        return conn
+
+    @classmethod
+    def add_reconnect_callback(cls, uri, callback):
+        """
+        Have libvirt_connection() call "callback" with the new connection to
+        "uri" whenever it re-opens it, e.g. to register event callbacks anew
+        """
+        with cls._connections_lock:
+            cls._reconnect_callbacks.setdefault(uri, []).append(callback)
+
+    @classmethod
+    def remove_reconnect_callback(cls, uri, callback):
+        with cls._connections_lock:
+            cls._reconnect_callbacks[uri].remove(callback)
+
+    @classmethod
+    def domain_states(cls, uri):
+        """
+        Return a dict mapping the name and the UUID of every domain on the
+        libvirt host to the corresponding node status ("running", "stopped",
+        "suspended" or "saved", the latter for a domain shut off by "sesdev
+        stop --suspend"; None if libvirt does not know). The domain states of
+        the whole host are fetched in a single libvirt call.
+        """
+        conn = cls.libvirt_connection(uri)
+        states = {}
+        for (domain, stats) in conn.getAllDomainStats(libvirt.VIR_DOMAIN_STATS_STATE):
+            status = cls._DOMAIN_STATUS.get(stats.get('state.state'))
+            if stats.get('state.state') == libvirt.VIR_DOMAIN_SHUTOFF and \
+                    stats.get('state.reason') == libvirt.VIR_DOMAIN_SHUTOFF_SAVED:
+                status = 'saved'
+            states[domain.name()] = status
+            states[domain.UUIDString()] = status
+        return states
+
+    @staticmethod
+    def _parse_box_list(output):
+        """
+        Parse the output of "vagrant box list" into a list of
+        (box_name, provider, version) tuples
+        """
+        inventory = []
+        for line in output.split('\n'):
+            box_match = re.match(r'^(\S+)\s+\(([^,)]+)(?:,\s*([^)]+))?\)', line.strip())
+            if box_match:
+                inventory.append((box_match[1], box_match[2].strip(), box_match[3]))
+        return inventory
+
+    @staticmethod
+    def _boxes_dir_mtime():
+        try:
+            return os.stat(Constant.VAGRANT_BOXES_DIR).st_mtime_ns
+        except OSError:
+            return None
+
+    @classmethod
+    def inventory(cls):
+        """
+        Return the (cached) list of installed Vagrant Boxes as
+        (box_name, provider, version) tuples. The cache is invalidated whenever
+        the mtime of the Vagrant boxes directory changes.
+        """
+        with cls._inventory_lock:
+            mtime = cls._boxes_dir_mtime()
+            if cls._inventory is None or mtime != cls._inventory_mtime:
+                Log.debug("Box.inventory: (re)reading output of \"vagrant box list\"")
+                output = tools.run_sync(["vagrant", "box", "list"])
+                cls._inventory = cls._parse_box_list(output)
+                cls._inventory_mtime = mtime
+            return list(cls._inventory)
+
+    @classmethod
+    def invalidate_inventory(cls):
+        with cls._inventory_lock:
+            cls._inventory = None
+            cls._inventory_mtime = None
+
+    @classmethod
+    def box_image(cls, box_name):
+        """
+        Return (version, path) of the disk image of the most recently listed
+        version of libvirt Vagrant Box "box_name", or None if there is none
+        """
+        versions = [version for (name, provider, version) in cls.inventory()
+                    if name == box_name and provider == 'libvirt']
+        if not versions:
+            return None
+        version = versions[-1] if versions[-1] else '0'
+        version_dir = os.path.join(Constant.VAGRANT_BOXES_DIR,
+                                   box_name.replace('/', '-VAGRANTSLASH-'),
+                                   version)
+        for (dirpath, _, filenames) in os.walk(version_dir):
+            if os.path.basename(dirpath) != 'libvirt':
+                continue
+            for image in ['box.img', 'box_0.img']:
+                if image in filenames:
+                    return (version, os.path.join(dirpath, image))
+        return None
 
     def _populate_box_list(self):
         self.boxes = []
-        cmd = ["vagrant", "box", "list"]
-        output = tools.run_sync(cmd)
-        lines = output.split('\n')
-        for line in lines:
-            if 'libvirt' in line:
-                box_name = line.split()[0]
-                if box_name in self.all_possible_boxes:
+        for (box_name, provider, _) in self.inventory():
+            if provider == 'libvirt' and box_name in self.all_possible_boxes:
+                if box_name not in self.boxes:
                     self.boxes.append(box_name)
 
     def exists(self, box_name):
+        self._populate_box_list()
         return box_name in self.boxes
 
+    def libvirt_inventory(self, refresh=False):
+        """
+        The LibvirtInventory of the storage pool, taken on first use and kept
+        until "refresh" is set or an image is removed
+        """
+        if self._libvirt_inventory is None or refresh:
+            self.open_libvirt_connection()
+            self._libvirt_inventory = LibvirtInventory(self.libvirt_conn,
+                                                       self.libvirt_storage_pool)
+            self.pool = self._libvirt_inventory.pool
+        return self._libvirt_inventory
+
     def get_image_by_box(self, box_name):
-        #
-        # open connection to libvirt server
-        self.open_libvirt_connection()
         #
         # verify that the corresponding image exists in libvirt storage pool
-        self.pool = self.libvirt_conn.storagePoolLookupByName(self.libvirt_storage_pool)
-        removal_candidates = []
-        for removal_candidate in self.pool.listVolumes():
-            if str(removal_candidate).startswith('{}_vagrant_box_image'.format(box_name)):
-                removal_candidates.append(removal_candidate)
+        removal_candidates = [volume.name() for volume in
+                              self.libvirt_inventory().box_images(box_name)]
         if len(removal_candidates) == 0:
             return None
         if len(removal_candidates) == 1:
@@ -90,39 +282,12 @@ class Box():
         return None
 
     def get_images_by_deployment(self, dep_id):
-        self.open_libvirt_connection()
-        self.pool = self.libvirt_conn.storagePoolLookupByName(self.libvirt_storage_pool)
-        matching_images = []
-        for removal_candidate in self.pool.listVolumes():
-            if str(matching_images).startswith(dep_id):
-                matching_images.append(removal_candidate)
-        return matching_images
+        return [volume.name() for volume in self.libvirt_inventory().volumes(dep_id)]
 
     def get_networks_by_deployment(self, dep_id):
-        self.open_libvirt_connection()
-        domains = [x for x in self.libvirt_conn.listAllDomains() if
-                   x.name().startswith(dep_id)]
-
-        Log.debug("libvirt matching domains: {}".format(domains))
-
-        networks = set()
-        for domain in domains:
-            xml = minidom.parseString(domain.XMLDesc())
-            sources_lst = xml.getElementsByTagName("source")
-
-            ifaces = [source for source in sources_lst if
-                      source.parentNode.nodeName == "interface" and
-                      source.parentNode.hasAttribute("type") and
-                      source.parentNode.getAttribute("type") == "network"]
-
-            Log.debug("libvirt domain's interfaces: {}".format(ifaces))
-
-            for iface in ifaces:
-                name = iface.getAttribute("network")
-                if name == "vagrant-libvirt":
-                    continue
-                networks.add(name)
-        return list(networks)
+        networks = self.libvirt_inventory().networks(dep_id, exclude=['vagrant-libvirt'])
+        Log.debug("libvirt networks of deployment {}: {}".format(dep_id, networks))
+        return networks
 
     @staticmethod
     def dehumanize_box_name(box_name):
@@ -165,12 +330,9 @@ class Box():
         return matching_boxes
 
     def open_libvirt_connection(self):
-        if self.libvirt_conn:
-            return None
+        # fetched every time, as libvirt_connection() re-opens a dead one
         self._build_libvirt_uri()
-        # print("Opening libvirt connection to ->{}<-".format(self.libvirt_uri))
-        self.libvirt_conn = libvirt.open(self.libvirt_uri)
-        return None
+        self.libvirt_conn = self.libvirt_connection(self.libvirt_uri)
 
     def printable_list(self, **kwargs):
         box_list = []
@@ -191,12 +353,14 @@ class Box():
         return box_list
 
     def remove_image(self, image_name):
-        image = self.pool.storageVolLookupByName(image_name)
+        image = self.libvirt_inventory().pool.storageVolLookupByName(image_name)
         image.delete()
+        self._libvirt_inventory = None
 
-    @staticmethod
-    def remove_box(box_name):
+    @classmethod
+    def remove_box(cls, box_name):
         tools.run_sync(["vagrant", "box", "remove", box_name])
+        cls.invalidate_inventory()
 
     def destroy_network(self, name):
         self.open_libvirt_connection()
@@ -0,0 +1,179 @@
+import json
+import os
+import time
+
+from contextlib import contextmanager
+
+import libvirt
+
+from . import tools
+from .constant import Constant
+from .exceptions import HostCapacityExceeded
+from .lock import atomic_write, file_lock, global_lock
+from .log import Log
+
+
+class HostCapacity():
+    """
+    What a libvirt host has left for new deployments: RAM (MiB) and vCPUs,
+    after the VMs running on it, and storage pool space (GiB). The RAM left is
+    the smaller of what the running VMs have not been given and what is
+    actually free, less HOST_RAM_RESERVE_IN_MB for the host itself; each host
+    CPU takes VCPU_OVERCOMMIT_RATIO vCPUs. VMs that are shut off or saved to
+    disk take no RAM or vCPUs. "total" is what the host would have with
+    nothing running. "active" maps the name of each running VM to the RAM
+    and vCPUs it takes.
+    """
+
+    UNITS = {'ram': 'MiB of RAM', 'cpus': 'vCPUs', 'disk': 'GiB of storage pool space'}
+
+    def __init__(self, conn, pool_name):
+        (_, ram, cpus) = conn.getInfo()[:3]
+        self.active = {}
+        for domain in conn.listAllDomains(libvirt.VIR_CONNECT_LIST_DOMAINS_ACTIVE):
+            (_, max_memory, _, vcpus, _) = domain.info()
+            self.active[domain.name()] = {'ram': max_memory // 2**10, 'cpus': vcpus}
+        committed_ram = sum(taken['ram'] for taken in self.active.values())
+        committed_cpus = sum(taken['cpus'] for taken in self.active.values())
+        pool = conn.storagePoolLookupByName(pool_name)
+        pool.refresh(0)
+        (_, pool_capacity, _, pool_available) = pool.info()
+        self.total = {
+            'ram': ram - Constant.HOST_RAM_RESERVE_IN_MB,
+            'cpus': cpus * Constant.VCPU_OVERCOMMIT_RATIO,
+            'disk': pool_capacity // 2**30,
+        }
+        self.left = {
+            'ram': min(ram - committed_ram, conn.getFreeMemory() // 2**20)
+            - Constant.HOST_RAM_RESERVE_IN_MB,
+            'cpus': self.total['cpus'] - committed_cpus,
+            'disk': pool_available // 2**30,
+        }
+        Log.debug("HostCapacity: left: {}".format(self.left))
+
+    def pending(self, dep_id, request):
+        """
+        Return what of "request" (a dict like "left") of deployment "dep_id"
+        is not taken yet by its running VMs, and so not accounted for in "left"
+        """
+        prefix = '{}_'.format(dep_id)
+        running = [taken for (name, taken) in self.active.items() if name.startswith(prefix)]
+        pending = dict(request)
+        for resource in ['ram', 'cpus']:
+            taken = sum(domain[resource] for domain in running)
+            pending[resource] = max(request[resource] - taken, 0)
+        return pending
+
+    def shortfall(self, request, admitted=(), total=False):
+        """
+        Return what the host lacks for "request" (a dict like "left") on top of
+        the already "admitted" ones (or, with "total", at all), as a message,
+        or None if it all fits
+        """
+        missing = []
+        for (resource, unit) in self.UNITS.items():
+            left = self.total[resource] if total else \
+                self.left[resource] - sum(other[resource] for other in admitted)
+            if request[resource] > left:
+                missing.append("needs {} {}, {} left"
+                               .format(request[resource], unit, max(left, 0)))
+        return '; '.join(missing) if missing else None
+
+
+class AdmissionQueue():
+    """
+    The queue of sesdev processes waiting for a libvirt host to have the
+    capacity (see HostCapacity) for the deployments they are about to bring
+    up. Each waiting process has a ticket, a file named after its arrival time
+    in the queue directory; the oldest one on a host is admitted as soon as its
+    deployment fits, first come first served, and then the resources of its
+    VMs that are not running yet count as taken (see HostCapacity.pending()),
+    until it is done bringing it up. The queue
+    is only ever looked at and changed under the global lock (see lock.py).
+    """
+
+    def __init__(self, path=None):
+        if path:
+            self.path = path
+            self._lock = lambda: file_lock('{}.lock'.format(path))
+        else:
+            self.path = os.path.join(Constant.A_WORKING_DIR, Constant.QUEUE_DIRNAME)
+            self._lock = global_lock
+
+    def _tickets(self, uri):
+        tickets = []
+        for name in sorted(os.listdir(self.path)):
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.path, name), 'r', encoding='utf-8') as file:
+                    ticket = json.load(file)
+            except FileNotFoundError:
+                continue
+            if not tools.process_alive(ticket['pid']):
+                Log.debug("AdmissionQueue: dropping stale ticket {}".format(name))
+                os.unlink(os.path.join(self.path, name))
+                continue
+            if ticket['uri'] == uri:
+                tickets.append((name, ticket))
+        return tickets
+
+    def _try_admit(self, name, uri, capacity):
+        """
+        Admit ticket "name" if it is first in line and fits. Returns None if it
+        was admitted, or else why it was not. Raises HostCapacityExceeded if it
+        would not even fit on the idle host.
+        """
+        with self._lock():
+            tickets = self._tickets(uri)
+            ahead = [ticket for (other, ticket) in tickets
+                     if other < name and not ticket['admitted']]
+            if ahead:
+                return "{} deployment(s) ahead in the queue".format(len(ahead))
+            ticket = dict(tickets)[name]
+            host = capacity()
+            shortfall = host.shortfall(ticket['request'], total=True)
+            if shortfall:
+                raise HostCapacityExceeded(ticket['dep_id'], uri, shortfall)
+            # the VMs of admitted deployments that are up already count as taken
+            admitted = [host.pending(other['dep_id'], other['request'])
+                        for (_, other) in tickets if other['admitted']]
+            shortfall = host.shortfall(ticket['request'], admitted)
+            if shortfall:
+                return shortfall
+            ticket['admitted'] = True
+            atomic_write(os.path.join(self.path, name), json.dumps(ticket))
+            return None
+
+    @contextmanager
+    def admitted(self, dep_id, uri, request, capacity, *, wait=True, log_handler=None):
+        """
+        Queue up deployment "dep_id" with "request" (a dict like
+        HostCapacity.left) for libvirt host "uri", and wait until it is
+        admitted; "capacity" returns the HostCapacity of the host. Without
+        "wait", raise HostCapacityExceeded unless it is admitted right away.
+        The ticket is given back when the "with" block is left.
+        """
+        os.makedirs(self.path, exist_ok=True)
+        name = '{:020d}-{}-{}.json'.format(time.time_ns(), os.getpid(), dep_id)
+        atomic_write(os.path.join(self.path, name), json.dumps({
+            'dep_id': dep_id, 'pid': os.getpid(), 'uri': uri, 'request': request,
+            'admitted': False,
+        }))
+        try:
+            reported = None
+            while True:
+                reason = self._try_admit(name, uri, capacity)
+                if reason is None:
+                    break
+                if not wait:
+                    raise HostCapacityExceeded(dep_id, uri, reason)
+                if reason != reported and log_handler:
+                    log_handler("Waiting for libvirt host {} to take deployment {}: {}\n"
+                                .format(uri, dep_id, reason))
+                reported = reason
+                time.sleep(Constant.ADMISSION_POLL_INTERVAL_IN_SECONDS)
+            Log.info("AdmissionQueue: deployment {} admitted to {}".format(dep_id, uri))
+            yield
+        finally:
+            os.unlink(os.path.join(self.path, name))
@@ -8,6 +8,11 @@ class Constant():
 
     A_WORKING_DIR = os.path.join(Path.home(), '.sesdev')
 
+    # how often a "sesdev create" queued for host capacity checks again
+    ADMISSION_POLL_INTERVAL_IN_SECONDS = 30
+
+    BAKED_IMAGES_FILENAME = 'baked-images.json'
+
     CEPH_SALT_REPO = 'https://github.com/ceph/ceph-salt'
 
     CEPH_SALT_BRANCH = 'master'
@@ -35,6 +40,9 @@ class Constant():
         },
     }
 
+    # RAM of a libvirt host that new deployments are not admitted to
+    HOST_RAM_RESERVE_IN_MB = 2048
+
     IMAGE_PATHS_DEVEL = {
         'ses7': {
             'ceph': 'registry.suse.de/devel/storage/7.0/containers/ses/7/ceph/ceph',
@@ -126,6 +134,10 @@ class Constant():
         },
     }
 
+    # maximum number of worker threads for operations run concurrently on
+    # several deployments (or nodes)
+    JOBS = min(32, (os.cpu_count() or 1) + 4)
+
     JINJA_ENV = Environment(loader=PackageLoader('seslib', 'templates'), trim_blocks=True)
 
     LOGFILE = None
@@ -204,6 +216,9 @@ class Constant():
         },
     }
 
+    # per-deployment and global lock files, inside A_WORKING_DIR
+    LOCKS_DIRNAME = '.locks'
+
     METADATA_FILENAME = ".metadata"
 
     OPENSUSE_REPOS = {
@@ -406,6 +421,12 @@ class Constant():
         },
     }
 
+    # the sizes, settings and refill logs of the "sesdev pool" pools, inside A_WORKING_DIR
+    POOLS_DIRNAME = '.pools'
+
+    # the queue of "sesdev create" runs waiting for host capacity, inside A_WORKING_DIR
+    QUEUE_DIRNAME = '.queue'
+
     REASONABLE_TIMEOUT_IN_SECONDS = 3200
 
     ROLES_DEFAULT = {
@@ -476,10 +497,43 @@ class Constant():
                    "prometheus, grafana, alertmanager, node-exporter ]",
     }
 
+    SSH_CONFIG_CACHE_FILENAME = '.ssh_config.json'
+
+    # Unix socket paths are limited to 107 characters, and ssh appends a
+    # 17-character suffix while setting up a ControlMaster socket. Leave room
+    # for socket names of up to 40 characters.
+    SSH_CONTROL_DIR_MAX_LENGTH = 50
+
     SSH_KEY_NAME = 'sesdev'  # do NOT use 'id_rsa'
 
+    # how many times (one per second) the libvirt-native VM engine tries to
+    # connect to a node that is booting
+    SSH_BOOT_CONNECTION_ATTEMPTS = 300
+
+    # how long to wait for a node that is booting or resuming to answer over SSH
+    SSH_READY_TIMEOUT_IN_SECONDS = 300
+
+    STATE_DB_FILENAME = 'state.db'
+
+    SUBNETS_FILENAME = 'subnets.json'
+
+    VAGRANT_BOXES_DIR = os.path.join(
+        os.environ.get('VAGRANT_HOME', os.path.join(Path.home(), '.vagrant.d')),
+        'boxes'
+    )
+
+    # the key the Vagrant boxes authorize for the "vagrant" user; the
+    # libvirt-native VM engine uses it to reach nodes that are not provisioned
+    VAGRANT_INSECURE_PRIVATE_KEY = os.path.join(
+        os.environ.get('VAGRANT_HOME', os.path.join(Path.home(), '.vagrant.d')),
+        'insecure_private_key'
+    )
+
     VAGRANT_DEBUG = None
 
+    # vCPUs of running VMs admitted per host CPU
+    VCPU_OVERCOMMIT_RATIO = 4
+
     VERBOSE = None
 
     VERSION_DEVEL_REPOS = {
@@ -1,9 +1,13 @@
+import contextlib
+import hashlib
 import inspect
 import json
 import os
-import random
 import re
 import shutil
+import subprocess
+import tempfile
+import threading
 import time
 
 try:
@@ -12,28 +16,38 @@ except ImportError:
     pass
 
 from Cryptodome.PublicKey import RSA
+import libvirt
 
 from . import tools
+from .bake import BakedImages
 from .box import Box
+from .capacity import AdmissionQueue, HostCapacity
 from .constant import Constant
+from .domains import DeploymentDomains
 from .exceptions import \
                         BadMakeCheckRolesNodes, \
                         CmdException, \
+                        CommandsFailed, \
                         DeploymentAlreadyExists, \
                         DeploymentDoesNotExists, \
+                        DeploymentHasClones, \
                         DeploymentIncompatible, \
+                        DeploymentNotClonable, \
                         DepIDWrongLength, \
                         DepIDIllegalChars, \
                         DuplicateRolesNotSupported, \
                         ExclusiveRoles, \
+                        ImageBakingNotSupported, \
                         MultipleRolesPerMachineNotAllowedInCaaSP, \
                         NodeDoesNotExist, \
                         NodeMustBeAdminAsWell, \
+                        NodesNotReady, \
                         NoGaneshaRolePostNautilus, \
                         NoSourcePortForPortForwarding, \
                         NoStorageRolesDeepsea, \
                         NoStorageRolesCephadm, \
                         NoSupportConfigTarballFound, \
+                        OptionNotSupportedInContext, \
                         ProductOptionOnlyOnSES, \
                         RebootDidNotSucceed, \
                         RoleNotKnown, \
@@ -41,6 +55,7 @@ from .exceptions import \
                         ScpInvalidSourceOrDestination, \
                         ServiceNotFound, \
                         ServicePortForwardingNotSupported, \
+                        SesDevException, \
                         SubcommandNotSupportedInVersion, \
                         SupportconfigOnlyOnSLE, \
                         VagrantSshConfigNoHostName, \
@@ -48,9 +63,16 @@ from .exceptions import \
                         UniqueRoleViolation, \
                         UnsupportedVMEngine, \
                         UpgradeNotSupported
+from .libvirt_engine import LibvirtEngine
+from .lock import DeploymentLock, atomic_write, global_lock, locked
 from .log import Log
+from .managed_save import ManagedSave
 from .node import Node, NodeManager
 from .settings import Settings, SettingsEncoder
+from .snapshot import DeploymentSnapshots
+from .state import StateStore
+from .subnets import SubnetAllocator
+from .teardown import LibvirtTeardown
 from .zypper import ZypperRepo, ZypperPackage
 
 
@@ -59,6 +81,23 @@ class Disk():
         self.size = size
 
 
+class NodeResult():
+    """
+    Outcome of the chain of commands Deployment.for_each_node() ran on a node
+    """
+    def __init__(self, node, results):
+        self.node = node
+        self.results = results  # tools.CommandResult of each command that ran
+
+    @property
+    def ok(self):
+        return all(result.returncode == 0 for result in self.results)
+
+    @property
+    def output(self):
+        return ''.join(result.output for result in self.results)
+
+
 def _vet_dep_id(dep_id):
     # from hostname(7) - Linux manual page
     #
@@ -79,6 +118,223 @@ def _vet_dep_id(dep_id):
     return dep_id
 
 
+def _node_layout(settings, domain):
+    """
+    Derive the name, FQDN, roles and addresses of each node from the settings of
+    a deployment. Returns a list of (name, fqdn, roles, public_address,
+    cluster_address) tuples, one per node. This is shared by Deployment and
+    DeploymentRecord, so it must stay cheap: no subprocesses, no libvirt.
+    """
+    layout = []
+    node_id = 0
+    worker_id = 0
+    loadbl_id = 0
+    nfs_id = 0
+    for node_roles in settings.roles:  # loop once for every node in cluster
+        if settings.version == 'caasp4':
+            if 'master' in node_roles:
+                node_id += 1
+                name = 'master'
+            elif 'worker' in node_roles:
+                worker_id += 1
+                node_id += 1
+                name = 'worker{}'.format(worker_id)
+            elif 'loadbalancer' in node_roles:
+                loadbl_id += 1
+                node_id += 1
+                name = 'loadbl{}'.format(loadbl_id)
+            elif 'nfs' in node_roles:
+                nfs_id += 1
+                node_id += 1
+                name = 'nfs{}'.format(nfs_id)
+            else:
+                node_id += 1
+                name = 'node{}'.format(node_id)
+        else:
+            if 'master' in node_roles or 'suma' in node_roles or 'makecheck' in node_roles:
+                name = 'master'
+            else:
+                node_id += 1
+                name = 'node{}'.format(node_id)
+        fqdn = '{}.{}'.format(name, domain)
+
+        public_address = None
+        if not settings.libvirt_networks:
+            if 'master' in node_roles or 'suma' in node_roles:
+                public_address = '{}{}'.format(settings.public_network, 200)
+            else:
+                public_address = '{}{}'.format(settings.public_network, 200 + node_id)
+
+        cluster_address = None
+        if settings.version in Constant.CORE_VERSIONS and 'storage' in node_roles \
+                and settings.cluster_network:
+            cluster_address = '{}{}'.format(settings.cluster_network, 200 + node_id)
+
+        layout.append((name, fqdn, node_roles, public_address, cluster_address))
+    return layout
+
+
+def _deployment_ids():
+    """
+    Return the IDs of all (apparent) deployments in the working directory
+    """
+    dep_ids = []
+    if not os.path.exists(Constant.A_WORKING_DIR):
+        return dep_ids
+    dir_listing = os.listdir(Constant.A_WORKING_DIR)
+    Log.debug("Listing of directory {}: {}".format(
+        Constant.A_WORKING_DIR,
+        dir_listing))
+    for dep_id in dir_listing:
+        Log.debug("Considering deployment ->{}<-".format(dep_id))
+        full_path = os.path.join(Constant.A_WORKING_DIR, dep_id)
+        if dep_id.startswith('.') or not os.path.isdir(full_path):
+            Log.debug("Skipping ->{}<- (obviously not a deployment)".format(dep_id))
+            continue
+        dep_ids.append(dep_id)
+    return dep_ids
+
+
+def _state_store():
+    """
+    Return the StateStore, building the index from the directory tree first if
+    it does not exist yet
+    """
+    store = StateStore()
+    if not store.exists():
+        with global_lock():
+            if not store.exists():
+                Log.debug("State index {} not found: building it".format(store.path))
+                DeploymentRecord.reindex(store)
+    return store
+
+
+def _read_metadata(dep_id):
+    dep_dir = os.path.join(Constant.A_WORKING_DIR, dep_id)
+    if not os.path.exists(dep_dir) or not os.path.isdir(dep_dir):
+        Log.debug("->{}<- does not exist or is not a directory"
+                  .format(dep_dir))
+        raise DeploymentDoesNotExists(dep_id)
+
+    metadata_file = os.path.join(dep_dir, Constant.METADATA_FILENAME)
+    if not os.path.exists(metadata_file) or not os.path.isfile(metadata_file):
+        Log.debug("metadata file ->{}<- does not exist or is not a file"
+                  .format(metadata_file))
+        raise DeploymentDoesNotExists(dep_id)
+    try:
+        with open(metadata_file, 'r', encoding='utf-8') as file:
+            return json.load(file)
+    except FileNotFoundError as error:
+        # destroyed meanwhile
+        raise DeploymentDoesNotExists(dep_id) from error
+
+
+def _load_vagrant_status(dep_dir, nodes):
+    """
+    Set the status attribute of each Node object in the "nodes" dict based on
+    the output of "vagrant status"
+    """
+    if not os.path.exists(os.path.join(dep_dir, '.vagrant')):
+        for node in nodes.values():
+            node.status = "not deployed"
+        return
+
+    cmd = ['vagrant', 'status']
+    out = tools.run_sync(cmd, cwd=dep_dir)
+    for line in [line.strip() for line in out.split('\n')]:
+        if line:
+            line_arr = line.split(' ', 1)
+            if line_arr[0] in nodes:
+                if line_arr[1].strip().startswith("running"):
+                    nodes[line_arr[0]].status = "running"
+                elif line_arr[1].strip().startswith("not created"):
+                    nodes[line_arr[0]].status = "not deployed"
+                elif line_arr[1].strip().startswith("shutoff"):
+                    nodes[line_arr[0]].status = "stopped"
+                elif line_arr[1].strip().startswith("paused"):
+                    nodes[line_arr[0]].status = "suspended"
+
+
+# serializes fetching Box.domain_states() snapshots in _load_status(), so that
+# concurrent callers sharing a dict of snapshots query each host only once
+_DOMAIN_STATES_LOCK = threading.Lock()
+
+
+def _libvirt_node_statuses(dep_id, dep_dir, node_names, domain_states):
+    """
+    Map the nodes of a deployment to their statuses, given a Box.domain_states()
+    snapshot of the libvirt host. Vagrant records the UUID of the domain of each
+    node it created under .vagrant; a node without one is not deployed. Returns
+    a dict mapping node name to status, or None if the mapping is ambiguous.
+    """
+    statuses = {}
+    for name in node_names:
+        id_file = os.path.join(dep_dir, '.vagrant', 'machines', name, 'libvirt', 'id')
+        try:
+            with open(id_file, 'r', encoding='utf-8') as file:
+                uuid = file.read().strip()
+        except FileNotFoundError:
+            uuid = None
+        except OSError as error:
+            Log.debug("Cannot read {}: {}".format(id_file, error))
+            return None
+        if not uuid:
+            statuses[name] = "not deployed"
+        elif uuid in domain_states:
+            if domain_states[uuid] is None:
+                return None
+            statuses[name] = domain_states[uuid]
+        elif '{}_{}'.format(dep_id, name) in domain_states:
+            # the domain Vagrant knows about is gone, but there is another one
+            # by the same name
+            return None
+        else:
+            statuses[name] = "not deployed"
+    return statuses
+
+
+def _load_status(dep_id, dep_dir, settings, nodes, domain_states=None):
+    """
+    Set the status attribute of each Node object in the "nodes" dict, from
+    libvirt if possible and from "vagrant status" otherwise. "domain_states" is
+    a dict of Box.domain_states() snapshots keyed by libvirt URI; pass the same
+    dict when loading the status of several deployments to query each libvirt
+    host only once.
+    """
+    native = settings.vm_engine == 'libvirt-native'
+    if not native and not os.path.exists(os.path.join(dep_dir, '.vagrant')):
+        for node in nodes.values():
+            node.status = "not deployed"
+        return
+
+    if domain_states is None:
+        domain_states = {}
+    uri = Box.libvirt_uri_from_settings(settings)
+    with _DOMAIN_STATES_LOCK:
+        if uri not in domain_states:
+            try:
+                domain_states[uri] = Box.domain_states(uri)
+            except libvirt.libvirtError as error:
+                Log.debug("Cannot get domain states from {}: {}".format(uri, error))
+                domain_states[uri] = None
+
+    statuses = None
+    if native:
+        # there is no "vagrant status" to fall back to
+        if domain_states[uri] is None:
+            statuses = {name: "unknown" for name in nodes}
+        else:
+            statuses = LibvirtEngine(dep_id, dep_dir, settings, nodes).statuses(domain_states[uri])
+    elif domain_states[uri] is not None:
+        statuses = _libvirt_node_statuses(dep_id, dep_dir, nodes, domain_states[uri])
+    if statuses is None:
+        Log.debug("Falling back to \"vagrant status\" for deployment {}".format(dep_id))
+        _load_vagrant_status(dep_dir, nodes)
+        return
+    for name, status in statuses.items():
+        nodes[name].status = status
+
+
 class Deployment():  # use Deployment.create() to create a Deployment object
 
     def __init__(self, dep_id, settings, existing=False):
@@ -106,6 +362,10 @@ class Deployment():  # use Deployment.create() to create a Deployment object
         self.suma = None
         self.vagrant_box = None
         self.box = Box(settings)
+        self.lock = DeploymentLock(self.dep_id)
+        self.engine = None
+        if self.settings.vm_engine == 'libvirt-native':
+            self.engine = LibvirtEngine(self.dep_id, self._dep_dir, self.settings, self.nodes)
         self.bootstrap_mon_ip = None
         self.version_devel_repos = None
         self.os_base_repos = None
@@ -118,6 +378,9 @@ class Deployment():  # use Deployment.create() to create a Deployment object
         self.ceph_salt_fetch_github_pr_heads = None
         self.ceph_salt_fetch_github_pr_merges = None
         self.cephadm_bootstrap_node = None
+        self.baked_sections = []  # sections of provision.sh.j2 done by "sesdev bake"
+        self._ssh_config_lock = threading.Lock()
+        self._ssh_config_fresh = set()  # nodes whose ssh config was refreshed by this process
         self.__populate_roles()
         self.__count_roles()
         self.__populate_os()
@@ -307,81 +570,32 @@ class Deployment():  # use Deployment.create() to create a Deployment object
         return False
 
     def __generate_static_networks(self):
-        if self._needs_cluster_network() and self.settings.public_network \
-                and self.settings.cluster_network:
-            return
-        if not self._needs_cluster_network() and self.settings.public_network:
-            return
-
-        deps = self.list()
-        existing_networks = [dep.settings.public_network for dep in deps
-                             if dep.settings.public_network]
-
-        public_network = self.settings.public_network
-        while True:
-            if not public_network or public_network in existing_networks:
-                public_network = "10.20.{}.".format(random.randint(2, 200))
-            else:
-                break
-        self.settings.public_network = public_network
-        self.public_network_segment = "{}0/24".format(public_network)
-
-        if self._needs_cluster_network():
-            existing_networks = [dep.settings.cluster_network for dep in deps
-                                 if dep.settings.cluster_network]
-
-            cluster_network = self.settings.cluster_network
-            while True:
-                if not cluster_network or cluster_network in existing_networks:
-                    cluster_network = "10.21.{}.".format(random.randint(2, 200))
-                else:
-                    break
-            self.settings.cluster_network = cluster_network
+        (public_networks, cluster_networks) = _state_store().networks_in_use()
+        # networks left behind on the host, e.g. by a destroy that failed
+        try:
+            on_host = SubnetAllocator.on_host(Box.libvirt_connection(
+                Box.libvirt_uri_from_settings(self.settings)))
+        except libvirt.libvirtError as error:
+            Log.warning("Cannot list the networks on the libvirt host: {}".format(error))
+            on_host = set()
+        in_use = {'public': public_networks | on_host, 'cluster': cluster_networks | on_host}
+        kinds = ['public', 'cluster'] if self._needs_cluster_network() else ['public']
+        # a network set in the config file is kept, unless it is taken
+        requested = {kind: getattr(self.settings, '{}_network'.format(kind)) for kind in kinds}
+        networks = SubnetAllocator().reserve(self.dep_id, kinds, in_use, requested)
+        if 'public' in networks:
+            self.settings.public_network = networks['public']
+            self.public_network_segment = "{}0/24".format(networks['public'])
+        if 'cluster' in networks:
+            self.settings.cluster_network = networks['cluster']
 
     def __generate_nodes(self):
-        node_id = 0
-        worker_id = 0
-        loadbl_id = 0
-        nfs_id = 0
         Log.debug("__generate_nodes: about to process cluster roles: {}"
                   .format(self.settings.roles))
 
-        for node_roles in self.settings.roles:  # loop once for every node in cluster
-            if self.settings.version == 'caasp4':
-                if 'master' in node_roles:
-                    node_id += 1
-                    name = 'master'
-                    fqdn = 'master.{}'.format(self.domain)
-                elif 'worker' in node_roles:
-                    worker_id += 1
-                    node_id += 1
-                    name = 'worker{}'.format(worker_id)
-                    fqdn = 'worker{}.{}'.format(worker_id, self.domain)
-                elif 'loadbalancer' in node_roles:
-                    loadbl_id += 1
-                    node_id += 1
-                    name = 'loadbl{}'.format(loadbl_id)
-                    fqdn = 'loadbl{}.{}'.format(loadbl_id, self.domain)
-                elif 'nfs' in node_roles and self.settings.version == 'caasp4':
-                    nfs_id += 1
-                    node_id += 1
-                    name = 'nfs{}'.format(nfs_id)
-                    fqdn = 'nfs{}.{}'.format(nfs_id, self.domain)
-                else:
-                    node_id += 1
-                    name = 'node{}'.format(node_id)
-                    fqdn = 'node{}.{}'.format(node_id, self.domain)
-            else:
-                if 'master' in node_roles or 'suma' in node_roles or 'makecheck' in node_roles:
-                    name = 'master'
-                    fqdn = 'master.{}'.format(self.domain)
-                else:
-                    node_id += 1
-                    name = 'node{}'.format(node_id)
-                    fqdn = 'node{}.{}'.format(node_id, self.domain)
-
+        for (name, fqdn, node_roles, public_address, cluster_address) in \
+                _node_layout(self.settings, self.domain):
             networks = ''
-            public_address = None
             if self.settings.libvirt_networks:
                 for network in self.settings.libvirt_networks.split(','):
                     networks += (
@@ -389,10 +603,6 @@ class Deployment():  # use Deployment.create() to create a Deployment object
                         ':forward_mode => "route", :libvirt__network_name'
                         '=> "{}"\n').format(network)
             else:
-                if 'master' in node_roles or 'suma' in node_roles:
-                    public_address = '{}{}'.format(self.settings.public_network, 200)
-                else:
-                    public_address = '{}{}'.format(self.settings.public_network, 200 + node_id)
                 networks = ('node.vm.network :private_network, autostart: true, ip:'
                             '"{}"').format(public_address)
                 if self.settings.ipv6:
@@ -437,9 +647,7 @@ class Deployment():  # use Deployment.create() to create a Deployment object
                 if 'suma' in node_roles:
                     self.suma = node
                 if 'storage' in node_roles:
-                    if self.settings.cluster_network:
-                        node.cluster_address = '{}{}'.format(self.settings.cluster_network,
-                                                             200 + node_id)
+                    node.cluster_address = cluster_address
                     for _ in range(self.settings.num_disks):
                         node.storage_disks.append(Disk(self.settings.disk_size))
                 elif self.settings.explicit_num_disks \
@@ -584,10 +792,44 @@ class Deployment():  # use Deployment.create() to create a Deployment object
         self.__analyze_ceph_salt_github_pr_fetching()
         self.__set_cephadm_bootstrap_node()
 
-    def _generate_vagrantfile(self):
+    def _bake_fingerprint(self):
+        """
+        What the image made by "sesdev bake" for the version and OS of this
+        deployment must have been made with to be used for it: the Vagrant Box
+        and the repos
+        """
+        core_version = self.settings.version in Constant.CORE_VERSIONS
+        return json.loads(json.dumps({
+            'box': self.vagrant_box,
+            'os_base_repos': self.os_base_repos,
+            'version_devel_repos': (self.version_devel_repos
+                                    if self.settings.devel_repo or not core_version else []),
+            'os_ca_repo': self.os_ca_repo if self.settings.os.startswith('sle') else None,
+        }))
+
+    def __use_baked_image(self):
+        image = BakedImages().find(self.engine.uri, self.engine.storage_pool_name,
+                                   self.settings.version, self.settings.os)
+        if not image:
+            return
+        if image['fingerprint'] != self._bake_fingerprint():
+            Log.warning("Not using baked image {}: it was baked with other repos"
+                        .format(image['volume']))
+            return
+        if not self.engine.volume_exists(image['volume']):
+            Log.warning("Not using baked image {}: the volume does not exist anymore"
+                        .format(image['volume']))
+            return
+        Log.info("Using baked image {}".format(image['volume']))
+        self.settings.override('baked_image', image['volume'])
+        self.baked_sections = image['sections']
+
+    def _template_context(self):
         self._prepare_to_generate_vagrantfile()
+        if self.engine and self.settings.use_baked_image and not self.settings.baked_image:
+            self.__use_baked_image()
 
-        context = {
+        return {
             'ssh_key_name': Constant.SSH_KEY_NAME,
             'ssh_extra_key_ids': [key['keyid'] for key in self._extra_ssh_keys],
             'sesdev_path_to_qa': Constant.PATH_TO_QA,
@@ -706,8 +948,11 @@ class Deployment():  # use Deployment.create() to create a Deployment object
             'developer_tools_repos': self.developer_tools_repos,
             'k3s_version': self.settings.k3s_version,
             'longhorn_version': self.settings.longhorn_version,
+            'baked': self.baked_sections,
         }
 
+    def _generate_vagrantfile(self):
+        context = self._template_context()
         scripts = {}
 
         for node in self.nodes.values():
@@ -716,61 +961,90 @@ class Deployment():  # use Deployment.create() to create a Deployment object
             template = Constant.JINJA_ENV.get_template('provision.sh.j2')
             scripts['provision_{}.sh'.format(node.name)] = template.render(**context_cpy)
 
-        template = Constant.JINJA_ENV.get_template('Vagrantfile.j2')
-        scripts['Vagrantfile'] = template.render(**context)
+        if not self.engine:
+            template = Constant.JINJA_ENV.get_template('Vagrantfile.j2')
+            scripts['Vagrantfile'] = template.render(**context)
         return scripts
 
+    @locked(exclusive=True)
     def save(self, log_handler):
-        if self.settings.vm_engine == 'libvirt':
+        if self.settings.vm_engine in ['libvirt', 'libvirt-native']:
             self._get_vagrant_box(log_handler)
         else:
             raise UnsupportedVMEngine(self.settings.vm_engine)
+        if self.engine and self.settings.libvirt_networks:
+            raise OptionNotSupportedInContext('libvirt_networks')
+        if not self.engine and self.settings.cloud_init_seed:
+            raise OptionNotSupportedInContext('cloud_init_seed')
         #
-        # by "scripts", we mean the Vagrantfile itself plus one provisioning
-        # script for each node
+        # by "scripts", we mean the Vagrantfile itself (not with the
+        # libvirt-native VM engine) plus one provisioning script for each node
         scripts = self._generate_vagrantfile()
         key = RSA.generate(2048)
         private_key = key.exportKey('PEM')
         public_key = key.publickey().exportKey('OpenSSH')
         #
         # write settings to metadata file
-        os.makedirs(self._dep_dir, exist_ok=False)
-        metadata_file = os.path.join(self._dep_dir, Constant.METADATA_FILENAME)
-        with open(metadata_file, 'w', encoding='utf-8') as file:
-            json.dump({
-                'id': self.dep_id,
-                'settings': self.settings
-            }, file, cls=SettingsEncoder)
+        self._write_metadata()
         #
         # write "scripts" to files inside the _dep_dir
         for filename, script in scripts.items():
-            full_path = os.path.join(self._dep_dir, filename)
-            with open(full_path, 'w', encoding='utf-8') as file:
-                file.write(script)
+            atomic_write(os.path.join(self._dep_dir, filename), script)
         #
         # generate and write deployment-specific ssh key pair
         keys_dir = os.path.join(self._dep_dir, 'keys')
         os.makedirs(keys_dir)
         priv_key = os.path.join(keys_dir, Constant.SSH_KEY_NAME)
         pub_key = f"{priv_key}.pub"
-        with open(priv_key, 'wb') as file:
-            file.write(private_key)
-        os.chmod(priv_key, 0o600)
-        with open(pub_key, 'wb') as file:
-            file.write(public_key + b" sesdev\n")
-        os.chmod(pub_key, 0o600)
+        atomic_write(priv_key, private_key, mode=0o600)
+        atomic_write(pub_key, public_key + b" sesdev\n", mode=0o600)
 
         for key in self._extra_ssh_keys:
             path = os.path.join(keys_dir, "id_{}.pub".format(key['keyid']))
-            with open(path, 'w', encoding='utf-8') as file:
-                file.write(key['keyline'])
-            os.chmod(path, 0o600)
+            atomic_write(path, key['keyline'], mode=0o600)
 
         #
         # create bin dir for helper scripts
         bin_dir = os.path.join(self._dep_dir, 'bin')
         os.makedirs(bin_dir)
 
+    def _write_metadata(self):
+        """
+        Create the deployment directory, write the settings to its metadata
+        file and add the deployment to the state index (see _update_metadata())
+        """
+        try:
+            os.makedirs(self._dep_dir, exist_ok=False)
+        except FileExistsError as error:
+            # another sesdev process got there first
+            raise DeploymentAlreadyExists(self.dep_id) from error
+        self._update_metadata()
+
+    def _update_metadata(self):
+        """
+        Write the settings to the metadata file and the state index
+        """
+        metadata_file = os.path.join(self._dep_dir, Constant.METADATA_FILENAME)
+        atomic_write(metadata_file, json.dumps({
+            'id': self.dep_id,
+            'settings': self.settings
+        }, cls=SettingsEncoder))
+        _state_store().save_deployment(
+            self.dep_id,
+            {'id': self.dep_id, 'settings': self.settings},
+            self.nodes.values()
+        )
+
+    def set_pool(self, version, claimed_by=None):
+        """
+        Record that the deployment is parked in the pool of "version" (see
+        DeploymentPool), or, with "claimed_by", that "sesdev pool claim" made
+        that deployment of it; with None, that it is in no pool at all
+        """
+        self.settings.override('pool', version)
+        self.settings.override('pool_claimed_by', claimed_by)
+        self._update_metadata()
+
     def _get_vagrant_box(self, log_handler):
         Log.debug('_get_vagrant_box: os is ->{}<'.format(self.settings.os))
         if self.settings.os in Constant.OS_BOX_ALIASES:
@@ -782,18 +1056,10 @@ class Deployment():  # use Deployment.create() to create a Deployment object
             "self.vagrant_box got set to unrecognized value ->{}<-".format(self.vagrant_box)
         #
         Log.info("Checking if vagrant box is already here: {}" .format(self.vagrant_box))
-        found_box = False
-        cmd = ['vagrant', 'box', 'list']
-        output = tools.run_sync(cmd)
-        lines = output.split('\n')
-        for line in lines:
-            if line:
-                box_name = line.split()[0]
-                if box_name == self.vagrant_box:
-                    Log.info("Found vagrant box")
-                    found_box = True
-                    break
-        if not found_box:
+        found_box = self.box.exists(self.vagrant_box)
+        if found_box:
+            Log.info("Found vagrant box")
+        else:
             Log.info("Vagrant box for OS ->{}<- is not installed: downloading it"
                      .format(self.settings.os))
             log_handler("Downloading vagrant box: {}\n".format(self.vagrant_box))
@@ -818,6 +1084,7 @@ class Deployment():  # use Deployment.create() to create a Deployment object
                     box_path = Constant.OS_BOX_MAPPING[self.settings.os]
             cmd += [box_path]
             tools.run_async(cmd, log_handler)
+            Box.invalidate_inventory()
 
     def _vagrant_up(self, node, log_handler):
         cmd = ["vagrant", "up", "--no-destroy-on-error"]
@@ -831,64 +1098,347 @@ class Deployment():  # use Deployment.create() to create a Deployment object
             cmd.append('--debug')
         tools.run_async(cmd, log_handler, self._dep_dir)
 
+    def _run_node_chains(self, chains, log_handler, jobs=None):
+        """
+        Run "chains" (a dict mapping node name to a list of commands) with
+        tools.run_chains(), at most "jobs" nodes at once. Each node's output
+        goes to logs/<node>.log in the deployment directory and, prefixed with
+        the node name, to "log_handler". Raises CommandsFailed if any chain
+        failed.
+        """
+        log_dir = os.path.join(self._dep_dir, 'logs')
+        os.makedirs(log_dir, exist_ok=True)
+        log_files = {}
+
+        def _callback(node, line):
+            log_files[node].write(line)
+            log_files[node].flush()
+            log_handler("[{}] {}".format(node, line))
+
+        with contextlib.ExitStack() as stack:
+            for name in chains:
+                log_files[name] = stack.enter_context(
+                    open(os.path.join(log_dir, '{}.log'.format(name)), 'a', encoding='utf-8'))
+            results = tools.run_chains(chains, _callback, jobs)
+        failed = [result for name in chains for result in results[name]
+                  if result.returncode != 0]
+        if failed:
+            raise CommandsFailed(failed)
+
+    def _vagrant_parallel_up(self, log_handler):
+        """
+        Bring up the nodes with one Vagrant process per node, at most
+        settings.parallel_bringup at a time: first all the domains, then (for
+        a new deployment) the provisioning, logging as _run_node_chains() does.
+
+        The master's provisioning script waits for the other nodes by itself,
+        so it is started first and does not count against the limit; the
+        other nodes' provisioning fills the remaining slots.
+        """
+        jobs = self.settings.parallel_bringup
+
+        def _run(subcommand, names, jobs):
+            chains = {}
+            for name in names:
+                cmd = ["vagrant"] + subcommand + [name]
+                if Constant.VAGRANT_DEBUG:
+                    cmd.append('--debug')
+                chains[name] = [tools.CommandSpec(cmd, cwd=self._dep_dir)]
+            self._run_node_chains(chains, log_handler, jobs)
+
+        names = list(self.nodes)
+        if self.master and self.master.name in names:
+            names.remove(self.master.name)
+            names.insert(0, self.master.name)
+        up_cmd = ["up", "--no-destroy-on-error", "--no-provision"]
+        if self.existing:
+            _run(up_cmd, names, jobs)
+            return
+        # vagrant-libvirt uploads the box to the storage pool when it is first
+        # used, and does not guard against other processes doing the same
+        _run(up_cmd, names[:1], 1)
+        _run(up_cmd, names[1:], jobs)
+        _run(["provision"], names, jobs + 1 if self.master else jobs)
+
+    def _native_up(self, log_handler, node=None):
+        """
+        Bring up the nodes with the libvirt-native VM engine. A new deployment
+        gets its network, volumes and domains defined first, and then all nodes
+        are provisioned at once (the master's provisioning script waits for the
+        other nodes by itself), logging as _run_node_chains() does. With the
+        "cloud_init_seed" setting, the nodes provision themselves at first boot
+        and only their completion is waited for.
+        """
+        names = [node] if node else list(self.nodes)
+        if self.existing:
+            self.engine.start(names)
+            self._wait_for_nodes(names, log_handler)
+            return
+        master = self.master.name if self.master else None
+        self.engine.define(self.vagrant_box, master, self.settings.cloud_init_seed)
+        self.engine.start()
+        chain = self.engine.seed_chain if self.settings.cloud_init_seed \
+            else self.engine.provision_chain
+        chains = {}
+        for name in self.nodes:
+            if name == master:
+                chains[name] = chain(name, True, self.settings.synced_folder)
+            else:
+                chains[name] = chain(name)
+        self._run_node_chains(chains, log_handler, len(chains))
+
+    def bake(self, log_handler):
+        """
+        Make the base image of "sesdev bake" from the only node of this
+        (libvirt-native) deployment: run bake.sh.j2 on it, shut it down, copy
+        its system disk to a volume of its own and record that in BakedImages
+        """
+        name = self.master.name
+        sections = ['zypper-config', 'repos', 'base-packages']
+        context = self._template_context()
+        if context['deploy_salt']:
+            sections.append('salt-minion')
+            if self.settings.deployment_tool == 'cephadm':
+                sections.append('ceph-packages')
+        context.update(node=self.master, baked=[], sections=sections,
+                       ceph_packages=BakedImages.CEPH_PACKAGES)
+        script = os.path.join(self._dep_dir, 'bake.sh')
+        atomic_write(script, Constant.JINJA_ENV.get_template('bake.sh.j2').render(**context))
+
+        self.engine.define(self.vagrant_box)
+        self.engine.start()
+        chain = self.engine.wait_chain(name) + [
+            self.engine.scp_cmd([script], name, '/home/vagrant/'),
+            self.engine.ssh_cmd(name, 'sudo bash bake.sh && rm bake.sh'),
+        ]
+        self._run_node_chains({name: chain}, log_handler)
+        if self.engine.stop([name], timeout=300):
+            Log.warning("Domain {} did not shut down: powering it off"
+                        .format(self.engine.domain_name(name)))
+            self.engine.stop([name], timeout=0, force=True)
+
+        volume_name = BakedImages.volume_name(self.settings.version, self.settings.os,
+                                              time.strftime('%Y%m%d%H%M%S'))
+        self.engine.export_volume(name, volume_name)
+        replaced = BakedImages().record({
+            'uri': self.engine.uri,
+            'pool': self.engine.storage_pool_name,
+            'version': self.settings.version,
+            'os': self.settings.os,
+            'volume': volume_name,
+            'sections': sections,
+            'fingerprint': self._bake_fingerprint(),
+            'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+        })
+        log_handler("Baked image {} for {} on {}\n"
+                    .format(volume_name, self.settings.version, self.settings.os))
+        if replaced:
+            log_handler("The image baked before, {}, is kept as deployments may still use it. "
+                        "Once they are gone, remove it with:\n  virsh vol-delete --pool {} {}\n"
+                        .format(replaced['volume'], replaced['pool'], replaced['volume']))
+        return volume_name
+
+    @locked()
+    def snapshot_save(self, log_handler, name):
+        log_handler("Taking snapshot {} of deployment {}\n".format(name, self.dep_id))
+        DeploymentSnapshots.of(self).save(name)
+
+    @locked()
+    def snapshot_restore(self, log_handler, name):
+        """
+        Revert all nodes to snapshot "name" and step the clocks of the running
+        ones, which are behind by the time since the snapshot was taken
+        """
+        log_handler("Restoring snapshot {} of deployment {}\n".format(name, self.dep_id))
+        self.close_ssh_masters()
+        running = DeploymentSnapshots.of(self).restore(name)
+        for (node_name, node) in self.nodes.items():
+            node.status = "running" if node_name in running else "stopped"
+        self._save_status()
+        if running:
+            self._resync_clocks(running, log_handler)
+
+    def _resync_clocks(self, names, log_handler):
+        """
+        Set the clocks of nodes "names", which lag behind after being restored
+        from a saved state, to the time of this host, as soon as they answer
+        over SSH
+        """
+        self._wait_for_nodes(names, log_handler)
+        log_handler("Setting the clocks of nodes {}\n".format(', '.join(names)))
+        results = self.for_each_node(
+            lambda _: ['date -u -s @{} > /dev/null && (chronyc makestep > /dev/null 2>&1 || true)'
+                       .format(int(time.time()))],
+            names, concurrency=len(names), log_handler=log_handler, check=False)
+        for (node, result) in results.items():
+            if not result.ok:
+                Log.warning("Could not set the clock of node {}".format(node))
+
+    def snapshot_list(self):
+        return DeploymentSnapshots.of(self).list()
+
+    @locked()
+    def snapshot_delete(self, log_handler, name):
+        clones = self.clones()
+        if clones:
+            # deleting a snapshot merges its overlays into the disks the
+            # clones are backed by
+            raise DeploymentHasClones(self.dep_id, clones)
+        log_handler("Deleting snapshot {} of deployment {}\n".format(name, self.dep_id))
+        DeploymentSnapshots.of(self).delete(name)
+
+    def clones(self):
+        """
+        Return the IDs of the deployments made by "sesdev clone" of this one
+        """
+        return [record.dep_id for record in DeploymentRecord.list()
+                if record.settings.cloned_from == self.dep_id]
+
+    @locked()
+    def clone(self, log_handler, new_id):
+        """
+        Clone this (stopped) deployment into a new deployment "new_id", whose
+        disks are qcow2 overlays of the disks of this one (see
+        LibvirtEngine.freeze_disks()). The clone keeps the host names of the
+        nodes, but gets networks of its own, and its nodes are moved to their
+        new addresses (see _readdress()) once they are up. Returns the clone.
+        """
+        if not self.engine:
+            raise DeploymentNotClonable(
+                self.dep_id, 'only deployments of the libvirt-native VM engine can be cloned')
+        not_stopped = [name for (name, node) in self.nodes.items() if node.status != "stopped"]
+        if not_stopped:
+            raise DeploymentNotClonable(
+                self.dep_id, 'nodes {} are not stopped'.format(', '.join(not_stopped)))
+        if os.path.exists(os.path.join(Constant.A_WORKING_DIR, new_id)):
+            raise DeploymentAlreadyExists(new_id)
+        settings = Settings(strict=False,
+                            **json.loads(json.dumps(self.settings, cls=SettingsEncoder)))
+        settings.override('public_network', '')  # see __generate_static_networks()
+        settings.override('cluster_network', '')
+        settings.override('domain', self.domain)
+        settings.override('cloned_from', self.dep_id)
+        settings.override('pool', None)  # a clone is not parked in a pool
+        settings.override('pool_claimed_by', None)
+        dep = Deployment(new_id, settings)
+        dep.clone_from(self, log_handler)
+        return dep
+
+    @locked(exclusive=True)
+    def clone_from(self, source, log_handler):
+        """
+        Make this new deployment a clone of deployment "source" (see clone()).
+        If that fails, what there is of the clone is destroyed again (or, if
+        even that fails, left to "sesdev destroy").
+        """
+        Log.info("cloning deployment {} into {}".format(source.dep_id, self.dep_id))
+        self._write_metadata()
+        try:
+            for subdir in ['keys', 'bin']:
+                shutil.copytree(os.path.join(Constant.A_WORKING_DIR, source.dep_id, subdir),
+                                os.path.join(self._dep_dir, subdir))
+
+            log_handler("Cloning the disks of deployment {}\n".format(source.dep_id))
+            self.engine.define_network()
+            for name in source.nodes:
+                disks = source.engine.freeze_disks(name, 'clone-{}'.format(self.dep_id))
+                self.engine.define_clone(self.nodes[name], disks)
+            self.engine.start()
+            self._wait_for_nodes(list(self.nodes), log_handler)
+            self._readdress(source, log_handler)
+        except BaseException:
+            log_handler("Cloning deployment {} failed: destroying deployment {}\n"
+                        .format(source.dep_id, self.dep_id))
+            self.destroy_many([self], log_handler)
+            raise
+        for node in self.nodes.values():
+            node.status = "running"
+        self._save_status()
+
+    def _readdress_scripts(self, source):
+        """
+        Render readdress.sh.j2 for each node of this clone of deployment
+        "source". Returns a dict mapping node name to script.
+        """
+        addresses = []
+        for (name, node) in self.nodes.items():
+            source_node = source.nodes[name]
+            addresses.append((source_node.public_address, node.public_address))
+            if source_node.cluster_address and node.cluster_address:
+                addresses.append((source_node.cluster_address, node.cluster_address))
+        networks = [(source.public_network_segment, self.public_network_segment)]
+        prefixes = [source.settings.public_network]
+        if source.cluster_network_segment and self.cluster_network_segment:
+            networks.append((source.cluster_network_segment, self.cluster_network_segment))
+            prefixes.append(source.settings.cluster_network)
+        template = Constant.JINJA_ENV.get_template('readdress.sh.j2')
+        return {name: template.render(node=node,
+                                      master=self.master,
+                                      nodes=list(self.nodes.values()),
+                                      addresses=addresses,
+                                      networks=networks,
+                                      prefixes=prefixes,
+                                      deployment_tool=self.settings.deployment_tool,
+                                      reasonable_timeout_in_seconds=(
+                                          Constant.REASONABLE_TIMEOUT_IN_SECONDS))
+                for (name, node) in self.nodes.items()}
+
+    def _readdress(self, source, log_handler):
+        """
+        Move the nodes of this clone of deployment "source" from the addresses
+        of "source" to their own: the configuration of the nodes first, then
+        (on the master) what the Ceph cluster keeps of them
+        """
+        log_handler("Moving the nodes of deployment {} to their new addresses\n"
+                    .format(self.dep_id))
+        for (name, script) in self._readdress_scripts(source).items():
+            atomic_write(os.path.join(self._dep_dir, 'readdress_{}.sh'.format(name)), script)
+        self.for_each_node(
+            lambda name: [self._scp_cmd(os.path.join(self._dep_dir, 'readdress_{}.sh'.format(name)),
+                                        '{}:/root/sesdev-readdress.sh'.format(name)),
+                          'bash /root/sesdev-readdress.sh'],
+            concurrency=len(self.nodes), log_handler=log_handler)
+        if self.master:
+            self.for_each_node(lambda _: ['bash /root/sesdev-readdress.sh --cluster'],
+                               [self.master.name], log_handler=log_handler)
+
+    @locked()
     def reboot_one_node(self, log_handler, node):
         if node not in self.nodes:
             raise NodeDoesNotExist(node, self.dep_id)
-        log_handler("=> running 'reboot' via SSH on node '{}'\n".format(node))
-        ssh_cmd = ("bash -x -c 'reboot'",)
-        retval = self.ssh(node, ssh_cmd, False)
-        log_handler("=> interactive SSH command returned {}\n".format(retval))
+        domains = DeploymentDomains.of(self)
+        domain = domains.domain(node)
+        with domains.events(libvirt.VIR_DOMAIN_EVENT_ID_REBOOT) as events:
+            log_handler("=> running 'reboot' via SSH on node '{}'\n".format(node))
+            ssh_cmd = ("bash -x -c 'reboot'",)
+            retval = self.ssh(node, ssh_cmd, False)
+            log_handler("=> interactive SSH command returned {}\n".format(retval))
+            # without the event, the node might still be on its way down
+            if events.wait_for(domain, 120):
+                log_handler("=> node '{}' is rebooting\n".format(node))
+        self.close_ssh_masters(node)
         seconds_to_wait = 600
         log_handler("=> waiting up to {} seconds for node '{}' to come back from reboot\n"
                     .format(seconds_to_wait, node)
                    )
-        interval_seconds = 15
-        while True:
-            ssh_cmd = ("bash -x -c 'echo I am back'",)
-            retval = self.ssh(node, ssh_cmd, False)
-            if retval == 0:
-                break
-            log_handler("=> interactive SSH command returned {}\n".format(retval))
-            seconds_to_wait -= interval_seconds
-            if seconds_to_wait <= 0:
-                log_handler("ERROR: node '{}' did not come back from reboot!\n".format(node))
-                raise RebootDidNotSucceed(node, self.dep_id)
-            log_handler("=> waiting up to {} more seconds for node '{}' to come back from reboot\n"
-                        .format(seconds_to_wait, node)
-                       )
-            time.sleep(interval_seconds)
+        if not self._wait_for_ssh(node, seconds_to_wait):
+            log_handler("ERROR: node '{}' did not come back from reboot!\n".format(node))
+            raise RebootDidNotSucceed(node, self.dep_id)
         log_handler("=> node '{}' is back from reboot!\n".format(node))
-        seconds_to_wait = 600
         log_handler("=> waiting up to {} seconds for node '{}' to finish booting\n"
                     .format(seconds_to_wait, node)
                    )
-        while True:
-            ssh_cmd = ("bash -x -c 'systemctl is-system-running'",)
-            retval = self.ssh(node, ssh_cmd, False)
-            if retval == 0:
-                break
-            log_handler("=> interactive SSH command returned {}\n".format(retval))
-            seconds_to_wait -= interval_seconds
-            if seconds_to_wait <= 0:
-                log_handler("ERROR: node '{}' did not complete boot sequence!\n".format(node))
-                raise RebootDidNotSucceed(node, self.dep_id)
-            log_handler("=> waiting up to {} more seconds for node '{}' to finish booting\n"
-                        .format(seconds_to_wait, node)
-                       )
-            time.sleep(interval_seconds)
+        if not tools.backoff(lambda: self._ssh_probe(node, 'systemctl is-system-running'),
+                             seconds_to_wait):
+            log_handler("ERROR: node '{}' did not complete boot sequence!\n".format(node))
+            raise RebootDidNotSucceed(node, self.dep_id)
         log_handler("=> node '{}' completed boot sequence!\n".format(node))
 
-    def destroy(self, log_handler, destroy_networks=False):
-
-        # if we are allowing networks to be destroyed, populate the networks
-        # list; we will find all networks now, and we'll destroy them last.
-        used_networks = []
-        if destroy_networks:
-            used_networks = self.box.get_networks_by_deployment(self.dep_id)
-
-        Log.debug("should destroy networks: {}, networks: {}"
-                  .format(destroy_networks, used_networks))
-
+    def vagrant_destroy(self, log_handler):
+        """
+        Destroy the VMs with "vagrant destroy", falling back to destroying them
+        one by one. Returns True if errors were encountered.
+        """
         errors_encountered = False
         cmd = ['vagrant', 'destroy', '--force']
         if Constant.VAGRANT_DEBUG:
@@ -922,110 +1472,243 @@ class Deployment():  # use Deployment.create() to create a Deployment object
                     Log.info("Forging on in spite of the error")
                     Constant.VERBOSE = saved_verbose_setting
 
-        shutil.rmtree(self._dep_dir)
-        # clean up any orphaned volumes
-        images_to_remove = self.box.get_images_by_deployment(self.dep_id)
-        if images_to_remove:
-            Log.warning("Found orphaned volumes: {}".format(images_to_remove))
-            Log.info("Removing orphaned volumes")
-            for image in images_to_remove:
-                self.box.remove_image(image)
-
-        for network in used_networks:
-            Log.info("Destroy network '{}'".format(network))
-            if not self.box.destroy_network(network):
-                Log.warning("Unable to destroy network '{}' for deployment '{}'"
-                            .format(network, self.dep_id))
-            else:
-                Log.info("Destroyed network '{}' for deployment '{}'"
-                         .format(network, self.dep_id))
+        return errors_encountered
 
-        if errors_encountered:
+    def destroy(self, log_handler, destroy_networks=False):
+        return self.destroy_many([self], log_handler, destroy_networks)
+
+    def forget(self):
+        """
+        Remove what sesdev keeps of the deployment on this host: its ssh
+        control sockets, its directory, its entry in the state index and its
+        network reservations
+        """
+        mux_dir = self._ssh_mux_dir
+        if not mux_dir.startswith(self._dep_dir):
+            shutil.rmtree(mux_dir, ignore_errors=True)
+        # move the directory out of the way first, so that other sesdev
+        # processes see the deployment either complete or gone
+        trash_dir = os.path.join(Constant.A_WORKING_DIR,
+                                 '.destroying-{}-{}'.format(self.dep_id, os.getpid()))
+        os.rename(self._dep_dir, trash_dir)
+        _state_store().remove_deployment(self.dep_id)
+        SubnetAllocator().release(self.dep_id)
+        shutil.rmtree(trash_dir)
+        self.lock.remove()
+
+    @classmethod
+    def destroy_many(cls, deps, log_handler, destroy_networks=False):
+        """
+        Destroy deployments "deps" all at once. The domains, volumes and
+        networks of all of them are found in one pass over each libvirt host,
+        and removed concurrently (see LibvirtTeardown), the networks their
+        domains are attached to as well if "destroy_networks" is set. The
+        deployment directories are removed last. If a libvirt host cannot be
+        reached, the deployments of the Vagrant VM engine on it are destroyed
+        with "vagrant destroy" instead. The pool deployments any of "deps" were
+        claimed from (see DeploymentPool) are destroyed along with them.
+        Deployments that could not be destroyed completely are kept, so that
+        destroying them can be tried again; returns their IDs.
+        """
+        records = DeploymentRecord.list()
+        dep_ids = [dep.dep_id for dep in deps]
+        claimed_from = [record.dep_id for record in records
+                        if record.settings.pool_claimed_by in dep_ids
+                        and record.dep_id not in dep_ids]
+        if claimed_from:
+            deps = list(deps) + cls.load_many(claimed_from, load_status=False)
+            dep_ids += claimed_from
+        clones = {}
+        for record in records:
+            if record.settings.cloned_from in dep_ids and record.dep_id not in dep_ids:
+                clones.setdefault(record.settings.cloned_from, []).append(record.dep_id)
+        if clones:
+            (dep_id, dep_clones) = next(iter(clones.items()))
+            raise DeploymentHasClones(dep_id, dep_clones)
+
+        with contextlib.ExitStack() as stack:
+            # wait for the sesdev processes still using any of them
+            for dep in sorted(deps, key=lambda dep: dep.dep_id):
+                stack.enter_context(dep.lock.exclusive())
+            for dep in deps:
+                dep.close_ssh_masters()
+
+            hosts = {}
+            for dep in deps:
+                pool_name = dep.settings.libvirt_storage_pool \
+                    if dep.settings.libvirt_storage_pool else 'default'
+                hosts.setdefault((Box.libvirt_uri_from_settings(dep.settings), pool_name),
+                                 []).append(dep)
+            failed = set()
+            for ((uri, pool_name), host_deps) in hosts.items():
+                try:
+                    teardown = LibvirtTeardown(Box.libvirt_connection(uri), pool_name,
+                                               [dep.dep_id for dep in host_deps], destroy_networks)
+                    inventory = teardown.inventory()
+                except libvirt.libvirtError as error:
+                    Log.error("Cannot take stock of the VMs on libvirt host {}: {}"
+                              .format(uri, error))
+                    for dep in host_deps:
+                        if dep.engine or dep.vagrant_destroy(log_handler):
+                            failed.add(dep.dep_id)
+                    continue
+                for (dep_id, resources) in inventory.items():
+                    log_handler("Destroying deployment {}: {} domains, {} volumes, {} networks\n"
+                                .format(dep_id, len(resources['domains']),
+                                        len(resources['volumes']), len(resources['networks'])))
+                for (dep_id, errors) in teardown.run(inventory).items():
+                    if errors:
+                        failed.add(dep_id)
+
+            # what sesdev keeps of the others is needed to destroy them again
+            tools.parallel_map(lambda dep: dep.forget(),
+                               [dep for dep in deps if dep.dep_id not in failed])
+
+        for dep_id in sorted(failed):
             print("""
 ERROR: deployment "{dep_id}" possibly not completely destroyed
 
 sesdev did its best to destroy the deployment, but errors were
 encountered. What this means is some parts of the deployment
-might still be left over.
+might still be left over. sesdev still knows of the deployment:
+run "sesdev destroy {dep_id}" again once the problem is solved.
 
-To check this, consider the following hints (which may or may not
-work when run verbatim in your environment):
+To check what is left over, consider the following hints (which
+may or may not work when run verbatim in your environment):
 
     sudo virsh list --all | grep '^ {dep_id}'
     sudo virsh vol-list default | grep '^ {dep_id}'
     sudo virsh net-list | grep '^ {dep_id}'
-    (cd ~/.sesdev ; ls -d1 */ | grep '^{dep_id}')
-
-If any of these show lines starting with "{dep_id}", the
-deployment might not be completely destroyed.
-""".format(dep_id=self.dep_id))
+""".format(dep_id=dep_id))
+        return sorted(failed)
 
     def _stop(self, node):
         if self.nodes[node].status != "running":
             Log.warning("Node '{}' is not running: current status '{}'"
                         .format(node, self.nodes[node].status))
             return
-        # Ugly hack to let ssh successfully exit before the connection is
-        # dropped during VM shutdown:
-        ssh_cmd = self._ssh_cmd(node)
-        ssh_cmd.extend(['echo "sleep 2 && shutdown -h now" > /root/shutdown.sh '
-                        '&& chmod +x /root/shutdown.sh'])
-        tools.run_sync(ssh_cmd)
-        ssh_cmd = self._ssh_cmd(node)
-        ssh_cmd.extend(['nohup /root/shutdown.sh > /dev/null 2>&1 &'])
-        tools.run_sync(ssh_cmd)
-
-        # Wait up to one minute for node to actually shut down:
-        for _ in range(12):
-            self.load_status()
-
-            if self.nodes[node].status == "stopped":
-                Log.info(f"Node {node} successfully stopped.")
-                break
-
-            time.sleep(5)
+        domains = DeploymentDomains.of(self)
+        domain = domains.domain(node)
+        with domains.events() as events:
+            # Ugly hack to let ssh successfully exit before the connection is
+            # dropped during VM shutdown:
+            self.sync_ssh(node, ['echo "sleep 2 && shutdown -h now" > /root/shutdown.sh '
+                                 '&& chmod +x /root/shutdown.sh'])
+            self.sync_ssh(node, ['nohup /root/shutdown.sh > /dev/null 2>&1 &'])
+
+            # Wait up to one minute for node to actually shut down:
+            if events.wait_stopped([domain], 60):
+                Log.warning("Node '{}' did not shut down".format(node))
+                return
+        Log.info(f"Node {node} successfully stopped.")
+        self.nodes[node].status = "stopped"
 
-    def stop(self, log_handler, node=None):
+    @locked()
+    def stop(self, log_handler, node=None, suspend=False):
+        """
+        Shut down node "node" (default: all nodes), or, with "suspend", save
+        its memory to disk (see ManagedSave) so that start() resumes it
+        """
         if node and node not in self.nodes:
             raise NodeDoesNotExist(node, self.dep_id)
-        if node:
+        if suspend:
+            names = [node] if node else list(self.nodes)
+            log_handler("Saving nodes {} of deployment {} to disk\n"
+                        .format(', '.join(names), self.dep_id))
+            # the ssh connections would not survive it
+            self.close_ssh_masters(node)
+            for name in ManagedSave.of(self).save(names):
+                self.nodes[name].status = "saved"
+        elif self.engine:
+            names = [node] if node else list(self.nodes)
+            for name in names:
+                log_handler("Stopping node {} of deployment {}\n".format(name, self.dep_id))
+            still_running = self.engine.stop(names)
+            for name in names:
+                if name in still_running:
+                    Log.warning("Node '{}' did not shut down".format(name))
+                else:
+                    self.nodes[name].status = "stopped"
+        elif node:
             log_handler("Stopping node {} of deployment {}\n".format(node, self.dep_id))
             self._stop(node)
         else:
             for _node in self.nodes:
                 log_handler("Stopping node {} of deployment {}\n".format(_node, self.dep_id))
                 self._stop(_node)
+        self._save_status()
+        self._invalidate_ssh_config(node)
+        self.close_ssh_masters(node)
 
+    @locked()
     def start(self, log_handler, node=None):
         if node and node not in self.nodes:
             raise NodeDoesNotExist(node, self.dep_id)
         if not self.existing:
             assert self.vagrant_box is not None, "vagrant_box is set to None!"
-        self._vagrant_up(node, log_handler)
+        self._invalidate_ssh_config(node)
+        names = [node] if node else list(self.nodes)
+        restored = []
+        if [name for name in names if self.nodes[name].status == "saved"]:
+            log_handler("Restoring the saved nodes of deployment {}\n".format(self.dep_id))
+            restored = ManagedSave.of(self).restore(names)
+        if self.engine:
+            self._native_up(log_handler, node)
+        elif sorted(restored) == sorted(names):
+            pass  # all up already, no need for "vagrant up"
+        elif self.settings.parallel_bringup and not node:
+            self._vagrant_parallel_up(log_handler)
+        else:
+            self._vagrant_up(node, log_handler)
+        for _node in [node] if node else self.nodes:
+            self.nodes[_node].status = "running"
+        self._save_status()
+        try:
+            self._refresh_ssh_config(node)
+        except (CmdException, VagrantSshConfigNoHostName) as error:
+            # not fatal: the ssh config will be fetched when first needed
+            Log.debug("Could not cache ssh config of deployment {}: {}"
+                      .format(self.dep_id, error))
+        if restored:
+            self._resync_clocks(restored, log_handler)
+
+    def resources(self):
+        """
+        Return the RAM (MiB), vCPUs and storage disk space (GiB) the nodes of
+        the deployment take, as a dict like HostCapacity.left
+        """
+        return {
+            'ram': sum(node.ram for node in self.nodes.values()),
+            'cpus': sum(node.cpus for node in self.nodes.values()),
+            'disk': sum(disk.size for node in self.nodes.values() for disk in node.storage_disks),
+        }
+
+    def admitted(self, log_handler):
+        """
+        Context manager holding a place in the AdmissionQueue of the libvirt
+        host: entering it waits (or, without settings.wait_for_capacity, fails)
+        until the host can take the deployment, leaving it, once the nodes are
+        up, lets the next one in
+        """
+        uri = Box.libvirt_uri_from_settings(self.settings)
+        pool_name = self.settings.libvirt_storage_pool \
+            if self.settings.libvirt_storage_pool else 'default'
+        return AdmissionQueue().admitted(
+            self.dep_id, uri, self.resources(),
+            lambda: HostCapacity(Box.libvirt_connection(uri), pool_name),
+            wait=self.settings.wait_for_capacity, log_handler=log_handler)
 
     def __str__(self):
         return self.dep_id
 
-    def load_status(self):
-        if not os.path.exists(os.path.join(self._dep_dir, '.vagrant')):
-            for node in self.nodes.values():
-                node.status = "not deployed"
-            return
+    def load_status(self, domain_states=None):
+        _load_status(self.dep_id, self._dep_dir, self.settings, self.nodes, domain_states)
 
-        cmd = ['vagrant', 'status']
-        out = tools.run_sync(cmd, cwd=self._dep_dir)
-        for line in [line.strip() for line in out.split('\n')]:
-            if line:
-                line_arr = line.split(' ', 1)
-                if line_arr[0] in self.nodes:
-                    if line_arr[1].strip().startswith("running"):
-                        self.nodes[line_arr[0]].status = "running"
-                    elif line_arr[1].strip().startswith("not created"):
-                        self.nodes[line_arr[0]].status = "not deployed"
-                    elif line_arr[1].strip().startswith("shutoff"):
-                        self.nodes[line_arr[0]].status = "stopped"
-                    elif line_arr[1].strip().startswith("paused"):
-                        self.nodes[line_arr[0]].status = "suspended"
+    def _save_status(self):
+        """
+        Record the current node statuses in the state index
+        """
+        _state_store().set_node_statuses(self.dep_id, self.nodes.values())
 
     def configuration_report(self,
                              show_deployment_wide_params=True,
@@ -1079,6 +1762,8 @@ deployment might not be completely destroyed.
                 result += "- qa_test:          {}\n".format(self.settings.qa_test)
             if self.settings.fqdn:
                 result += "- FQDN:             {}\n".format(self.settings.fqdn)
+            if self.settings.baked_image:
+                result += "- baked image:      {}\n".format(self.settings.baked_image)
             if self.settings.rgw_ssl:
                 result += "- RGW with SSL:     {}\n".format(self.settings.rgw_ssl)
             if self.settings.deepsea_git_repo and self.settings.deepsea_git_branch:
@@ -1214,28 +1899,185 @@ deployment might not be completely destroyed.
                 if node.count(role) > 1:
                     raise DuplicateRolesNotSupported(role)
 
-    def _vagrant_ssh_config(self, name):
-        if name not in self.nodes:
-            raise NodeDoesNotExist(name, self.dep_id)
+    @property
+    def _ssh_config_file(self):
+        return os.path.join(self._dep_dir, Constant.SSH_CONFIG_CACHE_FILENAME)
 
-        cmd = ["vagrant", "ssh-config", name]
-        out = tools.run_sync(cmd, cwd=self._dep_dir)
+    def _read_ssh_config_cache(self):
+        try:
+            with open(self._ssh_config_file, 'r', encoding='utf-8') as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {}
+        except ValueError as error:
+            Log.warning("Ignoring corrupt ssh config cache {}: {}"
+                        .format(self._ssh_config_file, error))
+            return {}
+
+    def _write_ssh_config_cache(self, configs):
+        atomic_write(self._ssh_config_file, json.dumps(configs), mode=0o600)
 
-        address = None
-        proxycmd = None
+    @staticmethod
+    def _parse_vagrant_ssh_config(out):
+        """
+        Parse the output of "vagrant ssh-config [NODE]" into a dict mapping node
+        name to (address, proxycmd)
+        """
+        configs = {}
+        name = None
         for line in out.split('\n'):
             line = line.strip()
-            if line.startswith('HostName'):
-                address = line[len('HostName') + 1:]
+            if line.startswith('Host '):
+                name = line[len('Host') + 1:].strip()
+                configs[name] = (None, None)
+            elif name is None:
+                continue
+            elif line.startswith('HostName'):
+                configs[name] = (line[len('HostName') + 1:], configs[name][1])
             elif line.startswith('ProxyCommand'):
-                proxycmd = line[len('ProxyCommand') + 1:]
+                configs[name] = (configs[name][0], line[len('ProxyCommand') + 1:])
+        return configs
 
-        if address is None:
-            raise VagrantSshConfigNoHostName(name)
+    def _refresh_ssh_config(self, name=None):
+        """
+        Run "vagrant ssh-config" for node "name" (or all nodes) and cache the
+        result in the deployment directory and the state index
+        """
+        if self.engine:
+            parsed = {node: config for (node, config) in self.engine.ssh_configs().items()
+                      if not name or node == name}
+        else:
+            cmd = ["vagrant", "ssh-config"]
+            if name:
+                cmd.append(name)
+            parsed = self._parse_vagrant_ssh_config(tools.run_sync(cmd, cwd=self._dep_dir))
 
         dep_private_key = os.path.join(self._dep_dir, str("keys/" + Constant.SSH_KEY_NAME))
+        store = _state_store()
+        with self._ssh_config_lock:
+            configs = self._read_ssh_config_cache()
+            for (node, (address, proxycmd)) in parsed.items():
+                if node not in self.nodes:
+                    continue
+                if address is None:
+                    raise VagrantSshConfigNoHostName(node)
+                configs[node] = {
+                    'hostname': address,
+                    'proxycommand': proxycmd,
+                    'private_key': dep_private_key,
+                }
+                store.set_ssh_config(self.dep_id, node, address, proxycmd, dep_private_key)
+                self._ssh_config_fresh.add(node)
+            self._write_ssh_config_cache(configs)
+        if name and name not in configs:
+            raise VagrantSshConfigNoHostName(name)
+
+    def _invalidate_ssh_config(self, name=None):
+        """
+        Drop the cached ssh config of node "name" (or all nodes)
+        """
+        with self._ssh_config_lock:
+            if name:
+                configs = self._read_ssh_config_cache()
+                if configs.pop(name, None) is not None:
+                    self._write_ssh_config_cache(configs)
+                self._ssh_config_fresh.discard(name)
+            else:
+                if os.path.exists(self._ssh_config_file):
+                    os.remove(self._ssh_config_file)
+                self._ssh_config_fresh.clear()
+        _state_store().clear_ssh_configs(self.dep_id, name)
 
-        return (address, proxycmd, dep_private_key)
+    def _vagrant_ssh_config(self, name):
+        if name not in self.nodes:
+            raise NodeDoesNotExist(name, self.dep_id)
+
+        with self._ssh_config_lock:
+            config = self._read_ssh_config_cache().get(name)
+        if config is None:
+            # the cache file went missing or was corrupt
+            indexed = _state_store().ssh_config(self.dep_id, name)
+            if indexed is not None:
+                (hostname, proxycommand, private_key) = indexed
+                config = {'hostname': hostname, 'proxycommand': proxycommand,
+                          'private_key': private_key}
+        if config is None:
+            self._refresh_ssh_config(name)
+            with self._ssh_config_lock:
+                config = self._read_ssh_config_cache()[name]
+
+        return (config['hostname'], config['proxycommand'], config['private_key'])
+
+    def for_each_node(self, fn, nodes=None, *, concurrency=None, timeout=None, log_handler=None,
+                      check=True):
+        """
+        Run a chain of commands on each of "nodes" (default: all nodes),
+        working on up to "concurrency" (default: Constant.JOBS) nodes at once.
+        fn(node) returns the chain for that node: a list of commands, each of
+        which is either a string (a shell command to run on the node over SSH)
+        or an argument list to run locally (e.g. from _rsync_cmd()). The
+        commands of a chain run one after another, stopping at the first
+        failure, and must complete within "timeout" seconds per node. Each line
+        of output goes to "log_handler", prefixed with the node name.
+
+        Returns a dict mapping node name to NodeResult, in the order of
+        "nodes". Raises CommandsFailed if any chain failed, unless "check" is
+        False.
+        """
+        nodes = list(nodes) if nodes else list(self.nodes)
+        for node in nodes:
+            if node not in self.nodes:
+                raise NodeDoesNotExist(node, self.dep_id)
+
+        def _chain(node):
+            return [self._ssh_cmd(node, [command]) if isinstance(command, str) else command
+                    for command in fn(node)]
+
+        def _callback(node, line):
+            log_handler("[{}] {}".format(node, line))
+        callback = _callback if log_handler else None
+
+        results = tools.run_chains({node: _chain(node) for node in nodes},
+                                   callback, concurrency, timeout)
+
+        # exit status 255 is ssh failing to connect, possibly with a stale config
+        stale = [node for node in nodes
+                 if results[node] and results[node][-1].returncode == 255
+                 and node not in self._ssh_config_fresh]
+        for node in list(stale):
+            try:
+                self._refresh_ssh_config(node)
+            except (CmdException, VagrantSshConfigNoHostName) as error:
+                Log.debug("Could not refresh ssh config of node {}: {}".format(node, error))
+                stale.remove(node)
+        if stale:
+            results.update(tools.run_chains({node: _chain(node) for node in stale},
+                                            callback, concurrency, timeout))
+
+        node_results = {node: NodeResult(node, results[node]) for node in nodes}
+        if check and not all(result.ok for result in node_results.values()):
+            raise CommandsFailed([command_result for node in nodes
+                                  for command_result in results[node]])
+        return node_results
+
+    def _retry_on_ssh_failure(self, name, run):
+        """
+        Call run(), which connects to node "name" using its cached ssh config,
+        and return its result. If ssh fails to connect (exit status 255, either
+        raised in a CmdException or returned), refresh the ssh config of the
+        node and call run() once more.
+        """
+        try:
+            result = run()
+            if result != 255 or name in self._ssh_config_fresh:
+                return result
+        except CmdException as error:
+            if error.retcode != 255 or name in self._ssh_config_fresh:
+                raise
+        Log.info("Could not connect to node {} of deployment {}: refreshing its ssh config"
+                 .format(name, self.dep_id))
+        self._refresh_ssh_config(name)
+        return run()
 
     @staticmethod
     def _parse_source_destination(source, destination):
@@ -1290,8 +2132,72 @@ deployment might not be completely destroyed.
             ]
         return retval
 
-    def _ssh_cmd(self, name, command=None):
-        # type: (str, Iterable[str]) -> List[str]
+    @property
+    def _ssh_mux_dir(self):
+        """
+        Directory holding the ControlMaster sockets of the deployment: "mux" in
+        the deployment directory, unless that path is too long for a Unix
+        socket
+        """
+        mux_dir = os.path.join(self._dep_dir, 'mux')
+        if len(mux_dir) > Constant.SSH_CONTROL_DIR_MAX_LENGTH:
+            mux_dir = os.path.join(
+                tempfile.gettempdir(),
+                'sesdev-mux-{}'.format(os.getuid()),
+                hashlib.sha1(self._dep_dir.encode('utf-8')).hexdigest()[:12]
+            )
+        return mux_dir
+
+    def _ssh_mux_options(self, name, string=False):
+        """
+        ssh options to share one master connection per node (and process
+        tree), as long as the "ssh_control_persist" setting allows
+        """
+        persist = self.settings.ssh_control_persist
+        if not persist or persist == 'no':
+            return '' if string else []
+        os.makedirs(self._ssh_mux_dir, mode=0o700, exist_ok=True)
+        control_path = os.path.join(self._ssh_mux_dir, name)
+        if string:
+            return (
+                " -o 'ControlMaster auto'"
+                " -o 'ControlPath {}'"
+                " -o 'ControlPersist {}'"
+            ).format(control_path, persist)
+        return [
+            "-o", "ControlMaster auto",
+            "-o", "ControlPath {}".format(control_path),
+            "-o", "ControlPersist {}".format(persist),
+        ]
+
+    def close_ssh_masters(self, name=None):
+        """
+        Close the ssh master connections (including tunnels) to node "name",
+        or to all nodes. Returns the number of connections closed.
+        """
+        mux_dir = self._ssh_mux_dir
+        if not os.path.isdir(mux_dir):
+            return 0
+        closed = 0
+        for socket_name in sorted(os.listdir(mux_dir)):
+            if name and socket_name != name \
+                    and not socket_name.startswith('tunnel-{}-'.format(name)):
+                continue
+            control_path = os.path.join(mux_dir, socket_name)
+            try:
+                tools.run_sync(["ssh", "-O", "exit",
+                                "-o", "ControlPath {}".format(control_path),
+                                socket_name])
+                closed += 1
+            except CmdException as error:
+                Log.debug("Removing stale ssh control socket {}: {}"
+                          .format(control_path, error))
+                if os.path.exists(control_path):
+                    os.remove(control_path)
+        return closed
+
+    def _ssh_cmd(self, name, command=None, mux=True):
+        # type: (str, Iterable[str], bool) -> List[str]
         (address, proxycmd, dep_private_key) = self._vagrant_ssh_config(name)
         _cmd = [
             "ssh",
@@ -1299,6 +2205,8 @@ deployment might not be completely destroyed.
             "-i", dep_private_key
         ]
         _cmd.extend(self.__boilerplate_ssh_options())
+        if mux:
+            _cmd.extend(self._ssh_mux_options(name))
         if proxycmd is not None:
             _cmd.extend(["-o", "ProxyCommand={}".format(proxycmd)])
         if command:
@@ -1308,10 +2216,11 @@ deployment might not be completely destroyed.
 
     def ssh(self, name, command, interactive):
         if interactive:
-            return tools.run_interactive(self._ssh_cmd(name, command))
+            return self._retry_on_ssh_failure(
+                name, lambda: tools.run_interactive(self._ssh_cmd(name, command)))
 
         try:
-            out = tools.run_sync(self._ssh_cmd(name, command))
+            out = self.sync_ssh(name, command)
             print("{}".format(out))
             return_code = 0
         except CmdException as excp:
@@ -1319,12 +2228,55 @@ deployment might not be completely destroyed.
             return_code = excp.retcode
         return return_code
 
+    def _ssh_probe(self, name, command='true'):
+        """
+        Run "command" on node "name" over a new SSH connection. Returns
+        whether it succeeded.
+        """
+        try:
+            return subprocess.run(
+                self._ssh_cmd(name, ['-o', 'ConnectTimeout=5', command], mux=False),
+                stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                timeout=30, check=False
+            ).returncode == 0
+        except subprocess.TimeoutExpired:
+            return False
+
+    def _wait_for_ssh(self, name, timeout):
+        """
+        Wait up to "timeout" seconds for node "name" to answer over SSH,
+        probing it more and more rarely. Without a proxy command, the SSH port
+        is probed first, which is cheaper than logging in. Returns whether the
+        node answered.
+        """
+        deadline = time.monotonic() + timeout
+        (address, proxycmd, _) = self._vagrant_ssh_config(name)
+        if proxycmd is None and \
+                not tools.backoff(lambda: tools.ssh_banner(address), timeout):
+            return False
+        return tools.backoff(lambda: self._ssh_probe(name),
+                             max(deadline - time.monotonic(), 0))
+
+    def _wait_for_nodes(self, names, log_handler):
+        """
+        Wait for nodes "names" to answer over SSH, raising NodesNotReady for
+        the ones that do not within Constant.SSH_READY_TIMEOUT_IN_SECONDS
+        """
+        log_handler("Waiting for nodes {} of deployment {}\n"
+                    .format(', '.join(names), self.dep_id))
+        ready = tools.parallel_map(
+            lambda name: self._wait_for_ssh(name, Constant.SSH_READY_TIMEOUT_IN_SECONDS),
+            names, len(names))
+        not_ready = [name for (name, is_ready) in zip(names, ready) if not is_ready]
+        if not_ready:
+            raise NodesNotReady(not_ready, self.dep_id)
+
     def sync_ssh(self, name, command):
         # type: (str, Iterable[str]) -> str
-        return tools.run_sync(
+        return self._retry_on_ssh_failure(name, lambda: tools.run_sync(
             self._ssh_cmd(name, command),
             self._dep_dir
-        )
+        ))
 
     def _scp_cmd(self, source, destination, recurse=False):
         (host_is_source,
@@ -1340,6 +2292,7 @@ deployment might not be completely destroyed.
             _cmd.extend(['-r'])
         _cmd.extend(["-i", dep_private_key])
         _cmd.extend(self.__boilerplate_ssh_options())
+        _cmd.extend(self._ssh_mux_options(name))
         if proxycmd is not None:
             _cmd.extend(["-o", "ProxyCommand={}".format(proxycmd)])
         if host_is_source:
@@ -1350,7 +2303,11 @@ deployment might not be completely destroyed.
         return _cmd
 
     def scp(self, source, destination, recurse=False):
-        tools.run_interactive(self._scp_cmd(source, destination, recurse=recurse))
+        name = self._parse_source_destination(source, destination)[2]
+        self._retry_on_ssh_failure(
+            name,
+            lambda: tools.run_interactive(self._scp_cmd(source, destination, recurse=recurse))
+        )
 
     def _rsync_cmd(self, source, destination, excludes=None, recurse=False):
         (host_is_source,
@@ -1370,9 +2327,10 @@ deployment might not be completely destroyed.
         proxycmd_opt = ''
         if proxycmd is not None:
             proxycmd_opt = " -o 'ProxyCommand={}'".format(proxycmd)
-        _cmd.extend(["-e", "ssh -i {}{}{}".format(
+        _cmd.extend(["-e", "ssh -i {}{}{}{}".format(
             dep_private_key,
             self.__boilerplate_ssh_options(string=True),
+            self._ssh_mux_options(name, string=True),
             proxycmd_opt
         )])
         if host_is_source:
@@ -1383,7 +2341,12 @@ deployment might not be completely destroyed.
         return _cmd
 
     def rsync(self, source, destination, excludes=None, recurse=False):
-        tools.run_interactive(self._rsync_cmd(source, destination, excludes, recurse=recurse))
+        name = self._parse_source_destination(source, destination)[2]
+        self._retry_on_ssh_failure(
+            name,
+            lambda: tools.run_interactive(
+                self._rsync_cmd(source, destination, excludes, recurse=recurse))
+        )
 
     def supportconfig(self, log_handler, name):
         if self.settings.os.startswith("sle"):
@@ -1417,48 +2380,43 @@ deployment might not be completely destroyed.
         ssh_cmd = ('rm', '/var/log/{}'.format(glob_to_get),)
         self.ssh(name, ssh_cmd, False)
 
-    def user_provision(self, node=None):
+    def user_provision(self, node=None, log_handler=None):
+        """
+        Copy ~/.sesdev/.user_provision/config/* to /root, and copy and run
+        ~/.sesdev/.user_provision/provision.sh, on node "node" (or on all nodes
+        concurrently)
+        """
         custom_provision_dir = os.path.join(Constant.A_WORKING_DIR, '.user_provision')
-
-        def copy_root_home_config(node):
-            """Copy files from ~/.sesdev/.user_provision/config/* to /root on the VM"""
-            custom_config_dir = os.path.join(custom_provision_dir, 'config')
-            if not os.path.exists(custom_config_dir):
-                msg = '{} does not exist, not copying any custom configs'
-                Log.info(msg.format(custom_config_dir))
-                return
-            Log.info("=> Copying {} to {}:/root/".format(custom_provision_dir, node))
-            self.rsync(
-                '{}/'.format(custom_config_dir),
-                '{}:/root/'.format(node),
-                recurse=True,
-            )
-
-        def call_provision_script(node):
-            """Copy ~/.sesdev/.user_provision/provision.sh on the VM and run it"""
-            provision_script = os.path.join(custom_provision_dir, 'provision.sh')
-            tmp_dir = '/tmp'
-            target_path = '{}/provision.sh'.format(tmp_dir)
-            if not os.path.exists(provision_script):
-                msg = "{} does not exist, not running custom provisioning"
-                Log.info(msg.format(provision_script))
-                return
-            Log.info("=> Copying {} to {}:{}".format(provision_script, node, target_path))
-            self.rsync(
-                provision_script,
-                '{}:{}/'.format(node, tmp_dir),
-            )
-            Log.info("=> Executing {}".format(target_path))
-            self.sync_ssh(node, ('bash', target_path))
+        custom_config_dir = os.path.join(custom_provision_dir, 'config')
+        provision_script = os.path.join(custom_provision_dir, 'provision.sh')
+        tmp_dir = '/tmp'
+        target_path = '{}/provision.sh'.format(tmp_dir)
 
         if not os.path.exists(custom_provision_dir):
             print("nothing to provision, {} does not exist".format(custom_provision_dir))
             return
-
-        nodes = [node] if node else self.nodes
-        for _node in nodes:
-            copy_root_home_config(_node)
-            call_provision_script(_node)
+        if not os.path.exists(custom_config_dir):
+            msg = '{} does not exist, not copying any custom configs'
+            Log.info(msg.format(custom_config_dir))
+        if not os.path.exists(provision_script):
+            msg = "{} does not exist, not running custom provisioning"
+            Log.info(msg.format(provision_script))
+
+        def _provision_commands(_node):
+            commands = []
+            if os.path.exists(custom_config_dir):
+                Log.info("=> Copying {} to {}:/root/".format(custom_provision_dir, _node))
+                commands.append(self._rsync_cmd('{}/'.format(custom_config_dir),
+                                                '{}:/root/'.format(_node),
+                                                recurse=True))
+            if os.path.exists(provision_script):
+                Log.info("=> Copying {} to {}:{}".format(provision_script, _node, target_path))
+                commands.append(self._rsync_cmd(provision_script, '{}:{}/'.format(_node, tmp_dir)))
+                Log.info("=> Executing {} on {}".format(target_path, _node))
+                commands.append('bash {}'.format(target_path))
+            return commands
+
+        self.for_each_node(_provision_commands, [node] if node else None, log_handler=log_handler)
 
     def upgrade(self, log_handler, node, devel_repos=True, to_version='octopus'):
         if node not in self.nodes:
@@ -1474,21 +2432,39 @@ deployment might not be completely destroyed.
         if from_version == 'ses6' and to_version == 'ses7':
             version_combo_ok = True
         if version_combo_ok:
-            tools.run_async(
-                ["vagrant", "provision", node, "--provision-with",
-                 'upgrade-from-{}-to-{}-{}'.format(from_version, to_version, devel_product)],
+            upgrade_cmd = "/home/vagrant/upgrade.sh --from {} --to {}" \
+                .format(from_version, to_version)
+            if devel_repos:
+                upgrade_cmd += " --devel"
+            self._provision_with(
                 log_handler,
-                self._dep_dir
+                'upgrade-from-{}-to-{}-{}'.format(from_version, to_version, devel_product),
+                upgrade_cmd,
+                node
             )
         else:
             raise UpgradeNotSupported(from_version, to_version)
 
+    def _provision_with(self, log_handler, provisioner, command, node=None):
+        """
+        Run one of the provisioners the Vagrantfile defines with run: "never"
+        on node "node" (default: all nodes that have it). The libvirt-native VM
+        engine has no Vagrantfile: it runs the inline "command" of the
+        provisioner as root over SSH instead.
+        """
+        if self.engine:
+            self.for_each_node(lambda _: [command], [node] if node else None,
+                               log_handler=log_handler)
+            return
+        cmd = ["vagrant", "provision"]
+        if node:
+            cmd.append(node)
+        cmd.extend(["--provision-with", provisioner])
+        tools.run_async(cmd, log_handler, self._dep_dir)
+
     def qa_test(self, log_handler):
-        tools.run_async(
-            ["vagrant", "provision", "--provision-with", "qa-test"],
-            log_handler,
-            self._dep_dir
-        )
+        self._provision_with(log_handler, "qa-test", "/home/vagrant/qa-test.sh",
+                             self.master.name if self.master else None)
 
     def add_repo_subcommand(self, custom_repo, update, log_handler):
         if self.settings.version in Constant.CORE_VERSIONS:
@@ -1496,25 +2472,25 @@ deployment might not be completely destroyed.
         else:
             raise SubcommandNotSupportedInVersion('add-repo', self.settings.version)
         if custom_repo:
-            for node_name in self.nodes:
-                priority_opt = ''
-                if custom_repo.priority:
-                    priority_opt = "--priority={} ".format(custom_repo.priority)
-                self.ssh(
-                    node_name,
-                    (
-                        "zypper --non-interactive addrepo --no-gpgcheck --refresh {}{} {}"
-                        .format(priority_opt, custom_repo.url, custom_repo.name)
-                    ).split(),
-                    False
-                )
+            priority_opt = ''
+            if custom_repo.priority:
+                priority_opt = "--priority={} ".format(custom_repo.priority)
+            addrepo_cmd = "zypper --non-interactive addrepo --no-gpgcheck --refresh {}{} {}" \
+                .format(priority_opt, custom_repo.url, custom_repo.name)
+            results = self.for_each_node(lambda _: [addrepo_cmd],
+                                         log_handler=log_handler,
+                                         check=False)
+            for result in results.values():
+                if not result.ok:
+                    Log.warning("Adding repo {} on node {} failed"
+                                .format(custom_repo.name, result.node))
         else:  # no repo given explicitly: use "devel" repo
-            provision_target = "add-devel-repo-and-update" if update else "add-devel-repo"
-            tools.run_async(
-                ["vagrant", "provision", "--provision-with", provision_target],
-                log_handler,
-                self._dep_dir
-            )
+            if update:
+                self._provision_with(log_handler, "add-devel-repo-and-update",
+                                     "/home/vagrant/add-devel-repo.sh --update")
+            else:
+                self._provision_with(log_handler, "add-devel-repo",
+                                     "/home/vagrant/add-devel-repo.sh")
 
     def _find_service_node(self, service):
         nodes = [name for name, node in self.nodes.items() if service in node.roles]
@@ -1618,8 +2594,13 @@ deployment might not be completely destroyed.
 
         if not remote_address:
             remote_address = self.nodes[node].fqdn
-        ssh_cmd = self._ssh_cmd(node)
-        ssh_cmd.extend(["-M", "-S", "{}-admin-socket".format(self.dep_id), "-fNT", "-L",
+        # The tunnel gets a master connection of its own, so that it does not
+        # go away when the node's shared connection reaches ControlPersist.
+        # "sesdev ssh --close-masters" closes it.
+        os.makedirs(self._ssh_mux_dir, mode=0o700, exist_ok=True)
+        control_path = os.path.join(self._ssh_mux_dir, 'tunnel-{}-{}'.format(node, local_port))
+        ssh_cmd = self._ssh_cmd(node, mux=False)
+        ssh_cmd.extend(["-M", "-S", control_path, "-fNT", "-L",
                         "{}:{}:{}:{}".format(local_address, local_port, remote_address,
                                              remote_port)])
         print("You can now access the service in: {}".format(service_url))
@@ -1638,33 +2619,21 @@ deployment might not be completely destroyed.
                        recurse=True)
 
         print("Installing ceph-salt...")
-        ssh_cmd = self._ssh_cmd(master_node)
-        ssh_cmd.append("cp -r {}/ceph-salt-formula/salt/* /srv/salt/".format(ceph_salt_src))
-        tools.run_sync(ssh_cmd)
+        self.sync_ssh(master_node,
+                      ["cp -r {}/ceph-salt-formula/salt/* /srv/salt/".format(ceph_salt_src)])
 
-        ssh_cmd = self._ssh_cmd(master_node)
-        ssh_cmd.append("zypper --non-interactive refresh")
-        tools.run_sync(ssh_cmd)
+        self.sync_ssh(master_node, ["zypper --non-interactive refresh"])
 
-        ssh_cmd = self._ssh_cmd(master_node)
-        ssh_cmd.append("zypper --non-interactive install python3-pip")
-        tools.run_sync(ssh_cmd)
+        self.sync_ssh(master_node, ["zypper --non-interactive install python3-pip"])
 
-        ssh_cmd = self._ssh_cmd(master_node)
-        ssh_cmd.append("zypper --non-interactive remove ceph-salt ceph-salt-formula || true")
-        tools.run_sync(ssh_cmd)
+        self.sync_ssh(master_node,
+                      ["zypper --non-interactive remove ceph-salt ceph-salt-formula || true"])
 
-        ssh_cmd = self._ssh_cmd(master_node)
-        ssh_cmd.append("pip install --prefix /usr {}".format(ceph_salt_src))
-        tools.run_sync(ssh_cmd)
+        self.sync_ssh(master_node, ["pip install --prefix /usr {}".format(ceph_salt_src)])
 
-        ssh_cmd = self._ssh_cmd(master_node)
-        ssh_cmd.append("salt '*' saltutil.sync_all")
-        tools.run_sync(ssh_cmd)
+        self.sync_ssh(master_node, ["salt '*' saltutil.sync_all"])
 
-        ssh_cmd = self._ssh_cmd(master_node)
-        ssh_cmd.append("salt-run saltutil.sync_runners")
-        tools.run_sync(ssh_cmd)
+        self.sync_ssh(master_node, ["salt-run saltutil.sync_runners"])
 
     def replace_mgr_modules(self, local=None, pr=None, branch=None, repo=None, langs=None):
         if self.settings.version in ['nautilus', 'ses6', 'octopus', 'ses7', 'ses7p', 'pacific']:
@@ -1689,16 +2658,13 @@ deployment might not be completely destroyed.
                 mgr_nodes.append(_node.name)
 
         print("Disabling modules...")
-        ssh_cmd = self._ssh_cmd(mgr_nodes[0])
-        ssh_cmd.append("ceph mgr module ls | jq -r '.enabled_modules | .[]'")
-        modules = tools.run_sync(ssh_cmd)
+        modules = self.sync_ssh(mgr_nodes[0],
+                                ["ceph mgr module ls | jq -r '.enabled_modules | .[]'"])
         if modules:
             modules = modules.strip().split('\n')
         print("{}".format(modules))
         for module in modules:
-            ssh_cmd = self._ssh_cmd(mgr_nodes[0])
-            ssh_cmd.append("ceph mgr module disable {}".format(module))
-            tools.run_sync(ssh_cmd)
+            self.sync_ssh(mgr_nodes[0], ["ceph mgr module disable {}".format(module)])
 
         print("Fetching...")
         # Fetch mgr modules
@@ -1706,9 +2672,7 @@ deployment might not be completely destroyed.
             local_path = "{}/src/pybind/mgr".format(local)
             master_path = "/root/local/ceph/src/pybind"
 
-            ssh_cmd = self._ssh_cmd(master_node)
-            ssh_cmd.append("rm -rf {0} && mkdir -p {0}".format(master_path))
-            tools.run_sync(ssh_cmd)
+            self.sync_ssh(master_node, ["rm -rf {0} && mkdir -p {0}".format(master_path)])
 
             self.rsync(local_path,
                        '{}:{}'.format(master_node, master_path),
@@ -1728,8 +2692,7 @@ deployment might not be completely destroyed.
             if "//" not in repo:
                 repo = "https://github.com/{0}/ceph.git".format(repo)
 
-            ssh_cmd = self._ssh_cmd(master_node)
-            ssh_cmd.append(
+            self.sync_ssh(master_node, [
                 "cd ~/ && \
                 [ -d 'remote' ] || mkdir remote && \
                 cd remote && \
@@ -1738,8 +2701,7 @@ deployment might not be completely destroyed.
                 git checkout master && \
                 git fetch --depth 1 {0} {1}:{2} -f && \
                 git checkout {2}"
-                .format(repo, remote_branch, local_branch))
-            tools.run_sync(ssh_cmd)
+                .format(repo, remote_branch, local_branch)])
 
             print("Building...")
             npm_build = "build:localize"
@@ -1748,8 +2710,7 @@ deployment might not be completely destroyed.
                 npm_build = "build"
                 node_version = "10.18.1"
 
-            ssh_cmd = self._ssh_cmd(master_node)
-            ssh_cmd.append(
+            self.sync_ssh(master_node, [
                 "cd ~/ && \
                 zypper -n in python3-pip && \
                 pip install nodeenv && \
@@ -1761,8 +2722,7 @@ deployment might not be completely destroyed.
                 npm ci --unsafe-perm && \
                 npm run {} && \
                 rm -rf node_modules"
-                .format(node_version, master_path, langs, npm_build))
-            tools.run_sync(ssh_cmd)
+                .format(node_version, master_path, langs, npm_build)])
 
         # Fetch bin/cephadm
         if self.settings.deployment_tool == 'cephadm':
@@ -1770,9 +2730,8 @@ deployment might not be completely destroyed.
                 local_cephadm_path = "{}/src/cephadm".format(local)
                 master_cephadm_path = "/root/local/ceph/src/cephadm"
 
-                ssh_cmd = self._ssh_cmd(master_node)
-                ssh_cmd.append("rm -rf {0} && mkdir -p {0}".format(master_cephadm_path))
-                tools.run_sync(ssh_cmd)
+                self.sync_ssh(master_node,
+                              ["rm -rf {0} && mkdir -p {0}".format(master_cephadm_path)])
 
                 self.rsync('{}/cephadm'.format(local_cephadm_path),
                            '{}:{}'.format(master_node, '{}/cephadm'.format(master_cephadm_path)))
@@ -1783,24 +2742,19 @@ deployment might not be completely destroyed.
 
             # Copy bin/cephadm
             if self.settings.deployment_tool == 'cephadm':
-                ssh_cmd = self._ssh_cmd(node)
-                ssh_cmd.append('podman ps --format "{}" -f label=ceph=True'.format("{{.ID}}"))
-                containers = tools.run_sync(ssh_cmd)
+                containers = self.sync_ssh(
+                    node, ['podman ps --format "{}" -f label=ceph=True'.format("{{.ID}}")])
                 containers = containers.strip()
                 containers = containers.split('\n') if containers else []
 
                 print("Copying cephadm to node {}".format(node))
-                ssh_cmd = self._ssh_cmd(master_node)
-                ssh_cmd.append("scp {}/cephadm {}:/usr/sbin/cephadm"
-                               .format(master_cephadm_path, node))
-                tools.run_sync(ssh_cmd)
+                self.sync_ssh(master_node, ["scp {}/cephadm {}:/usr/sbin/cephadm"
+                                            .format(master_cephadm_path, node)])
 
                 for container in containers:
                     print("Copying cephadm to the container {}".format(container))
-                    ssh_cmd = self._ssh_cmd(node)
-                    ssh_cmd.append("podman cp /usr/sbin/cephadm {}:/usr/sbin/cephadm"
-                                   .format(container))
-                    tools.run_sync(ssh_cmd)
+                    self.sync_ssh(node, ["podman cp /usr/sbin/cephadm {}:/usr/sbin/cephadm"
+                                         .format(container)])
 
             if node not in mgr_nodes:
                 continue
@@ -1808,44 +2762,31 @@ deployment might not be completely destroyed.
             # Copy mgr modules
             if self.settings.version in ['nautilus', 'ses6']:
                 print("Copying mgr modules to node {}".format(node))
-                ssh_cmd = self._ssh_cmd(master_node)
-                ssh_cmd.append("scp -r {}/mgr/ {}:/usr/share/ceph/"
-                               .format(master_path, node))
-                tools.run_sync(ssh_cmd)
+                self.sync_ssh(master_node, ["scp -r {}/mgr/ {}:/usr/share/ceph/"
+                                            .format(master_path, node)])
             else:
 
-                ssh_cmd = self._ssh_cmd(node)
-                ssh_cmd.append('podman ps --format "{}" -f name=mgr.{}'.format("{{.ID}}", node))
-                containers = tools.run_sync(ssh_cmd)
+                containers = self.sync_ssh(
+                    node, ['podman ps --format "{}" -f name=mgr.{}'.format("{{.ID}}", node)])
                 containers = containers.strip()
                 containers = containers.split('\n') if containers else []
 
                 print("Copying mgr modules to node {}".format(node))
-                ssh_cmd = self._ssh_cmd(node)
-                ssh_cmd.append("rm -rf ~/mgr")
-                tools.run_sync(ssh_cmd)
+                self.sync_ssh(node, ["rm -rf ~/mgr"])
 
-                ssh_cmd = self._ssh_cmd(master_node)
-                ssh_cmd.append("scp -r {}/mgr/ {}:~/".format(master_path, node))
-                tools.run_sync(ssh_cmd)
+                self.sync_ssh(master_node, ["scp -r {}/mgr/ {}:~/".format(master_path, node)])
 
                 for container in containers:
                     print("Copying mgr modules to the container {}".format(container))
-                    ssh_cmd = self._ssh_cmd(node)
-                    ssh_cmd.append("podman exec {}".format(container))
-                    ssh_cmd.append("rm -rf /usr/share/ceph/mgr/dashboard/frontend/dist/")
-                    tools.run_sync(ssh_cmd)
+                    self.sync_ssh(node, ["podman exec {}".format(container),
+                                         "rm -rf /usr/share/ceph/mgr/dashboard/frontend/dist/"])
 
-                    ssh_cmd = self._ssh_cmd(node)
-                    ssh_cmd.append("podman cp ~/mgr {}:/usr/share/ceph/"
-                                   .format(container))
-                    tools.run_sync(ssh_cmd)
+                    self.sync_ssh(node, ["podman cp ~/mgr {}:/usr/share/ceph/"
+                                         .format(container)])
 
         print("Enabling modules...")
         for module in modules:
-            ssh_cmd = self._ssh_cmd(mgr_nodes[0])
-            ssh_cmd.append("ceph mgr module enable {}".format(module))
-            tools.run_sync(ssh_cmd)
+            self.sync_ssh(mgr_nodes[0], ["ceph mgr module enable {}".format(module)])
 
     def list_repos(self):
         """
@@ -1867,15 +2808,8 @@ deployment might not be completely destroyed.
 
         zypper_cmd = "zypper -t lr -N -U -a -u -p"
 
-        repos = {}
-        for node in self.nodes:
-            ssh_cmd = self._ssh_cmd(node)
-            ssh_cmd.append(zypper_cmd)
-            raw_repo_list = tools.run_sync(ssh_cmd)
-
-            repos[node] = _to_repo_list(raw_repo_list)
-
-        return repos
+        results = self.for_each_node(lambda _: [zypper_cmd])
+        return {node: _to_repo_list(result.output) for (node, result) in results.items()}
 
     def list_packages(self, repos=None):
         """
@@ -1906,15 +2840,8 @@ deployment might not be completely destroyed.
             for repo in repos:
                 zypper_cmd += f" -r {repo}"
 
-        packages = {}
-        for node in self.nodes:
-            ssh_cmd = self._ssh_cmd(node)
-            ssh_cmd.append(zypper_cmd)
-            raw_package_list = tools.run_sync(ssh_cmd)
-
-            packages[node] = _to_package_list(raw_package_list)
-
-        return packages
+        results = self.for_each_node(lambda _: [zypper_cmd])
+        return {node: _to_package_list(result.output) for (node, result) in results.items()}
 
     def list_versions(self):
         """
@@ -1923,42 +2850,109 @@ deployment might not be completely destroyed.
         """
         cmd = "ceph versions"
         node = list(self.nodes.keys())[0]
-        ssh_cmd = self._ssh_cmd(node)
-        ssh_cmd.append(cmd)
-        raw_json = tools.run_sync(ssh_cmd)
+        raw_json = self.sync_ssh(node, [cmd])
         versions = json.loads(raw_json)
         return versions
 
-    # This is the "real" constructor
     @classmethod
-    def create(cls, dep_id, log_handler, settings):
+    def prepare(cls, dep_id, settings):
+        """
+        Return the Deployment object of new deployment "dep_id", not saved yet
+        """
         dep_dir = os.path.join(Constant.A_WORKING_DIR, dep_id)
         if os.path.exists(dep_dir):
             raise DeploymentAlreadyExists(dep_id)
-        dep = cls(dep_id, settings)
+        return cls(dep_id, settings)
+
+    # This is the "real" constructor
+    @classmethod
+    def create(cls, dep_id, log_handler, settings):
+        dep = cls.prepare(dep_id, settings)
         Log.info("creating new deployment: {}".format(dep))
         dep.save(log_handler)
         return dep
 
     @classmethod
-    def load(cls, dep_id, load_status=True) -> 'Deployment':
-        dep_dir = os.path.join(Constant.A_WORKING_DIR, dep_id)
-        if not os.path.exists(dep_dir) or not os.path.isdir(dep_dir):
-            Log.debug("->{}<- does not exist or is not a directory"
-                      .format(dep_dir))
-            raise DeploymentDoesNotExists(dep_id)
-
-        metadata_file = os.path.join(dep_dir, Constant.METADATA_FILENAME)
-        if not os.path.exists(metadata_file) or not os.path.isfile(metadata_file):
-            Log.debug("metadata file ->{}<- does not exist or is not a file"
-                      .format(metadata_file))
-            raise DeploymentDoesNotExists(dep_id)
-        with open(metadata_file, 'r', encoding='utf-8') as file:
-            metadata = json.load(file)
+    def create_many(cls, deps, log_handler):
+        """
+        Create and bring up the new deployments "deps" (see prepare()) all at
+        once. The Vagrant Box of each OS is fetched only once, by the first
+        deployment that needs it, and the others are saved after that. All of
+        them are then brought up concurrently, as the libvirt host has room for
+        them (see admitted()), and get the user's provisioning (see
+        user_provision()), just like with "sesdev create". The output of each goes to
+        "log_handler", prefixed with its ID. Returns a dict mapping each
+        deployment ID to its result: a dict with the "status" ("running" or
+        "failed"), the "stage" that failed and its "error", and the "seconds"
+        it took.
+        """
+        results = {dep.dep_id: {'status': 'running', 'stage': None, 'error': None, 'seconds': 0}
+                   for dep in deps}
+        started = time.monotonic()
+
+        def _log(dep):
+            def _handler(output):
+                for line in output.splitlines(True):
+                    log_handler("[{}] {}".format(dep.dep_id, line))
+            return _handler
+
+        def _stage(stage, run):
+            def _run(dep):
+                result = results[dep.dep_id]
+                if result['error']:
+                    return
+                try:
+                    run(dep, _log(dep))
+                except (SesDevException, libvirt.libvirtError, OSError) as error:
+                    Log.error("Deployment {}: {} failed: {}".format(dep.dep_id, stage, error))
+                    result.update(status='failed', stage=stage, error=str(error))
+                result['seconds'] = round(time.monotonic() - started)
+            return _run
+
+        def _start(dep, handler):
+            with dep.admitted(handler):
+                dep.start(handler)
+
+        by_os = {}
+        for dep in deps:
+            by_os.setdefault(dep.settings.os, []).append(dep)
+        save = _stage('save', lambda dep, handler: dep.save(handler))
+        tools.parallel_map(save, [group[0] for group in by_os.values()])
+        tools.parallel_map(save, [dep for group in by_os.values() for dep in group[1:]])
+        tools.parallel_map(_stage('start', _start), deps, jobs=len(deps))
+        tools.parallel_map(
+            _stage('user-provision', lambda dep, handler: dep.user_provision(log_handler=handler)),
+            deps, jobs=len(deps))
+        return results
+
+    @classmethod
+    def bake_image(cls, log_handler, settings):
+        """
+        Bake the base image for settings.version and settings.os (see
+        Deployment.bake()) with a throwaway deployment
+        """
+        os_name = settings.os if settings.os else \
+            Constant.VERSION_PREFERRED_OS[settings.version]
+        if settings.version not in Constant.CORE_VERSIONS or \
+                Constant.OS_PACKAGE_MANAGER_MAPPING[os_name] != 'zypper':
+            raise ImageBakingNotSupported(settings.version, os_name)
+        settings.override('vm_engine', 'libvirt-native')
+        settings.override('use_baked_image', False)
+        settings.override('roles', [['master']])
+        dep = cls.create('bake-{}-{}'.format(settings.version, os_name.replace('.', '-')),
+                         log_handler, settings)
+        try:
+            return dep.bake(log_handler)
+        finally:
+            dep.destroy(log_handler)
+
+    @classmethod
+    def load(cls, dep_id, load_status=True, domain_states=None) -> 'Deployment':
+        metadata = _read_metadata(dep_id)
         try:
             dep = cls(metadata['id'], Settings(strict=False, **metadata['settings']), existing=True)
             if load_status:
-                dep.load_status()
+                dep.load_status(domain_states)
             return dep
 
         except (AttributeError, TypeError) as error:
@@ -1970,25 +2964,164 @@ deployment might not be completely destroyed.
         curframe = inspect.currentframe()
         calframe = inspect.getouterframes(curframe, 2)
         Log.debug("Entering deployment.list (called from ->{}<-)".format(calframe[1][3]))
+        domain_states = {}
+
+        def _load(dep_id):
+            try:
+                return Deployment.load(dep_id, load_status, domain_states)
+            except (DeploymentDoesNotExists, DeploymentIncompatible) as error:
+                return error
+
+        dep_ids = [record.dep_id for record in DeploymentRecord.list()]
         deps = []
-        if not os.path.exists(Constant.A_WORKING_DIR):
-            return deps
-        dir_listing = os.listdir(Constant.A_WORKING_DIR)
-        Log.debug("Listing of directory {}: {}".format(
-            Constant.A_WORKING_DIR,
-            dir_listing))
-        for dep_id in dir_listing:
-            Log.debug("Considering deployment ->{}<-".format(dep_id))
-            full_path = os.path.join(Constant.A_WORKING_DIR, dep_id)
-            if not os.path.isdir(full_path):
-                Log.debug("Skipping ->{}<- (obviously not a deployment)".format(dep_id))
+        for dep_id, result in zip(dep_ids, tools.parallel_map(_load, dep_ids)):
+            if isinstance(result, DeploymentDoesNotExists):
+                continue
+            if isinstance(result, DeploymentIncompatible):
+                Log.warning(
+                    f'Deployment {dep_id} is incompatible with the current version of sesdev'
+                )
+                continue
+            deps.append(result)
+        return deps
+
+    @classmethod
+    def load_many(cls, dep_ids, load_status=True) -> List['Deployment']:
+        """
+        Load several deployments concurrently (on up to Constant.JOBS threads).
+        Returns them in the order of "dep_ids"; raises what Deployment.load()
+        raises for the first of them that fails to load.
+        """
+        domain_states = {}
+        return tools.parallel_map(
+            lambda dep_id: cls.load(dep_id, load_status, domain_states),
+            dep_ids
+        )
+
+
+class DeploymentRecord():
+    """
+    Read-only view of an existing deployment: only what was parsed from its
+    metadata file, plus the node names and addresses derived from it. Loading a
+    record spawns no subprocesses; node status and the full Deployment object
+    are loaded only when asked for.
+    """
+
+    def __init__(self, dep_id, settings):
+        self.dep_id = dep_id
+        self.settings = settings
+        self.domain = self.settings.domain.format(self.dep_id)
+        self.public_network_segment = "{}0/24".format(self.settings.public_network) \
+            if self.settings.public_network else None
+        self.cluster_network_segment = "{}0/24".format(self.settings.cluster_network) \
+            if self.settings.cluster_network else None
+        self.nodes = {}
+        for (name, fqdn, roles, public_address, cluster_address) in \
+                _node_layout(self.settings, self.domain):
+            self.nodes[name] = Node(name,
+                                    fqdn,
+                                    roles,
+                                    '',
+                                    public_address=public_address,
+                                    cluster_address=cluster_address)
+        self.node_list = ','.join(self.nodes.keys())
+        self._deployment = None
+
+    def __str__(self):
+        return self.dep_id
+
+    @property
+    def _dep_dir(self):
+        return os.path.join(Constant.A_WORKING_DIR, self.dep_id)
+
+    @property
+    def deployment(self) -> Deployment:
+        """
+        The full Deployment object, constructed on first access
+        """
+        if self._deployment is None:
+            self._deployment = Deployment.load(self.dep_id, load_status=False)
+        return self._deployment
+
+    def load_status(self, domain_states=None):
+        """
+        Load the current status of the nodes. Nodes whose status cannot be had
+        (their libvirt host being unreachable, say) get the last-known one
+        from the state index, with "status_updated" set to when it was
+        recorded.
+        """
+        _load_status(self.dep_id, self._dep_dir, self.settings, self.nodes, domain_states)
+        unknown = [node for node in self.nodes.values() if node.status in (None, 'unknown')]
+        if not unknown:
+            return
+        last_known = _state_store().node_statuses(self.dep_id)
+        for node in unknown:
+            (status, updated) = last_known.get(node.name, (None, None))
+            if status:
+                Log.debug("Status of node {} of deployment {} unknown: using the last-known one"
+                          .format(node.name, self.dep_id))
+                (node.status, node.status_updated) = (status, updated)
+
+    @classmethod
+    def _from_metadata(cls, dep_id, metadata) -> 'DeploymentRecord':
+        try:
+            return cls(metadata['id'], Settings(strict=False, **metadata['settings']))
+        except (AttributeError, KeyError, TypeError) as error:
+            Log.debug(error)
+            raise DeploymentIncompatible(dep_id) from error
+
+    @classmethod
+    def load(cls, dep_id, load_status=False) -> 'DeploymentRecord':
+        record = cls._from_metadata(dep_id, _read_metadata(dep_id))
+        if load_status:
+            record.load_status()
+        return record
+
+    @classmethod
+    def list(cls, load_status=False, pattern=None) -> List['DeploymentRecord']:
+        """
+        Return the records of all deployments in the state index, optionally
+        only those whose ID matches the glob "pattern"
+        """
+        records = []
+        domain_states = {}
+        for metadata in _state_store().deployments(pattern):
+            dep_id = metadata.get('id')
+            if not os.path.isdir(os.path.join(Constant.A_WORKING_DIR, dep_id)):
+                Log.debug("Skipping ->{}<- (in the state index, but its directory is gone)"
+                          .format(dep_id))
+                continue
+            try:
+                record = cls._from_metadata(dep_id, metadata)
+            except DeploymentIncompatible:
+                Log.warning(
+                    f'Deployment {dep_id} is incompatible with the current version of sesdev'
+                )
                 continue
+            records.append(record)
+        if load_status:
+            tools.parallel_map(lambda record: record.load_status(domain_states), records)
+        return records
+
+    @classmethod
+    def reindex(cls, store=None) -> List['DeploymentRecord']:
+        """
+        Rebuild the state index from the deployment directories
+        """
+        store = store if store else StateStore()
+        records = []
+        for dep_id in _deployment_ids():
             try:
-                deps.append(Deployment.load(dep_id, load_status))
+                records.append(cls.load(dep_id))
             except DeploymentDoesNotExists:
                 continue
             except DeploymentIncompatible:
                 Log.warning(
                     f'Deployment {dep_id} is incompatible with the current version of sesdev'
                 )
-        return deps
+        store.reindex([
+            (record.dep_id, {'id': record.dep_id, 'settings': record.settings},
+             record.nodes.values())
+            for record in records
+        ])
+        return records
@@ -0,0 +1,133 @@
+import threading
+
+import libvirt
+
+from . import tools
+from .box import Box
+from .exceptions import NodeDoesNotExist
+from .log import Log
+
+
+class DomainEvents():
+    """
+    A subscription to the domain events of kind "event_id" (lifecycle events
+    by default) of a libvirt host, delivered by the event loop Box runs. It is
+    a context manager, to be entered before starting the operation whose
+    events are waited for, so that none of them is missed. If the host does
+    not deliver events, the wait_*() methods fall back to polling. Given the
+    "uri" of "conn", it subscribes anew when Box re-opens the connection.
+    """
+
+    def __init__(self, conn, event_id=libvirt.VIR_DOMAIN_EVENT_ID_LIFECYCLE, uri=None):
+        self.conn = conn
+        self.event_id = event_id
+        self.uri = uri
+        self.events = []  # (domain name, event), in the order they came in
+        self._cond = threading.Condition()
+        self._callback_id = None
+
+    def _subscribe(self):
+        try:
+            self._callback_id = self.conn.domainEventRegisterAny(
+                None, self.event_id, self._callback, None)
+        except libvirt.libvirtError as error:
+            Log.debug("Cannot subscribe to domain events: {}".format(error))
+
+    def _resubscribe(self, conn):
+        # the callback registered with the dead connection went with it
+        self.conn = conn
+        self._callback_id = None
+        self._subscribe()
+
+    def __enter__(self):
+        self._subscribe()
+        if self.uri:
+            Box.add_reconnect_callback(self.uri, self._resubscribe)
+        return self
+
+    def __exit__(self, *_):
+        if self.uri:
+            Box.remove_reconnect_callback(self.uri, self._resubscribe)
+        if self._callback_id is not None:
+            try:
+                self.conn.domainEventDeregisterAny(self._callback_id)
+            except libvirt.libvirtError as error:
+                Log.debug("Cannot unsubscribe from domain events: {}".format(error))
+            self._callback_id = None
+
+    def _callback(self, _conn, domain, *args):
+        # lifecycle events come with (event, detail, opaque), reboot events
+        # with (opaque) only
+        event = args[0] if len(args) > 1 else None
+        with self._cond:
+            self.events.append((domain.name(), event))
+            self._cond.notify_all()
+
+    def _wait(self, done, timeout):
+        with self._cond:
+            return self._cond.wait_for(lambda: done(self.events), timeout)
+
+    def wait_stopped(self, domains, timeout):
+        """
+        Wait up to "timeout" seconds for "domains" to stop. Returns the ones
+        still running.
+        """
+        pending = {domain.name(): domain for domain in domains if domain.isActive()}
+        if self._callback_id is None:
+            tools.backoff(lambda: not [domain for domain in pending.values()
+                                       if domain.isActive()], timeout)
+        elif pending:
+            self._wait(lambda events: set(pending) <= {
+                name for (name, event) in events if event == libvirt.VIR_DOMAIN_EVENT_STOPPED
+            }, timeout)
+        return [domain for domain in pending.values() if domain.isActive()]
+
+    def wait_for(self, domain, timeout):
+        """
+        Wait up to "timeout" seconds for an event of "domain". Returns False if
+        none came, or none can come.
+        """
+        if self._callback_id is None:
+            return False
+        return self._wait(lambda events: domain.name() in [name for (name, _) in events],
+                          timeout)
+
+
+class DeploymentDomains():
+    """
+    The libvirt domains of the nodes of a deployment, looked up by name
+    ("<dep_id>_<node>", with either VM engine) on the libvirt host of the
+    deployment
+    """
+
+    def __init__(self, dep_id, uri, nodes):
+        self.dep_id = dep_id
+        self.uri = uri
+        self.nodes = list(nodes)
+
+    @classmethod
+    def of(cls, deployment):
+        return cls(deployment.dep_id, Box.libvirt_uri_from_settings(deployment.settings),
+                   deployment.nodes)
+
+    @property
+    def conn(self):
+        return Box.libvirt_connection(self.uri)
+
+    def _domains(self, names=None):
+        """
+        Map nodes "names" (default: all nodes) to their domains
+        """
+        domains = {}
+        for name in names if names else self.nodes:
+            try:
+                domains[name] = self.conn.lookupByName('{}_{}'.format(self.dep_id, name))
+            except libvirt.libvirtError as error:
+                raise NodeDoesNotExist(name, self.dep_id) from error
+        return domains
+
+    def domain(self, name):
+        return self._domains([name])[name]
+
+    def events(self, event_id=libvirt.VIR_DOMAIN_EVENT_ID_LIFECYCLE):
+        return DomainEvents(self.conn, event_id, uri=self.uri)
@@ -45,6 +45,26 @@ class CmdException(SesDevException):
         self.stderr = stderr
 
 
+class CommandsFailed(SesDevException):
+    def __init__(self, results):
+        failed = [result for result in results if result.returncode != 0]
+        super().__init__(
+            "{} of {} commands failed:\n{}".format(
+                len(failed),
+                len(results),
+                '\n'.join(
+                    "{}'{}' {}: {}".format(
+                        "[{}] ".format(result.name) if result.name else '',
+                        ' '.join(result.command),
+                        "timed out" if result.timed_out else "ret={}".format(result.returncode),
+                        result.stderr_tail[-1] if result.stderr_tail else '')
+                    for result in failed)
+            )
+        )
+        self.results = results
+        self.failed = failed
+
+
 class DebugWithoutLogFileDoesNothing(SesDevException):
     def __init__(self):
         super().__init__(
@@ -83,6 +103,14 @@ class DeploymentDoesNotExists(SesDevException):
         )
 
 
+class DeploymentHasClones(SesDevException):
+    def __init__(self, dep_id, clones):
+        super().__init__(
+            "Deployment '{}' has clones, which depend on its disks: {}. Destroy "
+            "them first.".format(dep_id, ', '.join(clones))
+        )
+
+
 class DeploymentIncompatible(SesDevException):
     def __init__(self, dep_id):
         super().__init__(
@@ -90,6 +118,13 @@ class DeploymentIncompatible(SesDevException):
         )
 
 
+class DeploymentNotClonable(SesDevException):
+    def __init__(self, dep_id, reason):
+        super().__init__(
+            "Deployment '{}' cannot be cloned: {}".format(dep_id, reason)
+        )
+
+
 class DuplicateRolesNotSupported(SesDevException):
     def __init__(self, role):
         super().__init__(
@@ -117,6 +152,38 @@ class ExplicitAdminRoleNotAllowed(SesDevException):
         )
 
 
+class HostCapacityExceeded(SesDevException):
+    def __init__(self, dep_id, uri, shortfall):
+        super().__init__(
+            "Libvirt host {} cannot take deployment \"{}\" now: {}"
+            .format(uri, dep_id, shortfall)
+        )
+
+
+class ImageBakingNotSupported(SesDevException):
+    def __init__(self, version, operating_system):
+        super().__init__(
+            "sesdev cannot bake an image for \"{}\" on operating system \"{}\": only "
+            "Ceph versions on zypper-based operating systems are supported"
+            .format(version, operating_system)
+        )
+
+
+class IsoToolNotFound(SesDevException):
+    def __init__(self, tools):
+        super().__init__(
+            "Building an ISO image requires one of these tools, but none was "
+            "found: {}".format(', '.join(tools))
+        )
+
+
+class ManifestInvalid(SesDevException):
+    def __init__(self, manifest, problem):
+        super().__init__(
+            "Manifest {}: {}".format(manifest, problem)
+        )
+
+
 class MultipleRolesPerMachineNotAllowedInCaaSP(SesDevException):
     def __init__(self):
         super().__init__(
@@ -135,6 +202,14 @@ class NodeDoesNotExist(SesDevException):
         )
 
 
+class NodesNotReady(SesDevException):
+    def __init__(self, nodes, deployment_id):
+        super().__init__(
+            "Nodes {} of deployment '{}' did not answer over SSH in time"
+            .format(', '.join(nodes), deployment_id)
+        )
+
+
 class NodeMustBeAdminAsWell(SesDevException):
     def __init__(self, role):
         super().__init__(
@@ -236,6 +311,22 @@ class OptionValueError(SesDevException):
         )
 
 
+class PoolEmpty(SesDevException):
+    def __init__(self, version):
+        super().__init__(
+            "There is no parked deployment in the {} pool to claim (see "
+            "\"sesdev pool fill\")".format(version)
+        )
+
+
+class PoolNotConfigured(SesDevException):
+    def __init__(self, version):
+        super().__init__(
+            "There is no {version} pool yet: create it with "
+            "\"sesdev pool fill {version} --size <N>\"".format(version=version)
+        )
+
+
 class ProductOptionOnlyOnSES(SesDevException):
     def __init__(self, version):
         super().__init__(
@@ -312,6 +403,30 @@ class SettingTypeError(SesDevException):
         )
 
 
+class SnapshotAlreadyExists(SesDevException):
+    def __init__(self, name, deployment_id):
+        super().__init__(
+            "Deployment '{}' already has a snapshot named '{}'"
+            .format(deployment_id, name)
+        )
+
+
+class SnapshotDoesNotExist(SesDevException):
+    def __init__(self, name, deployment_id):
+        super().__init__(
+            "No snapshot named '{}' of all nodes of deployment '{}'"
+            .format(name, deployment_id)
+        )
+
+
+class SnapshotRevertNotSupported(SesDevException):
+    def __init__(self, version):
+        super().__init__(
+            "Restoring a snapshot requires libvirt 9.9.0 or newer, but the libvirt "
+            "host runs libvirt {}".format(version)
+        )
+
+
 class SSHCommandReturnedNonZero(SesDevException):
     def __init__(self, exitcode):
         super().__init__(
@@ -327,6 +442,15 @@ class SubcommandNotSupportedInVersion(SesDevException):
         )
 
 
+class SubnetsExhausted(SesDevException):
+    def __init__(self, kind, first, last):
+        super().__init__(
+            "All {kind} networks from {first} to {last} are taken. Destroy a "
+            "deployment, or set \"{kind}_network\" in the config file"
+            .format(kind=kind, first=first, last=last)
+        )
+
+
 class SupportconfigOnlyOnSLE(SesDevException):
     def __init__(self):
         super().__init__(
@@ -0,0 +1,76 @@
+from xml.etree import ElementTree as ET
+
+from .log import Log
+
+
+class LibvirtInventory():
+    """
+    A snapshot of the storage volumes of one pool, the domains and the networks
+    of a libvirt host, taken with one call each, and indexed by name prefix:
+    the domains and volumes of a deployment are the ones named
+    "<dep_id>_<...>" (deployment IDs cannot contain "_"), the image
+    vagrant-libvirt uploads a Vagrant Box to is "<box_name>_vagrant_box_image_<...>".
+    The networks the domains are attached to are read from their XML the first
+    time they are asked for, and then kept with the snapshot, too.
+    """
+
+    BOX_IMAGE_MARKER = '_vagrant_box_image'
+
+    def __init__(self, conn, pool_name):
+        self.conn = conn
+        self.pool_name = pool_name
+        self.pool = conn.storagePoolLookupByName(pool_name)
+        self.pool.refresh(0)
+        self._volumes_by_deployment = {}
+        self._images_by_box = {}
+        for volume in self.pool.listAllVolumes(0):
+            name = volume.name()
+            (box_name, marker, _) = name.partition(self.BOX_IMAGE_MARKER)
+            if marker:
+                self._images_by_box.setdefault(box_name, []).append(volume)
+            elif '_' in name:
+                self._volumes_by_deployment.setdefault(name.split('_', 1)[0], []).append(volume)
+        self._domains_by_deployment = {}
+        for domain in conn.listAllDomains(0):
+            name = domain.name()
+            if '_' in name:
+                self._domains_by_deployment.setdefault(name.split('_', 1)[0], []).append(domain)
+        self.network_names = set(conn.listNetworks() + conn.listDefinedNetworks())
+        self._domain_networks = {}
+        Log.debug("libvirt inventory: {} deployment(s), {} box image(s), {} network(s)"
+                  .format(len(set(self._volumes_by_deployment) | set(self._domains_by_deployment)),
+                          len(self._images_by_box), len(self.network_names)))
+
+    def volumes(self, dep_id):
+        """The storage volumes (virStorageVol objects) of deployment "dep_id\""""
+        return list(self._volumes_by_deployment.get(dep_id, []))
+
+    def domains(self, dep_id):
+        """The domains (virDomain objects) of deployment "dep_id\""""
+        return list(self._domains_by_deployment.get(dep_id, []))
+
+    def box_images(self, box_name):
+        """The storage volumes holding the image of Vagrant Box "box_name\""""
+        return list(self._images_by_box.get(box_name, []))
+
+    def domain_networks(self, domain):
+        """The names of the networks the interfaces of "domain" are attached to"""
+        name = domain.name()
+        if name not in self._domain_networks:
+            tree = ET.fromstring(domain.XMLDesc(0))
+            self._domain_networks[name] = [
+                source.get('network')
+                for source in tree.findall("./devices/interface[@type='network']/source")
+                if source.get('network')
+            ]
+        return self._domain_networks[name]
+
+    def networks(self, dep_id, exclude=()):
+        """
+        The names of the networks the domains of deployment "dep_id" are
+        attached to, except for the ones in "exclude"
+        """
+        names = set()
+        for domain in self.domains(dep_id):
+            names.update(self.domain_networks(domain))
+        return sorted(names - set(exclude))
@@ -0,0 +1,558 @@
+import base64
+import hashlib
+import json
+import os
+import shutil
+from xml.etree import ElementTree as ET
+
+import libvirt
+
+from . import tools
+from .box import Box
+from .constant import Constant
+from .domains import DomainEvents
+from .exceptions import BoxDoesNotExist, IsoToolNotFound
+from .log import Log
+from .teardown import LibvirtTeardown
+
+
+class LibvirtEngine():
+    """
+    The "libvirt-native" VM engine: drives the VMs of a deployment through
+    libvirt-python, without Vagrant. Each node is a domain named like the ones
+    Vagrant creates ("<dep_id>_<node>"), booting from a qcow2 clone of the
+    Vagrant Box image, on a NAT network of its own ("sesdev-<dep_id>") that
+    hands out the node addresses by DHCP. Nodes are reached over SSH, as the
+    "vagrant" user of the box until they are provisioned.
+    """
+
+    # a node provisioned from a cloud-init seed logs its provisioning here, and
+    # writes the exit status to the marker file when it is done
+    SEED_PROVISION_LOG = '/var/log/sesdev-provision.log'
+    SEED_MARKER = '/var/lib/sesdev/provisioned'
+
+    ISO_TOOLS = ['genisoimage', 'mkisofs', 'xorrisofs']
+
+    def __init__(self, dep_id, dep_dir, settings, nodes, domain_type='kvm'):
+        self.dep_id = dep_id
+        self.dep_dir = dep_dir
+        self.settings = settings
+        self.nodes = nodes
+        self.domain_type = domain_type
+        self.uri = Box.libvirt_uri_from_settings(settings)
+        self.network_name = 'sesdev-{}'.format(dep_id)
+        self.storage_pool_name = (
+            settings.libvirt_storage_pool if settings.libvirt_storage_pool else 'default'
+        )
+        self._conn = None
+
+    @property
+    def conn(self):
+        if self._conn is None or not Box.libvirt_connection_alive(self._conn):
+            self._conn = Box.libvirt_connection(self.uri)
+        return self._conn
+
+    @property
+    def pool(self):
+        return self.conn.storagePoolLookupByName(self.storage_pool_name)
+
+    def domain_name(self, name):
+        return '{}_{}'.format(self.dep_id, name)
+
+    def mac_address(self, name):
+        digest = hashlib.sha1('{}_{}'.format(self.dep_id, name).encode('utf-8')).digest()
+        return '52:54:00:{:02x}:{:02x}:{:02x}'.format(digest[0], digest[1], digest[2])
+
+    def _lookup_domain(self, name):
+        try:
+            return self.conn.lookupByName(self.domain_name(name))
+        except libvirt.libvirtError:
+            return None
+
+    @staticmethod
+    def _lookup_volume(pool, volume_name):
+        try:
+            return pool.storageVolLookupByName(volume_name)
+        except libvirt.libvirtError:
+            return None
+
+    def volume_exists(self, volume_name):
+        return self._lookup_volume(self.pool, volume_name) is not None
+
+    @staticmethod
+    def _render(template_name, **context):
+        template = Constant.JINJA_ENV.get_template('engine/libvirt-native/{}'.format(template_name))
+        return template.render(**context)
+
+    def base_volume(self, box_name):
+        """
+        Return the storage volume holding the image of Vagrant Box "box_name",
+        uploading it to the storage pool if it is not there yet. The volume is
+        named the way vagrant-libvirt names it, so both engines share it.
+        """
+        box_image = Box.box_image(box_name)
+        if not box_image:
+            raise BoxDoesNotExist(box_name)
+        (version, image_path) = box_image
+        volume_name = '{}_vagrant_box_image_{}_box.img'.format(
+            box_name.replace('/', '-VAGRANTSLASH-'), version)
+        pool = self.pool
+        volume = self._lookup_volume(pool, volume_name)
+        if volume:
+            return volume
+
+        capacity = os.path.getsize(image_path)
+        metadata_file = os.path.join(os.path.dirname(image_path), 'metadata.json')
+        try:
+            with open(metadata_file, 'r', encoding='utf-8') as file:
+                capacity = max(capacity, int(json.load(file)['virtual_size']) * 2**30)
+        except (OSError, ValueError, KeyError) as error:
+            Log.debug("Cannot read virtual size of box {} from {}: {}"
+                      .format(box_name, metadata_file, error))
+        Log.info("Uploading image of box {} to storage pool {}"
+                 .format(box_name, self.storage_pool_name))
+        volume = pool.createXML(self._render('volume.xml.j2', name=volume_name,
+                                             capacity=capacity, backing_path=None))
+        self._upload(volume, image_path)
+        return volume
+
+    def _upload(self, volume, path):
+        """
+        Upload the local file "path" to the (new) storage volume "volume",
+        deleting the volume if that fails
+        """
+        stream = self.conn.newStream(0)
+        try:
+            volume.upload(stream, 0, os.path.getsize(path), 0)
+            with open(path, 'rb') as file:
+                stream.sendAll(lambda _stream, nbytes, _file: _file.read(nbytes), file)
+            stream.finish()
+        except BaseException:
+            stream.abort()
+            volume.delete(0)
+            raise
+
+    def define_network(self):
+        """
+        Define and start the NAT network of the deployment, unless it exists
+        """
+        try:
+            network = self.conn.networkLookupByName(self.network_name)
+        except libvirt.libvirtError:
+            hosts = [{'mac': self.mac_address(node.name),
+                      'name': node.name,
+                      'address': node.public_address}
+                     for node in self.nodes.values()]
+            network = self.conn.networkDefineXML(self._render(
+                'network.xml.j2',
+                name=self.network_name,
+                domain=self.settings.domain.format(self.dep_id),
+                public_network=self.settings.public_network,
+                hosts=hosts
+            ))
+            network.setAutostart(True)
+        if not network.isActive():
+            network.create()
+        return network
+
+    def define_domain(self, node, base_volume, seed_volume=None):
+        """
+        Create the volumes of "node" (a qcow2 clone of "base_volume" plus its
+        storage disks) and define its domain, unless it is already defined.
+        "seed_volume", if given, is attached as a CD-ROM.
+        """
+        domain = self._lookup_domain(node.name)
+        if domain:
+            return domain
+        pool = self.pool
+        (_, base_capacity, _) = base_volume.info()
+        volumes = [('{}.img'.format(self.domain_name(node.name)),
+                    base_capacity, base_volume.path(), None)]
+        for (index, disk) in enumerate(node.storage_disks):
+            serial = hashlib.sha1('{}_{}_{}'.format(self.dep_id, node.name, index)
+                                  .encode('utf-8')).hexdigest()[:20]
+            volumes.append(('{}-vd{}.qcow2'.format(self.domain_name(node.name),
+                                                   chr(ord('b') + index)),
+                            disk.size * 2**30, None, serial))
+        disks = []
+        for (index, (volume_name, capacity, backing_path, serial)) in enumerate(volumes):
+            volume = self._lookup_volume(pool, volume_name)
+            if not volume:
+                volume = pool.createXML(self._render('volume.xml.j2', name=volume_name,
+                                                     capacity=capacity,
+                                                     backing_path=backing_path))
+            disks.append({'path': volume.path(),
+                          'dev': 'vd{}'.format(chr(ord('a') + index)),
+                          'serial': serial})
+        return self.conn.defineXML(self._render(
+            'domain.xml.j2',
+            domain_type=self.domain_type,
+            name=self.domain_name(node.name),
+            node=node,
+            disks=disks,
+            network=self.network_name,
+            mac=self.mac_address(node.name),
+            seed=seed_volume.path() if seed_volume else None
+        ))
+
+    def define(self, box_name, master=None, cloud_init_seed=False):
+        """
+        Define the network and all domains of the deployment, with a cloud-init
+        seed for each node if "cloud_init_seed" is set. "master" is the name of
+        the master node. The nodes are clones of the image made by "sesdev
+        bake" if settings.baked_image names one, else of the Vagrant Box.
+        """
+        if self.settings.baked_image:
+            base_volume = self.pool.storageVolLookupByName(self.settings.baked_image)
+        else:
+            base_volume = self.base_volume(box_name)
+        self.define_network()
+        for node in self.nodes.values():
+            seed_volume = None
+            if cloud_init_seed and not self._lookup_domain(node.name):
+                seed_volume = self.build_seed(node.name, node.name == master)
+            self.define_domain(node, base_volume, seed_volume)
+
+    def export_volume(self, name, volume_name):
+        """
+        Copy the system disk of (shut off) node "name" into "volume_name", a
+        new qcow2 volume of the storage pool that does not depend on the Box
+        image the disk is a clone of. Returns the storage volume.
+        """
+        pool = self.pool
+        source = pool.storageVolLookupByName('{}.img'.format(self.domain_name(name)))
+        (_, capacity, _) = source.info()
+        Log.info("Copying the system disk of domain {} to volume {}"
+                 .format(self.domain_name(name), volume_name))
+        return pool.createXMLFrom(self._render('volume.xml.j2', name=volume_name,
+                                               capacity=capacity, backing_path=None),
+                                  source, 0)
+
+    @staticmethod
+    def _domain_disks(domain):
+        """
+        Return the tree of the XML of "domain" and (element, dev, path,
+        serial) of each of its disks that is not a CD-ROM
+        """
+        tree = ET.fromstring(domain.XMLDesc(libvirt.VIR_DOMAIN_XML_INACTIVE))
+        disks = []
+        for disk in tree.findall("./devices/disk[@device='disk']"):
+            source = disk.find('source')
+            if source is None or source.get('file') is None:
+                continue
+            disks.append((source, disk.find('target').get('dev'), source.get('file'),
+                          disk.findtext('serial')))
+        return (tree, disks)
+
+    def _overlay(self, pool, volume_name, backing_path):
+        (_, capacity, _) = self.conn.storageVolLookupByPath(backing_path).info()
+        return pool.createXML(self._render('volume.xml.j2', name=volume_name,
+                                           capacity=capacity, backing_path=backing_path))
+
+    def freeze_disks(self, name, tag):
+        """
+        Make the disks of (shut off) node "name" read-only, so that they can
+        back the disks of a clone: the domain gets a qcow2 overlay of each
+        disk, named after "tag", and writes to it from now on. Returns (dev,
+        path, serial) of each frozen disk.
+        """
+        domain = self.conn.lookupByName(self.domain_name(name))
+        (tree, disks) = self._domain_disks(domain)
+        pool = self.pool
+        frozen = []
+        for (source, dev, path, serial) in disks:
+            volume = self._overlay(pool, '{}-{}.{}.qcow2'.format(self.domain_name(name), dev, tag),
+                                   path)
+            Log.info("Domain {} now writes disk {} to {}"
+                     .format(domain.name(), dev, volume.path()))
+            source.set('file', volume.path())
+            frozen.append((dev, path, serial))
+        self.conn.defineXML(ET.tostring(tree, encoding='unicode'))
+        return frozen
+
+    def define_clone(self, node, disks):
+        """
+        Define the domain of "node" with a qcow2 overlay of each of "disks",
+        the (dev, path, serial) of the frozen disks of the node it is a clone
+        of (see freeze_disks()), unless it is already defined
+        """
+        domain = self._lookup_domain(node.name)
+        if domain:
+            return domain
+        pool = self.pool
+        domain_disks = []
+        for (dev, path, serial) in disks:
+            if dev == 'vda':
+                volume_name = '{}.img'.format(self.domain_name(node.name))
+            else:
+                volume_name = '{}-{}.qcow2'.format(self.domain_name(node.name), dev)
+            volume = self._lookup_volume(pool, volume_name)
+            if not volume:
+                volume = self._overlay(pool, volume_name, path)
+            domain_disks.append({'path': volume.path(), 'dev': dev, 'serial': serial})
+        return self.conn.defineXML(self._render(
+            'domain.xml.j2',
+            domain_type=self.domain_type,
+            name=self.domain_name(node.name),
+            node=node,
+            disks=domain_disks,
+            network=self.network_name,
+            mac=self.mac_address(node.name),
+            seed=None
+        ))
+
+    def _seed_files(self, name, master):
+        """
+        Return the files a node's cloud-init seed writes: what the Vagrantfile
+        would upload, the provisioning script and the /etc/hosts entries
+        """
+        files = []
+
+        def _add(path, content, permissions='0644', append=False):
+            files.append({'path': path,
+                          'content': base64.b64encode(content).decode('ascii'),
+                          'permissions': permissions,
+                          'append': append})
+
+        def _add_file(path, local_path, permissions='0644'):
+            with open(local_path, 'rb') as file:
+                _add(path, file.read(), permissions)
+
+        keys_dir = os.path.join(self.dep_dir, 'keys')
+        for key in sorted(os.listdir(keys_dir)):
+            _add_file('/home/vagrant/.ssh/{}'.format(key), os.path.join(keys_dir, key), '0600')
+        if master:
+            for (dirpath, _, filenames) in os.walk(Constant.PATH_TO_QA):
+                for filename in sorted(filenames):
+                    local_path = os.path.join(dirpath, filename)
+                    relative_path = os.path.relpath(local_path, Constant.PATH_TO_QA)
+                    _add_file('/home/vagrant/sesdev-qa/{}'.format(relative_path), local_path,
+                              '0755' if os.access(local_path, os.X_OK) else '0644')
+        script = 'provision_{}.sh'.format(name)
+        _add_file('/home/vagrant/{}'.format(script), os.path.join(self.dep_dir, script), '0755')
+        hosts = ''.join('{} {} {}\n'.format(node.public_address, node.fqdn, node.name)
+                        for node in self.nodes.values() if node.public_address)
+        _add('/etc/hosts', hosts.encode('utf-8'), append=True)
+        return files
+
+    def _iso_tool(self):
+        for tool in self.ISO_TOOLS:
+            path = shutil.which(tool)
+            if path:
+                return path
+        raise IsoToolNotFound(self.ISO_TOOLS)
+
+    def build_seed(self, name, master=False):
+        """
+        Build the NoCloud cloud-init seed ISO of node "name", which makes the
+        node provision itself on first boot, and upload it to the storage pool.
+        Returns the storage volume.
+        """
+        node = self.nodes[name]
+        seed_dir = os.path.join(self.dep_dir, 'seed', name)
+        os.makedirs(seed_dir, exist_ok=True)
+        with open(os.path.join(seed_dir, 'user-data'), 'w', encoding='utf-8') as file:
+            file.write(self._render('user-data.j2',
+                                    node=node,
+                                    master=master,
+                                    files=self._seed_files(name, master),
+                                    log=self.SEED_PROVISION_LOG,
+                                    marker=self.SEED_MARKER,
+                                    marker_dir=os.path.dirname(self.SEED_MARKER)))
+        with open(os.path.join(seed_dir, 'meta-data'), 'w', encoding='utf-8') as file:
+            file.write(self._render('meta-data.j2', node=node,
+                                    instance_id=self.domain_name(name)))
+        iso_path = '{}.iso'.format(seed_dir)
+        tools.run_sync([self._iso_tool(), '-output', iso_path, '-volid', 'cidata',
+                        '-joliet', '-rock',
+                        os.path.join(seed_dir, 'user-data'),
+                        os.path.join(seed_dir, 'meta-data')])
+
+        pool = self.pool
+        volume_name = '{}-seed.iso'.format(self.domain_name(name))
+        volume = self._lookup_volume(pool, volume_name)
+        if volume:
+            volume.delete(0)
+        volume = pool.createXML(self._render('volume.xml.j2', name=volume_name,
+                                             capacity=os.path.getsize(iso_path),
+                                             backing_path=None, format='raw'))
+        self._upload(volume, iso_path)
+        return volume
+
+    def start(self, names=None):
+        """
+        Start the domains of nodes "names" (default: all nodes) that are not
+        running; a domain with a managed save image resumes from it
+        """
+        self.define_network()
+        for name in names if names else self.nodes:
+            domain = self._lookup_domain(name)
+            if domain is None:
+                Log.warning("Node '{}' of deployment {} is not defined"
+                            .format(name, self.dep_id))
+            elif not domain.isActive():
+                Log.info("Starting domain {}".format(domain.name()))
+                domain.create()
+
+    def stop(self, names=None, timeout=60, force=False):
+        """
+        Shut down the domains of nodes "names" (default: all nodes), waiting up
+        to "timeout" seconds for them, and then powering them off if "force" is
+        set. Returns the names of the nodes whose domain is still running.
+        """
+        domains = {}
+        with DomainEvents(self.conn, uri=self.uri) as events:
+            for name in names if names else self.nodes:
+                domain = self._lookup_domain(name)
+                if domain and domain.isActive():
+                    Log.info("Shutting down domain {}".format(domain.name()))
+                    domain.shutdown()
+                    domains[name] = domain
+            still_running = events.wait_stopped(domains.values(), timeout)
+        domains = {name: domain for (name, domain) in domains.items() if domain in still_running}
+        if force:
+            for domain in domains.values():
+                if domain.isActive():
+                    domain.destroy()
+            return []
+        return list(domains)
+
+    def destroy(self):
+        """
+        Remove the domains, volumes and network of the deployment
+        """
+        errors = LibvirtTeardown(self.conn, self.storage_pool_name, [self.dep_id]).run()
+        if errors[self.dep_id]:
+            raise errors[self.dep_id][0]
+
+    def statuses(self, domain_states):
+        """
+        Map the nodes to their statuses, given a Box.domain_states() snapshot
+        """
+        statuses = {}
+        for name in self.nodes:
+            domain_name = self.domain_name(name)
+            if domain_name not in domain_states:
+                statuses[name] = "not deployed"
+            else:
+                statuses[name] = domain_states[domain_name] or "unknown"
+        return statuses
+
+    def _proxy_command(self):
+        if not self.settings.libvirt_use_ssh:
+            return None
+        proxycmd = 'ssh'
+        private_key_file = Box.libvirt_private_key_path(self.settings)
+        if private_key_file:
+            proxycmd += ' -i {}'.format(private_key_file)
+        if self.settings.libvirt_user:
+            proxycmd += ' {}@'.format(self.settings.libvirt_user)
+        else:
+            proxycmd += ' '
+        return '{}{} -W %h:%p'.format(proxycmd, self.settings.libvirt_host)
+
+    def ssh_configs(self):
+        """
+        Return a dict mapping node name to (address, proxycmd), like
+        Deployment._parse_vagrant_ssh_config()
+        """
+        proxycmd = self._proxy_command()
+        return {name: (node.public_address, proxycmd) for (name, node) in self.nodes.items()}
+
+    def _ssh_options(self):
+        options = [
+            "-i", Constant.VAGRANT_INSECURE_PRIVATE_KEY,
+            "-o", "IdentitiesOnly yes",
+            "-o", "StrictHostKeyChecking no",
+            "-o", "UserKnownHostsFile /dev/null",
+            "-o", "PasswordAuthentication no",
+            "-o", "LogLevel=ERROR",
+        ]
+        proxycmd = self._proxy_command()
+        if proxycmd:
+            options.extend(["-o", "ProxyCommand={}".format(proxycmd)])
+        return options
+
+    def ssh_cmd(self, name, command, connection_attempts=1):
+        """
+        Command to run "command" (a string) on node "name" as the "vagrant" user
+        """
+        return ["ssh"] + self._ssh_options() + [
+            "-o", "ConnectionAttempts {}".format(connection_attempts),
+            "-o", "ConnectTimeout 10",
+            "vagrant@{}".format(self.nodes[name].public_address),
+            command
+        ]
+
+    def scp_cmd(self, sources, name, destination):
+        """
+        Command to copy the local files or directories "sources" to
+        "destination" on node "name", as the "vagrant" user
+        """
+        return ["scp", "-r"] + self._ssh_options() + list(sources) + [
+            "vagrant@{}:{}".format(self.nodes[name].public_address, destination)
+        ]
+
+    def provision_chain(self, name, master=False, synced_folders=None):
+        """
+        Return the commands that wait for node "name" to boot, upload what the
+        Vagrantfile would (the ssh keys; bin/, the QA scripts and the synced
+        folders to the master node), set its hostname and run its provisioning
+        script
+        """
+        node = self.nodes[name]
+        keys_dir = os.path.join(self.dep_dir, 'keys')
+        chain = self.wait_chain(name) + [
+            self.scp_cmd([os.path.join(keys_dir, key) for key in sorted(os.listdir(keys_dir))],
+                         name, '.ssh/'),
+        ]
+        if master:
+            chain.append(self.scp_cmd([os.path.join(self.dep_dir, 'bin')], name, '/home/vagrant/'))
+            chain.append(self.scp_cmd([Constant.PATH_TO_QA], name, '/home/vagrant/sesdev-qa'))
+            chain.extend(self._synced_folder_cmds(name, synced_folders))
+        script = 'provision_{}.sh'.format(name)
+        chain.append(self.scp_cmd([os.path.join(self.dep_dir, script)], name, '/home/vagrant/'))
+        chain.append(self.ssh_cmd(
+            name,
+            'sudo hostnamectl set-hostname {} && sudo bash /home/vagrant/{}'
+            .format(node.fqdn, script)
+        ))
+        return chain
+
+    def _synced_folder_cmds(self, name, synced_folders):
+        """
+        Commands to copy "synced_folders" ((source, destination) pairs) to node
+        "name": a one-time copy, as there is no shared folder without Vagrant
+        """
+        return [["rsync", "-a", "--rsync-path", "sudo mkdir -p {} && sudo rsync"
+                 .format(destination),
+                 "-e", ' '.join(["ssh"] + ["'{}'".format(option) for option in
+                                           self._ssh_options()]),
+                 "{}/".format(source.rstrip('/')),
+                 "vagrant@{}:{}".format(self.nodes[name].public_address, destination)]
+                for (source, destination) in (synced_folders if synced_folders else [])]
+
+    def seed_chain(self, name, master=False, synced_folders=None):
+        """
+        Return the commands that wait for node "name", which provisions itself
+        from its cloud-init seed, to complete provisioning, showing the log of
+        the provisioning as it goes. They fail if provisioning failed. The
+        synced folders are copied to the master node afterwards.
+        """
+        wait_script = (
+            "touch {log}; tail -n +1 -F {log} & tail_pid=$!; "
+            "until [ -s {marker} ]; do sleep 2; done; sleep 1; kill $tail_pid; "
+            "exit $(cat {marker})"
+        ).format(log=self.SEED_PROVISION_LOG, marker=self.SEED_MARKER)
+        chain = self.wait_chain(name) + [
+            self.ssh_cmd(name, "sudo bash -c '{}'".format(wait_script))
+        ]
+        if master:
+            chain.extend(self._synced_folder_cmds(name, synced_folders))
+        return chain
+
+    def wait_chain(self, name):
+        """
+        Return the command that waits for node "name" to accept SSH connections
+        """
+        return [self.ssh_cmd(name, 'true', Constant.SSH_BOOT_CONNECTION_ATTEMPTS)]
@@ -0,0 +1,178 @@
+import fcntl
+import functools
+import os
+import tempfile
+import threading
+
+from contextlib import contextmanager
+
+from .constant import Constant
+from .log import Log
+
+
+def _lock_path(name):
+    return os.path.join(Constant.A_WORKING_DIR, Constant.LOCKS_DIRNAME, '{}.lock'.format(name))
+
+
+def _flock(file, mode, what):
+    try:
+        fcntl.flock(file, mode | fcntl.LOCK_NB)
+    except BlockingIOError:
+        Log.info("Waiting for another sesdev process to release {}".format(what))
+        fcntl.flock(file, mode)
+
+
+@contextmanager
+def file_lock(path, exclusive=True):
+    """
+    Hold an exclusive (or shared) flock on file "path", which is created if
+    need be, for the duration of the "with" block
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'a', encoding='utf-8') as file:
+        _flock(file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH, path)
+        try:
+            yield
+        finally:
+            fcntl.flock(file, fcntl.LOCK_UN)
+
+
+def global_lock():
+    """
+    The lock serializing the short critical sections that span deployments,
+    like handing out networks (see SubnetAllocator) or rebuilding the state
+    index. Never hold it for long.
+    """
+    return file_lock(_lock_path('global'))
+
+
+def atomic_write(path, data, mode=0o644):
+    """
+    Replace file "path" with "data" (str or bytes) in one step: the data is
+    written to a temporary file in the same directory, synced and renamed
+    over "path", so that readers see either the old or the new contents, never
+    a partial file
+    """
+    directory = os.path.dirname(path)
+    (fd, tmp_path) = tempfile.mkstemp(dir=directory,
+                                      prefix='.{}.'.format(os.path.basename(path)))
+    try:
+        with os.fdopen(fd, 'wb' if isinstance(data, bytes) else 'w',
+                       **({} if isinstance(data, bytes) else {'encoding': 'utf-8'})) as file:
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+class DeploymentLock():
+    """
+    The lock of one deployment, shared between the sesdev processes that use
+    the deployment (start, stop, snapshot, ...), and held exclusively by a
+    process that creates or destroys it. Commands that only read a deployment
+    (list, show, status, ...) take no lock at all, and so never wait behind a
+    long "vagrant up": they read files that are always written with
+    atomic_write().
+
+    The lock is reentrant within the DeploymentLock object: a method holding it
+    exclusively may call one that takes it shared, and one holding it shared
+    may upgrade it for a while (which, as flock upgrades are, is not atomic).
+    """
+
+    def __init__(self, dep_id):
+        self.dep_id = dep_id
+        self.path = _lock_path(dep_id)
+        self._mutex = threading.RLock()
+        self._file = None
+        self._mode = None
+        self._depth = 0
+
+    def _open_locked(self, mode):
+        """
+        Open the lock file and flock it. remove() may unlink the file while
+        other processes wait for their flock on it, so the flock only counts
+        if the file is still the one at self.path: otherwise, try again with
+        the one there now.
+        """
+        while True:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            # pylint: disable=consider-using-with
+            file = open(self.path, 'a', encoding='utf-8')
+            _flock(file, mode, 'deployment {}'.format(self.dep_id))
+            locked_stat = os.fstat(file.fileno())
+            try:
+                path_stat = os.stat(self.path)
+                if (path_stat.st_dev, path_stat.st_ino) == \
+                        (locked_stat.st_dev, locked_stat.st_ino):
+                    return file
+            except FileNotFoundError:
+                pass
+            Log.debug("Lock file {} was removed while waiting for it: retrying"
+                      .format(self.path))
+            file.close()
+
+    def _acquire(self, mode):
+        with self._mutex:
+            previous = self._mode
+            if self._file is None:
+                self._file = self._open_locked(mode)
+                self._mode = mode
+            elif previous not in (mode, fcntl.LOCK_EX):
+                _flock(self._file, mode, 'deployment {}'.format(self.dep_id))
+                self._mode = mode
+            self._depth += 1
+            return previous
+
+    def _release(self, previous):
+        with self._mutex:
+            self._depth -= 1
+            if self._depth == 0:
+                fcntl.flock(self._file, fcntl.LOCK_UN)
+                self._file.close()
+                (self._file, self._mode) = (None, None)
+            elif previous != self._mode:
+                fcntl.flock(self._file, previous)
+                self._mode = previous
+
+    @contextmanager
+    def _hold(self, mode):
+        previous = self._acquire(mode)
+        try:
+            yield
+        finally:
+            self._release(previous)
+
+    def shared(self):
+        return self._hold(fcntl.LOCK_SH)
+
+    def exclusive(self):
+        return self._hold(fcntl.LOCK_EX)
+
+    def remove(self):
+        """
+        Remove the lock file; to be called with the lock held exclusively.
+        Processes waiting for the lock meanwhile take the new lock file on
+        getting the flock on the removed one (see _open_locked()).
+        """
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def locked(exclusive=False):
+    """
+    Decorator holding the DeploymentLock "self.lock" of the object the decorated
+    method is called on, shared (or exclusively) for the duration of the call
+    """
+    def _decorator(method):
+        @functools.wraps(method)
+        def _wrapper(self, *args, **kwargs):
+            with self.lock.exclusive() if exclusive else self.lock.shared():
+                return method(self, *args, **kwargs)
+        return _wrapper
+    return _decorator
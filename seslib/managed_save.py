@@ -0,0 +1,36 @@
+from . import tools
+from .domains import DeploymentDomains
+from .log import Log
+
+
+class ManagedSave(DeploymentDomains):
+    """
+    Suspends the domains of a deployment to disk, and resumes them, with
+    libvirt managed save: the memory of each domain is saved to a file on the
+    libvirt host and the domain is shut off, and starting the domain restores
+    it from that file instead of booting it. The domains are saved and
+    restored all at once.
+    """
+
+    def save(self, names=None):
+        """
+        Save the running domains of nodes "names" (default: all nodes).
+        Returns the names of the nodes saved.
+        """
+        domains = self._domains(names)
+        running = [name for (name, domain) in domains.items() if domain.isActive()]
+        Log.info("Saving domains {}".format(running))
+        tools.parallel_map(lambda name: domains[name].managedSave(0), running, len(running))
+        return running
+
+    def restore(self, names=None):
+        """
+        Restore the saved domains of nodes "names" (default: all nodes).
+        Returns the names of the nodes restored.
+        """
+        domains = self._domains(names)
+        saved = [name for (name, domain) in domains.items()
+                 if not domain.isActive() and domain.hasManagedSaveImage(0)]
+        Log.info("Restoring domains {}".format(saved))
+        tools.parallel_map(lambda name: domains[name].create(), saved, len(saved))
+        return saved
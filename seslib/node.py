@@ -29,6 +29,7 @@ class Node():
         self.ram = ram
         self.cpus = cpus
         self.status = None
+        self.status_updated = None  # set if status is a last-known one
         self.custom_repos = []
 
     def has_role(self, role):
@@ -0,0 +1,187 @@
+import json
+import os
+import subprocess
+import sys
+
+from . import tools
+from .constant import Constant
+from .deployment import Deployment, DeploymentRecord
+from .exceptions import DeploymentAlreadyExists, DeploymentDoesNotExists, \
+                        PoolEmpty, PoolNotConfigured
+from .lock import atomic_write, file_lock, global_lock
+from .log import Log
+from .settings import Settings
+
+
+def _parked(dep):
+    return all(node.status == 'stopped' for node in dep.nodes.values())
+
+
+class DeploymentPool():
+    """
+    The deployments of one version that "sesdev pool fill" creates, fully
+    provisioned, and parks with their nodes shut off, so that "sesdev pool
+    claim" can hand one out in the time it takes to boot it. The pool
+    deployments are named "pool-<version>-<n>", and are of the libvirt-native
+    VM engine: a claimed deployment is a clone (see Deployment.clone()) of
+    one of them, which then leaves the pool and is only kept, stopped, as the
+    base of the disks of the clone, until the clone is destroyed. The size of
+    the pool and the settings of its deployments are kept in the pools
+    directory of the sesdev working directory, where fills run in the
+    background also write their output.
+    """
+
+    def __init__(self, version, path=None):
+        self.version = version
+        self.path = path if path else \
+            os.path.join(Constant.A_WORKING_DIR, Constant.POOLS_DIRNAME)
+
+    def _file(self, extension):
+        return os.path.join(self.path, '{}.{}'.format(self.version, extension))
+
+    def configuration(self):
+        """
+        Return the "size" and "settings" (a dict, as for Settings()) of the
+        pool. Raises PoolNotConfigured if it was never filled.
+        """
+        try:
+            with open(self._file('json'), 'r', encoding='utf-8') as file:
+                return json.load(file)
+        except FileNotFoundError as error:
+            raise PoolNotConfigured(self.version) from error
+
+    def configure(self, size, settings_dict):
+        os.makedirs(self.path, exist_ok=True)
+        atomic_write(self._file('json'), json.dumps({'size': size, 'settings': settings_dict},
+                                                    indent=1, sort_keys=True))
+
+    def members(self):
+        """
+        Return the IDs of the deployments in the pool (parked or not), the
+        claimed ones excepted
+        """
+        return sorted(record.dep_id for record in DeploymentRecord.list()
+                      if record.settings.pool == self.version
+                      and not record.settings.pool_claimed_by)
+
+    def _new_ids(self, count):
+        dep_ids = []
+        number = 1
+        while len(dep_ids) < count:
+            dep_id = 'pool-{}-{}'.format(self.version, number)
+            if not os.path.exists(os.path.join(Constant.A_WORKING_DIR, dep_id)):
+                dep_ids.append(dep_id)
+            number += 1
+        return dep_ids
+
+    def _settings(self, settings_dict):
+        settings = Settings(**settings_dict)
+        settings.override('vm_engine', 'libvirt-native')  # see Deployment.clone()
+        settings.override('non_interactive', True)
+        settings.override('pool', self.version)
+        return settings
+
+    def _unclaimed(self, deps):
+        """
+        Those of "deps" no "sesdev pool claim" took meanwhile. Call with the
+        global lock held.
+        """
+        unclaimed = []
+        for dep in deps:
+            try:
+                if not DeploymentRecord.load(dep.dep_id).settings.pool_claimed_by:
+                    unclaimed.append(dep)
+            except DeploymentDoesNotExists:
+                continue
+        return unclaimed
+
+    def fill(self, log_handler, size=None, settings_dict=None):
+        """
+        Bring the pool up to its size, first setting it to "size" and
+        "settings_dict" (see configure()) if given: create the deployments
+        missing from it all at once (see Deployment.create_many()), and shut
+        them off once they are provisioned. Deployments of the pool that are
+        not parked (left over by an interrupted fill) and the ones the pool
+        has too many are destroyed. Only one fill of a pool runs at a time.
+        Returns the create_many() results of the deployments created.
+        """
+        with file_lock(self._file('lock')):
+            if size is not None:
+                self.configure(size, settings_dict)
+            config = self.configuration()
+            members = Deployment.load_many(self.members())
+            parked = [dep for dep in members if _parked(dep)]
+            doomed = [dep for dep in members if not _parked(dep)] + parked[config['size']:]
+            if doomed:
+                with global_lock():
+                    doomed = self._unclaimed(doomed)
+                    for dep in doomed:
+                        dep.set_pool(None)
+                log_handler("Removing deployments {} from the {} pool\n"
+                            .format(', '.join(dep.dep_id for dep in doomed), self.version))
+                Deployment.destroy_many(doomed, log_handler)
+            deps = [Deployment.prepare(dep_id, self._settings(config['settings']))
+                    for dep_id in self._new_ids(config['size'] - len(parked))]
+            if not deps:
+                Log.info("DeploymentPool: the {} pool is full".format(self.version))
+                return {}
+            log_handler("Adding deployments {} to the {} pool\n"
+                        .format(', '.join(dep.dep_id for dep in deps), self.version))
+            results = Deployment.create_many(deps, log_handler)
+            created = [dep for dep in deps if results[dep.dep_id]['status'] == 'running']
+            tools.parallel_map(lambda dep: dep.stop(log_handler), created, jobs=len(deps))
+            failed = [dep for dep in deps if dep not in created and
+                      os.path.exists(os.path.join(Constant.A_WORKING_DIR, dep.dep_id))]
+            if failed:
+                Deployment.destroy_many(failed, log_handler)
+            return results
+
+    def claim(self, new_id, log_handler):
+        """
+        Make a parked deployment of the pool into the new deployment "new_id"
+        (see the class docstring), up and running. Returns the new deployment.
+        Raises PoolEmpty if no deployment of the pool is parked. If cloning
+        fails, the deployment goes back into the pool, unless what there is of
+        the clone cannot be destroyed.
+        """
+        if os.path.exists(os.path.join(Constant.A_WORKING_DIR, new_id)):
+            raise DeploymentAlreadyExists(new_id)
+        parked = [dep for dep in Deployment.load_many(self.members()) if _parked(dep)]
+        with global_lock():
+            parked = self._unclaimed(parked)
+            if not parked:
+                raise PoolEmpty(self.version)
+            dep = parked[0]
+            dep.set_pool(self.version, claimed_by=new_id)
+        log_handler("Claiming deployment {} of the {} pool as {}\n"
+                    .format(dep.dep_id, self.version, new_id))
+        try:
+            return dep.clone(log_handler, new_id)
+        except BaseException:
+            # back into the pool
+            dep.set_pool(self.version)
+            if os.path.exists(os.path.join(Constant.A_WORKING_DIR, new_id)):
+                (partial,) = Deployment.load_many([new_id], load_status=False)
+                # what Deployment.clone_from() could not destroy: a member with
+                # a clone could not be destroyed, so the pool could not heal
+                if partial.settings.cloned_from == dep.dep_id and \
+                        Deployment.destroy_many([partial], log_handler):
+                    # out of the pool, to be destroyed along with the clone
+                    dep.set_pool(self.version, claimed_by=new_id)
+            raise
+
+    def refill_in_background(self):
+        """
+        Run "sesdev pool fill <version>" in a process of its own (of the
+        Python interpreter running this one, whatever sesdev was started as),
+        which goes on after this one exits, with its output going to
+        "<version>.log" in the pools directory
+        """
+        os.makedirs(self.path, exist_ok=True)
+        with open(self._file('log'), 'a', encoding='utf-8') as log:
+            process = subprocess.Popen(  # pylint: disable=consider-using-with
+                [sys.executable, '-m', 'sesdev', 'pool', 'fill', self.version],
+                stdin=subprocess.DEVNULL, stdout=log, stderr=subprocess.STDOUT,
+                start_new_session=True)
+        Log.info("DeploymentPool: refilling the {} pool (pid {}), see {}"
+                 .format(self.version, process.pid, self._file('log')))
@@ -15,6 +15,12 @@ SETTINGS = {
         'help': 'Enable/disable AppArmor',
         'default': True,
     },
+    'baked_image': {
+        'type': str,
+        'help': ('Storage volume, made by "sesdev bake", the nodes boot from (set by sesdev when '
+                 'a matching baked image exists)'),
+        'default': None,
+    },
     'caasp_deploy_ses': {
         'type': bool,
         'help': 'Deploy SES using rook in CaasP',
@@ -40,6 +46,11 @@ SETTINGS = {
         'help': 'ceph-salt git branch to use',
         'default': '',
     },
+    'cloned_from': {
+        'type': str,
+        'help': 'ID of the deployment this one is a clone of (set by "sesdev clone")',
+        'default': None,
+    },
     'cluster_network': {
         'type': str,
         'help': 'The network address prefix for the cluster network',
@@ -50,6 +61,12 @@ SETTINGS = {
         'help': 'Container registry data [prefix, location, insecure]',
         'default': None,
     },
+    'cloud_init_seed': {
+        'type': bool,
+        'help': ('With the libvirt-native VM engine, provision the nodes at first boot from a '
+                 'cloud-init seed ISO instead of over SSH (the Vagrant Box must have cloud-init)'),
+        'default': False,
+    },
     'cpus': {
         'type': int,
         'help': 'Number of virtual CPUs in each node',
@@ -284,6 +301,13 @@ SETTINGS = {
         'help': 'openSUSE OS version (leap-15.1, tumbleweed, sles-15-sp1, ...)',
         'default': '',
     },
+    'parallel_bringup': {
+        'type': int,
+        'help': ('Bring up and provision the nodes with one Vagrant process per node, at most '
+                 'this many at once, logging each node to logs/<node>.log in the deployment '
+                 'directory (0: a single "vagrant up" for all nodes)'),
+        'default': 0,
+    },
     'os_makecheck_repos': {
         'type': dict,
         'help': 'repos to add to VMs in "makecheck" environments',
@@ -304,6 +328,16 @@ SETTINGS = {
         'help': 'repos to add on all VMs of a given operating system (os)',
         'default': Constant.OS_REPOS,
     },
+    'pool': {
+        'type': str,
+        'help': 'Version of the pool this deployment is parked in (set by "sesdev pool fill")',
+        'default': None,
+    },
+    'pool_claimed_by': {
+        'type': str,
+        'help': 'ID of the deployment "sesdev pool claim" made of this pool deployment',
+        'default': None,
+    },
     'provision': {
         'type': bool,
         'help': 'Whether to provision the VMs (e.g., deploy Ceph on them) after they are created',
@@ -394,6 +428,12 @@ SETTINGS = {
         'help': 'Sync Folders to VM',
         'default': [],
     },
+    'use_baked_image': {
+        'type': bool,
+        'help': ('With the libvirt-native VM engine, boot the nodes from the image made by '
+                 '"sesdev bake" for the version and OS, if its repos match the deployment'),
+        'default': True,
+    },
     'use_salt': {
         'type': bool,
         'help': 'Use "salt" (or "salt-run") to apply Salt Formula (or execute DeepSea Stages)',
@@ -421,9 +461,17 @@ SETTINGS = {
     },
     'vm_engine': {
         'type': str,
-        'help': 'VM engine to use for VM deployment. Current options [libvirt]',
+        'help': ('VM engine to use for VM deployment. Current options [libvirt, '
+                 'libvirt-native] ("libvirt-native" drives libvirt directly, without Vagrant)'),
         'default': 'libvirt',
     },
+    'wait_for_capacity': {
+        'type': bool,
+        'help': ('Whether to wait (in turn with other sesdev processes) until the '
+                 'libvirt host has the RAM, vCPUs and storage pool space for a new '
+                 'deployment, rather than fail'),
+        'default': True,
+    },
     'msgr2_secure_mode': {
         'type': bool,
         'help': 'Set "ms_*_mode" options to "secure"',
@@ -434,6 +482,12 @@ SETTINGS = {
         'help': 'Prioritise secure mode over "crc" in the ms_*_mode options.',
         'default': False,
     },
+    'ssh_control_persist': {
+        'type': str,
+        'help': ('How long idle SSH master connections to the nodes stay open (ssh_config '
+                 'ControlPersist syntax; "no" disables connection sharing)'),
+        'default': '10m',
+    },
     'ssh_extra_auth_keys': {
         'type': list,
         'help': ('Additional public keys to provision into '
@@ -0,0 +1,164 @@
+import os
+import re
+import xml.etree.ElementTree as ET
+
+import libvirt
+
+from . import tools
+from .constant import Constant
+from .domains import DeploymentDomains
+from .exceptions import \
+                        OptionValueError, \
+                        SnapshotAlreadyExists, \
+                        SnapshotDoesNotExist, \
+                        SnapshotRevertNotSupported
+from .log import Log
+
+
+class DeploymentSnapshots(DeploymentDomains):
+    """
+    Snapshots of all domains of a deployment, taken together through the
+    libvirt snapshot API. They are external snapshots: the disks (the OSD
+    disks included) get qcow2 overlays, and the memory of running domains is
+    saved to a file, next to the system disk. The running domains are paused
+    while their snapshots are taken, so that the snapshots of the nodes are
+    consistent with one another.
+    """
+
+    # libvirt reverts to external snapshots since 9.9.0
+    MIN_REVERT_VERSION = 9009000
+
+    DESCRIPTION = 'sesdev snapshot'
+
+    @staticmethod
+    def vet_name(name):
+        if not re.match(r'^[A-Za-z0-9][A-Za-z0-9_.-]*$', name):
+            raise OptionValueError('name', 'Snapshot names may only contain letters, digits, '
+                                   '".", "_" and "-"', name)
+        return name
+
+    @staticmethod
+    def _disks(domain):
+        """
+        Return (dev, path, device) of the file-backed disks of "domain"
+        """
+        disks = []
+        for disk in ET.fromstring(domain.XMLDesc(0)).findall('./devices/disk'):
+            source = disk.find('source')
+            target = disk.find('target')
+            if source is None or target is None or source.get('file') is None:
+                continue
+            disks.append((target.get('dev'), source.get('file'), disk.get('device')))
+        return disks
+
+    def _snapshot_xml(self, domain, name, memory):
+        disks = []
+        memory_file = None
+        for (dev, path, device) in self._disks(domain):
+            overlay = None
+            if device == 'disk':
+                overlay = '{}.snap-{}.qcow2'.format(os.path.splitext(path)[0], name)
+                if memory and memory_file is None:
+                    memory_file = '{}.snap-{}.mem'.format(os.path.splitext(path)[0], name)
+            disks.append({'dev': dev, 'overlay': overlay})
+        return Constant.JINJA_ENV.get_template('snapshot.xml.j2').render(
+            name=name, description=self.DESCRIPTION, memory=memory_file, disks=disks)
+
+    def names(self):
+        """
+        Return the names of the snapshots taken of all nodes, oldest first
+        """
+        snapshots = self.list()
+        return [snapshot['name'] for snapshot in snapshots
+                if sorted(snapshot['nodes']) == sorted(self.nodes)]
+
+    def list(self):
+        """
+        Return the snapshots of the nodes, oldest first, as dicts with the
+        "name", the "created" time (seconds since the epoch) and the "nodes"
+        it was taken of
+        """
+        snapshots = {}
+        for (node, domain) in self._domains().items():
+            for snapshot in domain.listAllSnapshots(0):
+                tree = ET.fromstring(snapshot.getXMLDesc(0))
+                if tree.findtext('description') != self.DESCRIPTION:
+                    continue
+                entry = snapshots.setdefault(snapshot.getName(), {
+                    'name': snapshot.getName(),
+                    'created': int(tree.findtext('creationTime', '0')),
+                    'nodes': [],
+                })
+                entry['nodes'].append(node)
+        return sorted(snapshots.values(), key=lambda entry: (entry['created'], entry['name']))
+
+    def save(self, name):
+        """
+        Take snapshot "name" of all nodes. The running domains are all paused
+        first and resumed when the snapshots of all nodes are taken. If taking
+        any snapshot fails, the ones already taken are deleted.
+        """
+        self.vet_name(name)
+        if name in [snapshot['name'] for snapshot in self.list()]:
+            raise SnapshotAlreadyExists(name, self.dep_id)
+        domains = self._domains()
+        running = [node for (node, domain) in domains.items()
+                   if domain.state()[0] == libvirt.VIR_DOMAIN_RUNNING]
+        Log.info("Pausing domains {}".format(running))
+        tools.parallel_map(lambda node: domains[node].suspend(), running)
+        taken = []
+        try:
+            def _take(node):
+                domain = domains[node]
+                active = domain.isActive()
+                flags = 0 if active else libvirt.VIR_DOMAIN_SNAPSHOT_CREATE_DISK_ONLY
+                domain.snapshotCreateXML(self._snapshot_xml(domain, name, active), flags)
+                taken.append(node)
+            tools.parallel_map(_take, list(domains))
+        except libvirt.libvirtError:
+            for node in taken:
+                Log.warning("Deleting snapshot {} of node {}".format(name, node))
+                domains[node].snapshotLookupByName(name, 0).delete(0)
+            raise
+        finally:
+            Log.info("Resuming domains {}".format(running))
+            tools.parallel_map(lambda node: domains[node].resume(), running)
+
+    def _snapshots(self, name):
+        domains = self._domains()
+        snapshots = {}
+        for (node, domain) in domains.items():
+            try:
+                snapshots[node] = domain.snapshotLookupByName(name, 0)
+            except libvirt.libvirtError as error:
+                raise SnapshotDoesNotExist(name, self.dep_id) from error
+        return (domains, snapshots)
+
+    def restore(self, name):
+        """
+        Revert all nodes to snapshot "name" at once. The domains that were
+        running are reverted paused, and resumed together when all nodes are
+        reverted. Returns the names of the nodes that are running.
+        """
+        version = self.conn.getLibVersion()
+        if version < self.MIN_REVERT_VERSION:
+            raise SnapshotRevertNotSupported('{}.{}.{}'.format(
+                version // 1000000, version // 1000 % 1000, version % 1000))
+        (domains, snapshots) = self._snapshots(name)
+        running = [node for (node, snapshot) in snapshots.items()
+                   if ET.fromstring(snapshot.getXMLDesc(0)).findtext('state')
+                   in ['running', 'paused']]
+        Log.info("Reverting domains to snapshot {}".format(name))
+        tools.parallel_map(
+            lambda node: domains[node].revertToSnapshot(
+                snapshots[node], libvirt.VIR_DOMAIN_SNAPSHOT_REVERT_PAUSED), list(domains))
+        Log.info("Resuming domains {}".format(running))
+        tools.parallel_map(lambda node: domains[node].resume(), running)
+        return running
+
+    def delete(self, name):
+        """
+        Delete snapshot "name" of all nodes, merging its overlays
+        """
+        (_, snapshots) = self._snapshots(name)
+        tools.parallel_map(lambda snapshot: snapshot.delete(0), list(snapshots.values()))
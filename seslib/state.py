@@ -0,0 +1,259 @@
+import json
+import os
+import sqlite3
+import time
+
+from contextlib import contextmanager
+
+from .constant import Constant
+from .log import Log
+from .settings import SettingsEncoder
+
+
+# bump SCHEMA_VERSION along with any change to SCHEMA; versions 0 (before it
+# was recorded) and 2 lack tables the CREATE TABLE IF NOT EXISTS statements add
+SCHEMA_VERSION = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS deployments (
+    id TEXT PRIMARY KEY,
+    version TEXT,
+    os TEXT,
+    public_network TEXT,
+    cluster_network TEXT,
+    metadata TEXT NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS deployments_public_network
+    ON deployments (public_network);
+CREATE INDEX IF NOT EXISTS deployments_cluster_network
+    ON deployments (cluster_network);
+CREATE TABLE IF NOT EXISTS nodes (
+    deployment_id TEXT NOT NULL REFERENCES deployments (id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    fqdn TEXT,
+    public_address TEXT,
+    cluster_address TEXT,
+    status TEXT,
+    status_updated REAL,
+    PRIMARY KEY (deployment_id, name)
+);
+CREATE TABLE IF NOT EXISTS ssh_configs (
+    deployment_id TEXT NOT NULL,
+    node TEXT NOT NULL,
+    hostname TEXT NOT NULL,
+    proxycommand TEXT,
+    private_key TEXT,
+    updated REAL NOT NULL,
+    PRIMARY KEY (deployment_id, node),
+    FOREIGN KEY (deployment_id, node) REFERENCES nodes (deployment_id, name)
+        ON DELETE CASCADE
+);
+"""
+
+
+class StateStore():
+    """
+    Transactional SQLite index of all deployments in the sesdev working
+    directory. The deployment directories (and their metadata files) remain the
+    source of truth: the index can always be rebuilt from them with
+    "sesdev reindex".
+    """
+
+    def __init__(self, path=None):
+        self.path = path if path else \
+            os.path.join(Constant.A_WORKING_DIR, Constant.STATE_DB_FILENAME)
+
+    def exists(self):
+        return os.path.isfile(self.path)
+
+    @staticmethod
+    def _create_schema(conn):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # another process may have got there first
+            if conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+                Log.debug("StateStore: creating schema version {}".format(SCHEMA_VERSION))
+                for statement in SCHEMA.split(';'):
+                    if statement.strip():
+                        conn.execute(statement)
+                conn.execute("PRAGMA user_version = {}".format(SCHEMA_VERSION))
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    @contextmanager
+    def _transaction(self, write=True):
+        """
+        A transaction on the index: a write transaction takes the write lock
+        right away, a read one (with "write" False) never waits for writers
+        """
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            conn.execute("PRAGMA foreign_keys = ON")
+            if conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+                # persistent: readers need not wait for writers from now on
+                conn.execute("PRAGMA journal_mode = WAL")
+                self._create_schema(conn)
+            conn.execute("BEGIN IMMEDIATE" if write else "BEGIN DEFERRED")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _save_deployment(conn, dep_id, metadata, nodes):
+        settings = metadata['settings']
+        conn.execute(
+            "INSERT INTO deployments "
+            "(id, version, os, public_network, cluster_network, metadata, updated) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (id) DO UPDATE SET "
+            "version = excluded.version, os = excluded.os, "
+            "public_network = excluded.public_network, "
+            "cluster_network = excluded.cluster_network, "
+            "metadata = excluded.metadata, updated = excluded.updated",
+            (dep_id,
+             getattr(settings, 'version', None),
+             getattr(settings, 'os', None),
+             getattr(settings, 'public_network', None) or None,
+             getattr(settings, 'cluster_network', None) or None,
+             json.dumps(metadata, cls=SettingsEncoder),
+             time.time())
+        )
+        node_names = []
+        for node in nodes:
+            node_names.append(node.name)
+            conn.execute(
+                "INSERT INTO nodes "
+                "(deployment_id, name, fqdn, public_address, cluster_address) "
+                "VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (deployment_id, name) DO UPDATE SET "
+                "fqdn = excluded.fqdn, public_address = excluded.public_address, "
+                "cluster_address = excluded.cluster_address",
+                (dep_id, node.name, node.fqdn, node.public_address, node.cluster_address)
+            )
+        conn.execute(
+            "DELETE FROM nodes WHERE deployment_id = ? AND name NOT IN ({})"
+            .format(','.join('?' * len(node_names))),
+            [dep_id] + node_names
+        )
+
+    def save_deployment(self, dep_id, metadata, nodes):
+        """
+        Add the deployment to the index (or update it, if it is already there).
+        Takes the metadata dict as written to the metadata file and an iterable
+        of Node objects.
+        """
+        Log.debug("StateStore: saving deployment {}".format(dep_id))
+        with self._transaction() as conn:
+            self._save_deployment(conn, dep_id, metadata, nodes)
+
+    def remove_deployment(self, dep_id):
+        Log.debug("StateStore: removing deployment {}".format(dep_id))
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM ssh_configs WHERE deployment_id = ?", (dep_id,))
+            conn.execute("DELETE FROM deployments WHERE id = ?", (dep_id,))
+
+    def reindex(self, entries):
+        """
+        Replace the whole index. Takes an iterable of (dep_id, metadata, nodes)
+        tuples.
+        """
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM ssh_configs")
+            conn.execute("DELETE FROM nodes")
+            conn.execute("DELETE FROM deployments")
+            for (dep_id, metadata, nodes) in entries:
+                self._save_deployment(conn, dep_id, metadata, nodes)
+
+    def set_node_statuses(self, dep_id, nodes):
+        """
+        Record the last-known status of each Node object in the iterable
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            for node in nodes:
+                conn.execute(
+                    "UPDATE nodes SET status = ?, status_updated = ? "
+                    "WHERE deployment_id = ? AND name = ?",
+                    (node.status, now, dep_id, node.name)
+                )
+
+    def node_statuses(self, dep_id):
+        """
+        Return a dict mapping node name to (status, timestamp)
+        """
+        with self._transaction(write=False) as conn:
+            rows = conn.execute(
+                "SELECT name, status, status_updated FROM nodes WHERE deployment_id = ?",
+                (dep_id,)
+            ).fetchall()
+        return {name: (status, updated) for (name, status, updated) in rows}
+
+    def set_ssh_config(self, dep_id, node, hostname, proxycommand, private_key):
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO ssh_configs "
+                "(deployment_id, node, hostname, proxycommand, private_key, updated) "
+                "SELECT ?, ?, ?, ?, ?, ? WHERE EXISTS "
+                "(SELECT 1 FROM nodes WHERE deployment_id = ? AND name = ?)",
+                (dep_id, node, hostname, proxycommand, private_key, time.time(), dep_id, node)
+            )
+
+    def clear_ssh_configs(self, dep_id, node=None):
+        with self._transaction() as conn:
+            if node:
+                conn.execute("DELETE FROM ssh_configs WHERE deployment_id = ? AND node = ?",
+                             (dep_id, node))
+            else:
+                conn.execute("DELETE FROM ssh_configs WHERE deployment_id = ?", (dep_id,))
+
+    def ssh_config(self, dep_id, node):
+        """
+        Return the cached (hostname, proxycommand, private_key) tuple of the
+        node, or None
+        """
+        with self._transaction(write=False) as conn:
+            return conn.execute(
+                "SELECT hostname, proxycommand, private_key FROM ssh_configs "
+                "WHERE deployment_id = ? AND node = ?",
+                (dep_id, node)
+            ).fetchone()
+
+    def deployments(self, pattern=None):
+        """
+        Return the metadata dicts of all indexed deployments, in ID order,
+        optionally only those whose ID matches the shell-style glob "pattern"
+        """
+        query = "SELECT metadata FROM deployments"
+        params = ()
+        if pattern:
+            # SQLite spells fnmatch's "[!...]" as "[^...]"
+            query += " WHERE id GLOB ?"
+            params = (pattern.replace('[!', '[^'),)
+        query += " ORDER BY id"
+        with self._transaction(write=False) as conn:
+            rows = conn.execute(query, params).fetchall()
+        return [json.loads(metadata) for (metadata,) in rows]
+
+    def networks_in_use(self):
+        """
+        Return the sets of public and cluster network prefixes in use
+        """
+        with self._transaction(write=False) as conn:
+            public = conn.execute(
+                "SELECT DISTINCT public_network FROM deployments "
+                "WHERE public_network IS NOT NULL"
+            ).fetchall()
+            cluster = conn.execute(
+                "SELECT DISTINCT cluster_network FROM deployments "
+                "WHERE cluster_network IS NOT NULL"
+            ).fetchall()
+        return ({row[0] for row in public}, {row[0] for row in cluster})
@@ -0,0 +1,139 @@
+import json
+import os
+import xml.etree.ElementTree as ET
+
+from contextlib import contextmanager
+
+from . import tools
+from .constant import Constant
+from .exceptions import SubnetsExhausted
+from .lock import atomic_write, file_lock, global_lock
+from .log import Log
+
+
+class SubnetAllocator():
+    """
+    Hands out the /24 networks of deployments that do not set their own:
+    "10.20.<n>." for the public network and "10.21.<n>." for the cluster
+    network, the lowest free <n> first. Reservations are recorded in an index
+    file in the sesdev working directory, mapping each <n> taken to the
+    deployment and the process that took it, and every change to it is made
+    under the global lock (see lock.py), so concurrent sesdev processes never
+    hand out the same network. A reservation is kept as long as either
+    the deployment directory exists or the process that made it is still
+    running (it may not have created the directory yet), and is dropped on
+    "sesdev destroy".
+    """
+
+    KINDS = {
+        'public': '10.20.',
+        'cluster': '10.21.',
+    }
+    FIRST = 2
+    LAST = 200
+
+    def __init__(self, path=None):
+        if path:
+            self.path = path
+            self._lock = lambda: file_lock('{}.lock'.format(path))
+        else:
+            self.path = os.path.join(Constant.A_WORKING_DIR, Constant.SUBNETS_FILENAME)
+            self._lock = global_lock
+
+    @contextmanager
+    def _locked(self):
+        with self._lock():
+            yield self._read()
+
+    def _read(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as file:
+                index = json.load(file)
+        except FileNotFoundError:
+            index = {}
+        for kind in self.KINDS:
+            index.setdefault(kind, {})
+        return index
+
+    def _write(self, index):
+        atomic_write(self.path, json.dumps(index, indent=1, sort_keys=True))
+
+    def _live(self, reservation):
+        dep_dir = os.path.join(os.path.dirname(self.path), reservation['id'])
+        return os.path.isdir(dep_dir) or tools.process_alive(reservation['pid'])
+
+    @staticmethod
+    def on_host(conn):
+        """
+        Return the prefixes (e.g. "10.20.2.") of the /24 networks defined on
+        the libvirt host of connection "conn", whether sesdev still knows of
+        the deployments they were made for or not
+        """
+        prefixes = set()
+        for network in conn.listAllNetworks(0):
+            for ip in ET.fromstring(network.XMLDesc(0)).findall('ip'):
+                if ip.get('netmask') == '255.255.255.0' or ip.get('prefix') == '24':
+                    prefixes.add('{}.'.format(ip.get('address', '').rsplit('.', 1)[0]))
+        return prefixes
+
+    def _key(self, kind, network):
+        """
+        The key of "network" in the index: <n> for "10.20.<n>." (or
+        "10.21.<n>."), the network itself for any other one
+        """
+        number = network[len(self.KINDS[kind]):-1]
+        return number if network.startswith(self.KINDS[kind]) and number.isdigit() else network
+
+    def _network(self, kind, key):
+        return '{}{}.'.format(self.KINDS[kind], key) if key.isdigit() else key
+
+    def reserve(self, dep_id, kinds, in_use=None, requested=None):
+        """
+        Reserve a network of each of "kinds" ("public", "cluster") for
+        deployment "dep_id", skipping the prefixes in the dict "in_use" (kind
+        -> set of prefixes taken otherwise: by other deployments, or by the
+        networks on the libvirt host, see on_host()). The network in the dict
+        "requested" (kind -> prefix, as set in the config file) is reserved
+        for its kind if it is free, and the lowest free one instead if not.
+        Returns a dict mapping each kind to its network prefix, e.g.
+        "10.20.2.". Raises SubnetsExhausted if a kind has no network left.
+        """
+        in_use = in_use if in_use else {}
+        requested = requested if requested else {}
+        networks = {}
+        with self._locked() as index:
+            for kind in kinds:
+                prefix = self.KINDS[kind]
+                reservations = index[kind]
+                for (key, reservation) in list(reservations.items()):
+                    if reservation['id'] == dep_id or not self._live(reservation):
+                        Log.debug("SubnetAllocator: dropping reservation of {} by {}"
+                                  .format(self._network(kind, key), reservation['id']))
+                        del reservations[key]
+                taken = set(reservations) | {self._key(kind, network)
+                                             for network in in_use.get(kind, ())}
+                key = self._key(kind, requested[kind]) if requested.get(kind) else None
+                if key in taken:
+                    Log.warning("The {} network {}0/24 is taken: deployment {} gets another one"
+                                .format(kind, requested[kind], dep_id))
+                    key = None
+                if key is None:
+                    key = next((str(number) for number in range(self.FIRST, self.LAST + 1)
+                                if str(number) not in taken), None)
+                if key is None:
+                    raise SubnetsExhausted(kind, '{}{}.0/24'.format(prefix, self.FIRST),
+                                           '{}{}.0/24'.format(prefix, self.LAST))
+                reservations[key] = {'id': dep_id, 'pid': os.getpid()}
+                networks[kind] = self._network(kind, key)
+            self._write(index)
+        Log.info("SubnetAllocator: reserved {} for deployment {}".format(networks, dep_id))
+        return networks
+
+    def release(self, dep_id):
+        """Drop all reservations of deployment "dep_id\""""
+        with self._locked() as index:
+            for reservations in index.values():
+                for (number, reservation) in list(reservations.items()):
+                    if reservation['id'] == dep_id:
+                        del reservations[number]
+            self._write(index)
@@ -0,0 +1,89 @@
+import libvirt
+
+from . import tools
+from .inventory import LibvirtInventory
+from .log import Log
+
+
+class LibvirtTeardown():
+    """
+    Removes the domains, storage volumes and networks of a set of deployments
+    from a libvirt host directly through libvirt, with either VM engine:
+    everything that belongs to the deployments is found in one pass over the
+    host (see inventory()), and then removed concurrently, the domains first
+    (see run()). The domains and volumes of a deployment are the ones whose
+    names start with "<dep_id>_"; its network is "sesdev-<dep_id>", plus, with
+    "domain_networks", the other networks its domains are attached to.
+    """
+
+    # the management network vagrant-libvirt shares between all its domains
+    SHARED_NETWORKS = ['vagrant-libvirt']
+
+    def __init__(self, conn, pool_name, dep_ids, domain_networks=False):
+        self.conn = conn
+        self.pool_name = pool_name
+        self.dep_ids = list(dep_ids)
+        self.domain_networks = domain_networks
+
+    def inventory(self):
+        """
+        Return a dict mapping each deployment ID to a dict of the "domains",
+        "volumes" (virDomain and virStorageVol objects) and "networks" (names)
+        that belong to it
+        """
+        snapshot = LibvirtInventory(self.conn, self.pool_name)
+        inventory = {}
+        for dep_id in self.dep_ids:
+            networks = set()
+            if 'sesdev-{}'.format(dep_id) in snapshot.network_names:
+                networks.add('sesdev-{}'.format(dep_id))
+            if self.domain_networks:
+                networks.update(snapshot.networks(dep_id, exclude=self.SHARED_NETWORKS))
+            inventory[dep_id] = {
+                'domains': snapshot.domains(dep_id),
+                'volumes': snapshot.volumes(dep_id),
+                'networks': sorted(networks),
+            }
+        return inventory
+
+    @staticmethod
+    def _remove_domain(domain):
+        if domain.isActive():
+            domain.destroy()
+        domain.undefineFlags(libvirt.VIR_DOMAIN_UNDEFINE_MANAGED_SAVE |
+                             libvirt.VIR_DOMAIN_UNDEFINE_SNAPSHOTS_METADATA)
+
+    def _remove_network(self, name):
+        network = self.conn.networkLookupByName(name)
+        if network.isActive():
+            network.destroy()
+        network.undefine()
+
+    def run(self, inventory=None):
+        """
+        Remove what inventory() found: all domains at once, then all volumes,
+        then all networks. Returns a dict mapping each deployment ID to the
+        errors removing its resources ran into.
+        """
+        if inventory is None:
+            inventory = self.inventory()
+        errors = {dep_id: [] for dep_id in inventory}
+
+        def _remove_all(kind, remove, describe):
+            items = [(dep_id, item) for (dep_id, resources) in inventory.items()
+                     for item in resources[kind]]
+
+            def _remove(entry):
+                (dep_id, item) = entry
+                Log.info("Removing {} {}".format(kind[:-1], describe(item)))
+                try:
+                    remove(item)
+                except libvirt.libvirtError as error:
+                    Log.error("Removing {} {} failed: {}".format(kind[:-1], describe(item), error))
+                    errors[dep_id].append(error)
+            tools.parallel_map(_remove, items)
+
+        _remove_all('domains', self._remove_domain, lambda domain: domain.name())
+        _remove_all('volumes', lambda volume: volume.delete(0), lambda volume: volume.name())
+        _remove_all('networks', self._remove_network, lambda name: name)
+        return errors
@@ -1,17 +1,23 @@
-import fcntl
+import asyncio
+import codecs
+import collections
 import os
 import random
 import re
+import selectors
+import socket
 import string
 import subprocess
 import sys
 import time
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urlparse
 from typing import Tuple
 
 import requests
 
-from .exceptions import CmdException
+from .constant import Constant
+from .exceptions import CmdException, CommandsFailed
 from .log import Log
 
 
@@ -25,6 +31,63 @@ def is_a_glob(a_string):
     return False
 
 
+def parallel_map(func, items, jobs=None):
+    """
+    Like map(), but call func on the items concurrently, on a pool of at most
+    "jobs" (default: Constant.JOBS) threads. Returns the list of results in the
+    order of "items"; if any call raised, the exception raised by the earliest
+    such item is re-raised.
+    """
+    items = list(items)
+    jobs = min(jobs if jobs else Constant.JOBS, len(items))
+    if jobs <= 1:
+        return [func(item) for item in items]
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        return list(executor.map(func, items))
+
+
+def backoff(probe, timeout, initial=0.25, maximum=8.0):
+    """
+    Call probe() until it returns a true value, sleeping between the calls
+    for "initial" seconds first and twice as long each time after, up to
+    "maximum" seconds, for at most "timeout" seconds in all. Returns the last
+    value probe() returned.
+    """
+    deadline = time.monotonic() + timeout
+    delay = initial
+    while True:
+        result = probe()
+        remaining = deadline - time.monotonic()
+        if result or remaining <= 0:
+            return result
+        time.sleep(min(delay, remaining))
+        delay = min(delay * 2, maximum)
+
+
+def ssh_banner(address, port=22, timeout=2.0):
+    """
+    Return True if an SSH server answers on "address" and "port"
+    """
+    try:
+        with socket.create_connection((address, port), timeout=timeout) as sock:
+            return sock.recv(4).startswith(b'SSH-')
+    except OSError:
+        return False
+
+
+def process_alive(pid):
+    """
+    Return True if a process with ID "pid" is running
+    """
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
 def run_sync(command, cwd=None):
     Log.info("Running sync command in directory {}: {}"
              .format(cwd if cwd else ".", command)
@@ -40,38 +103,216 @@ def run_sync(command, cwd=None):
     return stdout.decode('utf-8')
 
 
-def _non_block_read(fout):
-    # pylint: disable=invalid-name
-    fd = fout.fileno()
-    fl = fcntl.fcntl(fd, fcntl.F_GETFL)
-    fcntl.fcntl(fd, fcntl.F_SETFL, fl | os.O_NONBLOCK)
-    try:
-        return fout.read()
-    except Exception:  # pylint: disable=broad-except
-        return None
+class CommandSpec():
+    """
+    A command for run_many(): "command" is the argument list, "name" (e.g. a
+    node name) labels its output and result
+    """
+    def __init__(self, command, name=None, cwd=None, timeout=None):
+        self.command = command
+        self.name = name
+        self.cwd = cwd
+        self.timeout = timeout
+
+
+class CommandResult():
+    def __init__(self, command, returncode, stderr_tail=None, **kwargs):
+        self.command = command
+        self.returncode = returncode
+        self.stderr_tail = stderr_tail if stderr_tail is not None else []
+        self.name = kwargs.get('name', None)
+        self.output = kwargs.get('output', '')
+        self.timed_out = kwargs.get('timed_out', False)
 
 
-def run_async(command, callback, cwd=None):
+class _LineSplitter():
+    """
+    Turns the chunks of bytes read from a pipe into complete lines of text,
+    decoding UTF-8 sequences even when they are split between chunks. Lines
+    end with LF, CRLF or a lone CR (progress bars): a CR at the end of a
+    chunk is held back until the next one shows whether an LF follows.
+    """
+    _LINE = re.compile(r'[^\r\n]*(?:\r\n|\n|\r(?!\Z))')
+
+    def __init__(self):
+        self._decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        self._partial_line = ''
+
+    def feed(self, data):
+        """
+        Return the lines completed by "data"; an empty "data" (EOF) flushes
+        whatever is left
+        """
+        text = self._partial_line + self._decoder.decode(data, final=not data)
+        lines = self._LINE.findall(text)
+        self._partial_line = text[sum(len(line) for line in lines):]
+        if not data and self._partial_line:
+            lines.append(self._partial_line)
+            self._partial_line = ''
+        return lines
+
+
+def run_async(command, callback, cwd=None, check=True, stderr_lines=50):
+    """
+    Run "command" and pass its output to "callback" line by line, as soon as
+    each line arrives. stdout and stderr are drained concurrently, so the
+    command never blocks on a full pipe; stdout goes to the callback, while the
+    last "stderr_lines" lines of stderr are kept for the CommandResult this
+    returns. Raises CmdException if the command fails, unless "check" is False.
+    """
     Log.info("Running async command in directory {}: {}"
              .format(cwd if cwd else ".", command)
             )
     callback("=== Running shell command ===\n{}\n".format(" ".join(command)))
     _command = ["stdbuf", "-oL"]
     _command.extend(command)
+    stderr_tail = collections.deque(maxlen=stderr_lines)
     with subprocess.Popen(_command, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
-                          cwd=cwd) as proc:
+                          cwd=cwd) as proc, selectors.DefaultSelector() as selector:
+        selector.register(proc.stdout, selectors.EVENT_READ, callback)
+        selector.register(proc.stderr, selectors.EVENT_READ,
+                          lambda line: stderr_tail.append(line.rstrip('\r\n')))
+        splitters = {proc.stdout: _LineSplitter(), proc.stderr: _LineSplitter()}
+        while selector.get_map():
+            for (key, _) in selector.select():
+                stream = key.fileobj
+                data = os.read(stream.fileno(), 65536)
+                for line in splitters[stream].feed(data):
+                    key.data(line)
+                if not data:
+                    selector.unregister(stream)
+        retcode = proc.wait()
+    if check and retcode != 0:
+        raise CmdException(command, retcode, '\n'.join(stderr_tail))
+    return CommandResult(command, retcode, list(stderr_tail))
+
+
+async def _run_command(spec, callback, stderr_lines):
+    output = []
+    stderr_tail = collections.deque(maxlen=stderr_lines)
+
+    def _handle_output(line):
+        output.append(line)
+        if callback:
+            callback(spec.name, line)
+
+    async def _drain(stream, handle_line):
+        splitter = _LineSplitter()
         while True:
-            time.sleep(0.5)
-            output = _non_block_read(proc.stdout)
-            if output:
-                # got new output
-                callback(output.decode('utf-8'))
-            retcode = proc.poll()
-            if retcode is not None:
-                if retcode != 0:
-                    raise CmdException(command, retcode, proc.stderr.read().decode('utf-8'))
+            data = await stream.read(65536)
+            for line in splitter.feed(data):
+                handle_line(line)
+            if not data:
                 break
 
+    Log.info("Running command in directory {}: {}"
+             .format(spec.cwd if spec.cwd else ".", spec.command))
+    proc = await asyncio.create_subprocess_exec(
+        *spec.command,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        cwd=spec.cwd
+    )
+    timed_out = False
+    try:
+        await asyncio.wait_for(
+            asyncio.gather(
+                _drain(proc.stdout, _handle_output),
+                _drain(proc.stderr, lambda line: stderr_tail.append(line.rstrip('\r\n'))),
+                proc.wait()
+            ),
+            spec.timeout
+        )
+    except asyncio.TimeoutError:
+        Log.warning("Command {} timed out after {} seconds".format(spec.command, spec.timeout))
+        timed_out = True
+        proc.kill()
+        await proc.wait()
+    return CommandResult(spec.command, proc.returncode, list(stderr_tail),
+                         name=spec.name, output=''.join(output), timed_out=timed_out)
+
+
+async def gather_commands(specs, callback=None, jobs=None, stderr_lines=50):
+    """
+    Run the CommandSpecs concurrently, at most "jobs" (default: Constant.JOBS)
+    at a time, and return their CommandResults in the order of "specs".
+    "callback", if given, is called as callback(name, line) for each line of
+    stdout; the lines of any one command arrive in order.
+    """
+    semaphore = asyncio.Semaphore(jobs if jobs else Constant.JOBS)
+
+    async def _run(spec):
+        async with semaphore:
+            return await _run_command(spec, callback, stderr_lines)
+
+    return await asyncio.gather(*[_run(spec) for spec in specs])
+
+
+async def _run_chain(name, specs, callback, timeout, stderr_lines):
+    results = []
+    deadline = time.monotonic() + timeout if timeout else None
+    for spec in specs:
+        spec_timeout = spec.timeout
+        if deadline is not None:
+            remaining = max(deadline - time.monotonic(), 0)
+            spec_timeout = min(spec_timeout, remaining) if spec_timeout else remaining
+        result = await _run_command(
+            CommandSpec(spec.command, name=name, cwd=spec.cwd, timeout=spec_timeout),
+            callback,
+            stderr_lines
+        )
+        results.append(result)
+        if result.returncode != 0:
+            break
+    return results
+
+
+async def gather_chains(chains, callback=None, jobs=None, timeout=None, stderr_lines=50):
+    """
+    Like gather_commands(), but for named chains of commands. "chains" maps a
+    name to a list of CommandSpecs, which run one after another (stopping at
+    the first failure) within "timeout" seconds for the whole chain. Returns a
+    dict mapping each name to the CommandResults of the commands that ran.
+    """
+    semaphore = asyncio.Semaphore(jobs if jobs else Constant.JOBS)
+
+    async def _run(name, specs):
+        async with semaphore:
+            return await _run_chain(name, specs, callback, timeout, stderr_lines)
+
+    names = list(chains)
+    results = await asyncio.gather(*[_run(name, chains[name]) for name in names])
+    return dict(zip(names, results))
+
+
+def run_many(specs, callback=None, jobs=None, check=True):
+    """
+    Synchronous front end to gather_commands(). Raises CommandsFailed (which
+    carries all results) if any command failed, unless "check" is False.
+    """
+    specs = [spec if isinstance(spec, CommandSpec) else CommandSpec(spec) for spec in specs]
+    if not specs:
+        return []
+    results = asyncio.run(gather_commands(specs, callback, jobs))
+    if check and any(result.returncode != 0 for result in results):
+        raise CommandsFailed(results)
+    return results
+
+
+def run_chains(chains, callback=None, jobs=None, timeout=None):
+    """
+    Synchronous front end to gather_chains(). Commands may be given as
+    CommandSpecs or plain argument lists.
+    """
+    chains = {
+        name: [spec if isinstance(spec, CommandSpec) else CommandSpec(spec) for spec in specs]
+        for (name, specs) in chains.items()
+    }
+    if not chains:
+        return {}
+    return asyncio.run(gather_chains(chains, callback, jobs, timeout))
+
 
 def run_interactive(command, cwd=None):
     Log.info("Running interactive command in directory {}: {}"
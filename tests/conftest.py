@@ -0,0 +1,14 @@
+import pytest
+
+from seslib.constant import Constant
+
+
+@pytest.fixture(name='working_dir')
+def fixture_working_dir(tmp_path, monkeypatch):
+    """
+    Point the sesdev working directory (and the config file in it) to the
+    temporary directory of the test, and return that
+    """
+    monkeypatch.setattr(Constant, 'A_WORKING_DIR', str(tmp_path))
+    monkeypatch.setattr(Constant, 'CONFIG_FILE', str(tmp_path / 'config.yaml'))
+    return tmp_path
@@ -0,0 +1,72 @@
+from types import SimpleNamespace
+
+from seslib.bake import BakedImages
+from seslib.constant import Constant
+
+
+def _render(template_name, **context):
+    node = SimpleNamespace(name='master', custom_repos=[])
+    base_context = {
+        'os': 'sles-15-sp2',
+        'version': 'ses7',
+        'node': node,
+        'master': node,
+        'os_base_repos': [('base', 'http://example.com/base')],
+        'os_ca_repo': 'http://example.com/ca',
+        'version_devel_repos': [{'url': 'http://example.com/devel', 'priority': None}],
+        'devel_repo': True,
+        'core_version': True,
+        'baked': [],
+    }
+    base_context.update(context)
+    return Constant.JINJA_ENV.get_template(template_name).render(**base_context)
+
+
+def test_zypper_skips_baked_sections():
+    script = _render('zypper.j2')
+    assert 'zypper addrepo --refresh http://example.com/base base' in script
+    assert 'zypper --gpg-auto-import-keys refresh\nzypper repos' in script
+    assert 'zypper --non-interactive install rsync' in script
+
+    script = _render('zypper.j2', baked=['zypper-config', 'repos', 'base-packages'])
+    assert 'zypp.conf' not in script
+    assert 'http://example.com/base' not in script
+    assert 'addrepo --refresh http://example.com/ca' not in script
+    assert 'bash -e "/home/vagrant/add-devel-repo.sh"' not in script
+    assert 'zypper --gpg-auto-import-keys refresh\nzypper repos' not in script
+    assert 'install rsync' not in script
+    # the helper scripts are written all the same
+    assert 'cat > /home/vagrant/add-devel-repo.sh' in script
+    assert 'cat > /home/vagrant/upgrade.sh' in script
+
+    custom_node = SimpleNamespace(name='master', custom_repos=[
+        SimpleNamespace(name='custom', url='http://example.com/custom', priority=None)])
+    script = _render('zypper.j2', baked=['repos'], node=custom_node)
+    assert 'zypper --gpg-auto-import-keys refresh\nzypper repos' in script
+
+
+def test_bake_script():
+    script = _render('bake.sh.j2',
+                     sections=['zypper-config', 'repos', 'base-packages', 'salt-minion',
+                               'ceph-packages'],
+                     ceph_packages=BakedImages.CEPH_PACKAGES)
+    assert 'zypper addrepo --refresh http://example.com/base base' in script
+    assert 'zypper --non-interactive install salt-minion' in script
+    assert 'zypper --non-interactive install podman cephadm ceph-common' in script
+    assert 'truncate -s 0 /etc/machine-id' in script
+
+
+def _image(volume, version='ses7', os_name='sles-15-sp2'):
+    return {'uri': 'qemu:///system', 'pool': 'default', 'version': version, 'os': os_name,
+            'volume': volume, 'sections': ['repos'], 'fingerprint': {}}
+
+
+def test_baked_images_record(tmp_path):
+    images = BakedImages(str(tmp_path / 'baked-images.json'))
+    assert images.find('qemu:///system', 'default', 'ses7', 'sles-15-sp2') is None
+    assert images.record(_image('one')) is None
+    assert images.record(_image('other', version='pacific', os_name='leap-15.3')) is None
+    assert images.record(_image('two'))['volume'] == 'one'
+    assert images.find('qemu:///system', 'default', 'ses7', 'sles-15-sp2')['volume'] == 'two'
+    assert images.find('qemu:///system', 'other-pool', 'ses7', 'sles-15-sp2') is None
+    assert sorted(image['volume'] for image in images.load()) == ['other', 'two']
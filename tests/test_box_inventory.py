@@ -0,0 +1,21 @@
+from seslib.box import Box
+
+
+def test_parse_box_list():
+    output = (
+        "leap-15.2                (libvirt, 0)\n"
+        "opensuse/Leap-15.3.x86_64 (libvirt, 15.3.13.37)\n"
+        "sles-15-sp2              (virtualbox, 0)\n"
+    )
+    assert Box._parse_box_list(output) == [
+        ('leap-15.2', 'libvirt', '0'),
+        ('opensuse/Leap-15.3.x86_64', 'libvirt', '15.3.13.37'),
+        ('sles-15-sp2', 'virtualbox', '0'),
+    ]
+
+
+def test_parse_box_list_no_boxes():
+    output = (
+        "There are no installed boxes! Use `vagrant box add` to add some.\n"
+    )
+    assert Box._parse_box_list(output) == []
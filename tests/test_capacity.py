@@ -0,0 +1,149 @@
+import json
+import os
+
+import pytest
+
+# seslib needs libvirt
+libvirt = pytest.importorskip('libvirt')
+
+from seslib.capacity import AdmissionQueue, HostCapacity  # noqa: E402
+from seslib.constant import Constant  # noqa: E402
+from seslib.exceptions import HostCapacityExceeded  # noqa: E402
+
+GiB = 2**30
+
+
+class FakeDomain():
+    def __init__(self, ram_mib, vcpus, name):
+        self.ram_mib = ram_mib
+        self.vcpus = vcpus
+        self._name = name
+
+    def name(self):
+        return self._name
+
+    def info(self):
+        return [libvirt.VIR_DOMAIN_RUNNING, self.ram_mib * 2**10, self.ram_mib * 2**10,
+                self.vcpus, 0]
+
+
+class FakeHost():
+    def __init__(self, ram_mib=32768, cpus=8, free_mib=20000, pool_gib=(500, 100)):
+        self.ram_mib = ram_mib
+        self.cpus = cpus
+        self.free_mib = free_mib
+        self.pool_gib = pool_gib
+        self.domains = [FakeDomain(8192, 4, 'other_node1'), FakeDomain(4096, 2, 'other_node2')]
+
+    def getInfo(self):
+        return ['x86_64', self.ram_mib, self.cpus, 2400, 1, 1, 4, 2]
+
+    def listAllDomains(self, _flags):
+        return self.domains
+
+    def getFreeMemory(self):
+        return self.free_mib * 2**20
+
+    def storagePoolLookupByName(self, _name):
+        return self
+
+    def refresh(self, _flags):
+        pass
+
+    def info(self):
+        (capacity, available) = self.pool_gib
+        return [2, capacity * GiB, (capacity - available) * GiB, available * GiB]
+
+
+def test_host_capacity():
+    capacity = HostCapacity(FakeHost(), 'default')
+    # running VMs leave 20480 MiB, but only 20000 MiB are actually free
+    assert capacity.left == {'ram': 20000 - Constant.HOST_RAM_RESERVE_IN_MB,
+                             'cpus': 8 * Constant.VCPU_OVERCOMMIT_RATIO - 6,
+                             'disk': 100}
+    assert capacity.shortfall({'ram': 8192, 'cpus': 8, 'disk': 40}) is None
+    assert capacity.shortfall({'ram': 8192, 'cpus': 8, 'disk': 40},
+                              [{'ram': 8192, 'cpus': 8, 'disk': 80}]) == \
+        'needs 40 GiB of storage pool space, 20 left'
+    assert capacity.shortfall({'ram': 65536, 'cpus': 8, 'disk': 40}, total=True) == \
+        'needs 65536 MiB of RAM, {} left'.format(32768 - Constant.HOST_RAM_RESERVE_IN_MB)
+
+
+REQUEST = {'ram': 8192, 'cpus': 4, 'disk': 40}
+
+
+def _queue(tmp_path):
+    return AdmissionQueue(str(tmp_path / 'queue'))
+
+
+def test_admitted(tmp_path):
+    queue = _queue(tmp_path)
+    host = FakeHost()
+    with queue.admitted('foo', 'qemu:///system', REQUEST,
+                        lambda: HostCapacity(host, 'default'), wait=False):
+        (ticket,) = [name for name in os.listdir(queue.path) if name.endswith('.json')]
+        with open(os.path.join(queue.path, ticket), encoding='utf-8') as file:
+            assert json.load(file)['admitted']
+        # what is admitted counts as taken
+        with pytest.raises(HostCapacityExceeded, match='storage pool space'):
+            with queue.admitted('bar', 'qemu:///system', {'ram': 1024, 'cpus': 1, 'disk': 80},
+                                lambda: HostCapacity(host, 'default'), wait=False):
+                pass
+        # other hosts have queues of their own
+        with queue.admitted('baz', 'qemu+ssh://other/system', REQUEST,
+                            lambda: HostCapacity(FakeHost(), 'default'), wait=False):
+            pass
+    assert not [name for name in os.listdir(queue.path) if name.endswith('.json')]
+
+
+def test_fifo(tmp_path):
+    queue = _queue(tmp_path)
+    os.makedirs(queue.path)
+    with open(os.path.join(queue.path, '{:020d}-1-first.json'.format(0)), 'w',
+              encoding='utf-8') as file:
+        json.dump({'dep_id': 'first', 'pid': os.getpid(), 'uri': 'qemu:///system',
+                   'request': REQUEST, 'admitted': False}, file)
+    with pytest.raises(HostCapacityExceeded, match='1 deployment.s. ahead'):
+        with queue.admitted('foo', 'qemu:///system', REQUEST,
+                            lambda: HostCapacity(FakeHost(), 'default'), wait=False):
+            pass
+
+
+def test_wait(tmp_path, monkeypatch):
+    monkeypatch.setattr(Constant, 'ADMISSION_POLL_INTERVAL_IN_SECONDS', 0.01)
+    queue = _queue(tmp_path)
+    host = FakeHost(free_mib=4096)
+    calls = []
+    messages = []
+
+    def _capacity():
+        calls.append(None)
+        if len(calls) == 3:
+            host.free_mib = 20000
+        return HostCapacity(host, 'default')
+
+    with queue.admitted('foo', 'qemu:///system', REQUEST, _capacity,
+                        log_handler=messages.append):
+        assert len(calls) == 3
+    assert len(messages) == 1 and 'MiB of RAM' in messages[0]
+
+    with pytest.raises(HostCapacityExceeded, match='65536 MiB'):
+        with queue.admitted('foo', 'qemu:///system', dict(REQUEST, ram=65536),
+                            lambda: HostCapacity(host, 'default')):
+            pass
+
+
+def test_admitted_and_running(tmp_path):
+    queue = _queue(tmp_path)
+    host = FakeHost()
+    with queue.admitted('foo', 'qemu:///system', REQUEST,
+                        lambda: HostCapacity(host, 'default'), wait=False):
+        # the VMs of "foo" are up (and being provisioned): they take what
+        # they take once, as running VMs, not again as admitted
+        host.domains += [FakeDomain(4096, 2, 'foo_master'), FakeDomain(4096, 2, 'foo_node1')]
+        host.free_mib -= 8192
+        with queue.admitted('bar', 'qemu:///system', dict(REQUEST, disk=10),
+                            lambda: HostCapacity(host, 'default'), wait=False):
+            pass
+        assert HostCapacity(host, 'default').pending('foo', REQUEST) == \
+            {'ram': 0, 'cpus': 0, 'disk': 40}
@@ -0,0 +1,188 @@
+import xml.etree.ElementTree as ET
+from types import SimpleNamespace
+
+import pytest
+
+# seslib needs libvirt
+libvirt = pytest.importorskip('libvirt')
+
+from seslib.constant import Constant  # noqa: E402
+from seslib.deployment import Deployment, Disk  # noqa: E402
+from seslib.libvirt_engine import LibvirtEngine  # noqa: E402
+from seslib.lock import DeploymentLock  # noqa: E402
+from seslib.node import Node  # noqa: E402
+
+DOMAIN_XML = """
+<domain>
+  <name>foo_node1</name>
+  <devices>
+    <disk type='file' device='disk'>
+      <source file='/pool/foo_node1.img'/>
+      <target dev='vda'/>
+    </disk>
+    <disk type='file' device='disk'>
+      <source file='/pool/foo_node1-vdb.qcow2'/>
+      <target dev='vdb'/>
+      <serial>0123456789</serial>
+    </disk>
+    <disk type='file' device='cdrom'>
+      <source file='/pool/foo_node1-seed.iso'/>
+      <target dev='sda'/>
+    </disk>
+  </devices>
+</domain>
+"""
+
+
+class FakeVolume():
+    def __init__(self, path, capacity=2**30):
+        self._path = path
+        self.capacity = capacity
+
+    def path(self):
+        return self._path
+
+    def info(self):
+        return [0, self.capacity, 0]
+
+
+class FakePool():
+    def __init__(self):
+        self.created = []
+
+    def storageVolLookupByName(self, name):
+        raise libvirt.libvirtError('no such volume {}'.format(name))
+
+    def createXML(self, xml):
+        tree = ET.fromstring(xml)
+        self.created.append((tree.findtext('name'), tree.findtext('./backingStore/path')))
+        return FakeVolume('/pool/{}'.format(tree.findtext('name')))
+
+
+class FakeDomain():
+    def name(self):
+        return 'foo_node1'
+
+    def XMLDesc(self, _flags):
+        return DOMAIN_XML
+
+
+class FakeConnection():
+    def __init__(self):
+        self.pool = FakePool()
+        self.defined = []
+
+    def isAlive(self):
+        return 1
+
+    def lookupByName(self, name):
+        if name != 'foo_node1':
+            raise libvirt.libvirtError('no such domain {}'.format(name))
+        return FakeDomain()
+
+    def storagePoolLookupByName(self, _name):
+        return self.pool
+
+    def storageVolLookupByPath(self, path):
+        return FakeVolume(path)
+
+    def defineXML(self, xml):
+        self.defined.append(ET.fromstring(xml))
+
+
+def _engine(dep_id, conn):
+    settings = SimpleNamespace(domain='foo.test', public_network='10.20.98.', libvirt_host=None,
+                               libvirt_user=None, libvirt_use_ssh=False,
+                               libvirt_private_key_file=None, libvirt_storage_pool=None)
+    nodes = {'node1': Node('node1', 'node1.foo.test', ['storage'], None,
+                           public_address='10.20.98.201', storage_disks=[Disk(1)],
+                           ram=1024, cpus=1)}
+    engine = LibvirtEngine(dep_id, '/nonexistent', settings, nodes, domain_type='test')
+    engine._conn = conn
+    return engine
+
+
+def test_freeze_disks_and_define_clone():
+    conn = FakeConnection()
+    frozen = _engine('foo', conn).freeze_disks('node1', 'clone-bar')
+    assert frozen == [('vda', '/pool/foo_node1.img', None),
+                      ('vdb', '/pool/foo_node1-vdb.qcow2', '0123456789')]
+    assert conn.pool.created == [
+        ('foo_node1-vda.clone-bar.qcow2', '/pool/foo_node1.img'),
+        ('foo_node1-vdb.clone-bar.qcow2', '/pool/foo_node1-vdb.qcow2')]
+    sources = [disk.find('source').get('file')
+               for disk in conn.defined[0].findall('./devices/disk')]
+    assert sources == ['/pool/foo_node1-vda.clone-bar.qcow2',
+                       '/pool/foo_node1-vdb.clone-bar.qcow2',
+                       '/pool/foo_node1-seed.iso']
+
+    clone_conn = FakeConnection()
+    clone = _engine('bar', clone_conn)
+    clone.define_clone(clone.nodes['node1'], frozen)
+    assert clone_conn.pool.created == [('bar_node1.img', '/pool/foo_node1.img'),
+                                       ('bar_node1-vdb.qcow2', '/pool/foo_node1-vdb.qcow2')]
+    tree = clone_conn.defined[0]
+    assert tree.findtext('name') == 'bar_node1'
+    assert tree.find('./devices/interface/source').get('network') == 'sesdev-bar'
+    assert [disk.findtext('serial') for disk in tree.findall('./devices/disk')] == \
+        [None, '0123456789']
+    assert tree.find("./devices/disk[@device='cdrom']") is None
+
+
+def test_clone_from_failure(working_dir):
+    for subdir in ['keys', 'bin']:
+        (working_dir / 'foo' / subdir).mkdir(parents=True)
+    source = _engine('foo', FakeConnection())
+    source = SimpleNamespace(dep_id='foo', nodes=source.nodes, engine=source)
+    defined = []
+    destroyed = []
+
+    def _start():
+        raise libvirt.libvirtError('boom')
+    clone = SimpleNamespace(
+        dep_id='bar', nodes=source.nodes, lock=DeploymentLock('bar'),
+        _dep_dir=str(working_dir / 'bar'), _write_metadata=lambda: None,
+        engine=SimpleNamespace(define_network=lambda: None,
+                               define_clone=lambda node, _disks: defined.append(node.name),
+                               start=_start),
+        destroy_many=lambda deps, _log_handler: destroyed.extend(dep.dep_id for dep in deps))
+    with pytest.raises(libvirt.libvirtError):
+        Deployment.clone_from(clone, source, print)
+    assert defined == ['node1']
+    # what there was of the clone is gone again
+    assert destroyed == ['bar']
+
+
+def _render(node_name):
+    nodes = [SimpleNamespace(name='master', public_address='10.20.7.200'),
+             SimpleNamespace(name='node1', public_address='10.20.7.201')]
+    node = nodes[0] if node_name == 'master' else nodes[1]
+    return Constant.JINJA_ENV.get_template('readdress.sh.j2').render(
+        node=node,
+        master=nodes[0],
+        nodes=nodes,
+        addresses=[('10.20.5.200', '10.20.7.200'), ('10.20.5.201', '10.20.7.201'),
+                   ('10.21.5.201', '10.21.7.201')],
+        networks=[('10.20.5.0/24', '10.20.7.0/24'), ('10.21.5.0/24', '10.21.7.0/24')],
+        prefixes=['10.20.5.', '10.21.5.'],
+        deployment_tool='cephadm',
+        reasonable_timeout_in_seconds=300)
+
+
+def test_readdress_script():
+    script = _render('master')
+    assert r"grep -rlE '10\.20\.5\.|10\.21\.5\.'" in script
+    assert r"-e 's|\b10\.20\.5\.0/24\b|10.20.7.0/24|g'" in script
+    assert r"-e 's|\b10\.20\.5\.201\b|10.20.7.201|g'" in script
+    assert 'NEW_ADDRESS["10.21.5.201"]="10.21.7.201"' in script
+    # the networks are rewritten before the addresses in them
+    assert script.index('10\\.20\\.5\\.0/24') < script.index('10\\.20\\.5\\.200')
+    assert 'systemctl restart salt-master' in script
+    assert 'ceph orch host set-addr node1 10.20.7.201' not in script
+    assert '$CEPH orch host set-addr node1 10.20.7.201' in script
+    assert '= "10.21.5.0/24" ]' in script
+
+    script = _render('node1')
+    assert 'systemctl restart salt-master' not in script
+    assert 'set-addr' not in script
+    assert 'systemctl restart salt-minion' in script
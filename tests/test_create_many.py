@@ -0,0 +1,110 @@
+import contextlib
+import threading
+
+from types import SimpleNamespace
+
+import pytest
+
+from sesdev import _manifest_deployments
+from seslib.box import Box
+from seslib.deployment import Deployment
+from seslib.exceptions import CmdException, ManifestInvalid
+
+MANIFEST = """
+defaults:
+  os: leap-15.3
+  ram: 4
+deployments:
+  - id: ci-octopus
+    version: octopus
+    roles: [[master, admin, bootstrap, storage, mon, mgr], [storage, mon, mgr]]
+  - id: ci-mini
+    version: pacific
+    single-node: true
+    num-disks: 1
+  - version: nonsense
+  - id: ci-octopus
+    version: octopus
+    single_node: true
+  - id: ci-bad-option
+    version: octopus
+    bogus: 1
+"""
+
+
+def test_manifest(working_dir, monkeypatch):
+    monkeypatch.setattr(Box, 'inventory', classmethod(lambda cls: []))
+    manifest = working_dir / 'manifest.yaml'
+    manifest.write_text(MANIFEST)
+    entries = _manifest_deployments(str(manifest), wait_for_capacity=False)
+    assert [entry['id'] for (entry, _, _) in entries] == \
+        ['ci-octopus', 'ci-mini', None, 'ci-octopus', 'ci-bad-option']
+    ((_, octopus, error), (_, mini, _)) = entries[:2]
+    assert error is None
+    assert octopus.settings.roles == [['admin', 'bootstrap', 'master', 'mgr', 'mon', 'storage'],
+                                      ['mgr', 'mon', 'storage']]
+    assert (octopus.settings.os, octopus.settings.ram) == ('leap-15.3', 4)
+    assert not octopus.settings.wait_for_capacity
+    assert (len(mini.nodes), mini.settings.num_disks) == (1, 1)
+    # each gets networks of its own
+    assert octopus.public_network_segment != mini.public_network_segment
+    (unknown_version, duplicate, bad_option) = [error for (_, _, error) in entries[2:]]
+    assert 'nonsense' in unknown_version
+    assert duplicate == "A deployment with the same id 'ci-octopus' already exists"
+    assert 'unknown option(s) bogus' in bad_option
+
+    manifest.write_text('deployments: {}')
+    with pytest.raises(ManifestInvalid):
+        _manifest_deployments(str(manifest))
+
+
+class FakeDeployment():
+    def __init__(self, dep_id, os_name, fail=None):
+        self.dep_id = dep_id
+        self.settings = SimpleNamespace(os=os_name)
+        self.fail = fail
+        self.calls = []
+
+    def _call(self, stage, log_handler):
+        self.calls.append(stage)
+        log_handler("{} done\n".format(stage))
+        if stage == self.fail:
+            raise CmdException('vagrant up', 1, 'boom')
+
+    def save(self, log_handler):
+        self._call('save', log_handler)
+
+    @contextlib.contextmanager
+    def admitted(self, log_handler):
+        self._call('admitted', log_handler)
+        yield
+
+    def start(self, log_handler):
+        self._call('start', log_handler)
+
+    def user_provision(self, log_handler=None):
+        self._call('user_provision', log_handler)
+
+
+def test_create_many():
+    saves = []
+    lock = threading.Lock()
+    deps = [FakeDeployment('a', 'leap-15.3'), FakeDeployment('b', 'leap-15.3', fail='start'),
+            FakeDeployment('c', 'sles-15-sp3', fail='save')]
+    for dep in deps:
+        def _save(log_handler, dep=dep):
+            with lock:
+                saves.append(dep.dep_id)
+            FakeDeployment.save(dep, log_handler)
+        dep.save = _save
+    lines = []
+    results = Deployment.create_many(deps, lines.append)
+    # the first deployment of each OS is saved (and fetches its box) before the others
+    assert saves.index('b') > saves.index('a')
+    assert deps[0].calls == ['save', 'admitted', 'start', 'user_provision']
+    assert deps[1].calls == ['save', 'admitted', 'start']
+    assert deps[2].calls == ['save']
+    assert {dep_id: (result['status'], result['stage'])
+            for (dep_id, result) in results.items()} == \
+        {'a': ('running', None), 'b': ('failed', 'start'), 'c': ('failed', 'save')}
+    assert '[a] start done\n' in lines
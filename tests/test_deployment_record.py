@@ -0,0 +1,89 @@
+import json
+import os
+
+import pytest
+
+# seslib needs libvirt
+libvirt = pytest.importorskip('libvirt')
+
+from seslib.box import Box  # noqa: E402
+from seslib.constant import Constant  # noqa: E402
+from seslib.deployment import DeploymentRecord, _libvirt_node_statuses  # noqa: E402
+from seslib.settings import Settings, SettingsEncoder  # noqa: E402
+from seslib.state import StateStore  # noqa: E402
+
+
+def _write_metadata(work_dir, dep_id, **settings):
+    dep_dir = os.path.join(work_dir, dep_id)
+    os.makedirs(dep_dir)
+    with open(os.path.join(dep_dir, Constant.METADATA_FILENAME), 'w') as file:
+        json.dump({'id': dep_id, 'settings': Settings(**settings)}, file, cls=SettingsEncoder)
+
+
+def test_deployment_record_list(working_dir):
+    _write_metadata(str(working_dir), 'foo',
+                    version='ses7',
+                    os='sles-15-sp2',
+                    public_network='10.20.7.',
+                    cluster_network='10.21.7.',
+                    roles=[['master', 'admin'], ['storage', 'mon'], ['storage', 'mon']])
+    os.makedirs(str(working_dir / 'not-a-deployment'))
+    records = DeploymentRecord.list()
+    assert [r.dep_id for r in records] == ['foo']
+    record = records[0]
+    assert list(record.nodes) == ['master', 'node1', 'node2']
+    assert record.nodes['node2'].fqdn == 'node2.foo.test'
+    assert record.nodes['node2'].public_address == '10.20.7.202'
+    assert record.nodes['node2'].cluster_address == '10.21.7.202'
+    assert record.public_network_segment == '10.20.7.0/24'
+    assert record.settings.os == 'sles-15-sp2'
+
+
+def test_last_known_status(working_dir, monkeypatch):
+    _write_metadata(str(working_dir), 'foo', vm_engine='libvirt-native', public_network='10.20.7.',
+                    roles=[['master', 'admin'], ['storage', 'mon']])
+    record = DeploymentRecord.list()[0]
+    record.nodes['master'].status = 'running'
+    StateStore().set_node_statuses('foo', [record.nodes['master']])
+
+    def _unreachable(_uri):
+        raise libvirt.libvirtError('cannot connect')
+    monkeypatch.setattr(Box, 'domain_states', _unreachable)
+    record = DeploymentRecord.load('foo', load_status=True)
+    assert record.nodes['master'].status == 'running'
+    assert record.nodes['master'].status_updated is not None
+    # never recorded
+    assert (record.nodes['node1'].status, record.nodes['node1'].status_updated) == \
+        ('unknown', None)
+
+
+def _write_machine_id(dep_dir, node, uuid):
+    machine_dir = os.path.join(dep_dir, '.vagrant', 'machines', node, 'libvirt')
+    os.makedirs(machine_dir)
+    with open(os.path.join(machine_dir, 'id'), 'w') as file:
+        file.write(uuid)
+
+
+def test_libvirt_node_statuses(tmp_path):
+    dep_dir = str(tmp_path)
+    _write_machine_id(dep_dir, 'master', 'uuid-master')
+    _write_machine_id(dep_dir, 'node1', 'uuid-node1')
+    _write_machine_id(dep_dir, 'node2', 'uuid-gone')
+    domain_states = {
+        'foo_master': 'running', 'uuid-master': 'running',
+        'foo_node1': 'suspended', 'uuid-node1': 'suspended',
+    }
+    nodes = ['master', 'node1', 'node2', 'node3']
+    assert _libvirt_node_statuses('foo', dep_dir, nodes, domain_states) == {
+        'master': 'running',
+        'node1': 'suspended',
+        'node2': 'not deployed',
+        'node3': 'not deployed',
+    }
+    # recorded domain gone, but another one with the same name exists
+    domain_states['foo_node2'] = 'stopped'
+    assert _libvirt_node_statuses('foo', dep_dir, nodes, domain_states) is None
+    # domain in a state libvirt cannot tell
+    del domain_states['foo_node2']
+    domain_states['uuid-node1'] = None
+    assert _libvirt_node_statuses('foo', dep_dir, nodes, domain_states) is None
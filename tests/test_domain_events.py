@@ -0,0 +1,131 @@
+import socket
+import threading
+
+import pytest
+
+# seslib needs libvirt
+libvirt = pytest.importorskip('libvirt')
+
+from seslib import tools  # noqa: E402
+from seslib.box import Box  # noqa: E402
+from seslib.domains import DomainEvents  # noqa: E402
+
+
+class FakeDomain():
+    def __init__(self, name, active=True):
+        self._name = name
+        self.active = active
+
+    def name(self):
+        return self._name
+
+    def isActive(self):
+        return self.active
+
+
+class FakeConnection():
+    def __init__(self, events=True):
+        self.events = events
+        self.callbacks = {}
+        self.alive = True
+
+    def isAlive(self):
+        return int(self.alive)
+
+    def domainEventRegisterAny(self, _domain, event_id, callback, opaque):
+        if not self.events:
+            raise libvirt.libvirtError('no event loop')
+        self.callbacks[event_id] = (callback, opaque)
+        return event_id
+
+    def domainEventDeregisterAny(self, callback_id):
+        del self.callbacks[callback_id]
+
+    def stop(self, domain):
+        domain.active = False
+        (callback, opaque) = self.callbacks[libvirt.VIR_DOMAIN_EVENT_ID_LIFECYCLE]
+        callback(self, domain, libvirt.VIR_DOMAIN_EVENT_STOPPED, 0, opaque)
+
+
+def test_wait_stopped():
+    conn = FakeConnection()
+    domains = [FakeDomain('foo_master'), FakeDomain('foo_node1'), FakeDomain('foo_node2', False)]
+    with DomainEvents(conn) as events:
+        timer = threading.Timer(0.1, lambda: [conn.stop(domain) for domain in domains[:2]])
+        timer.start()
+        assert events.wait_stopped(domains, 10) == []
+        timer.join()
+    assert not conn.callbacks
+
+    domains[0].active = True
+    with DomainEvents(conn) as events:
+        assert events.wait_stopped(domains, 0.1) == [domains[0]]
+
+
+def test_wait_stopped_polls_without_events():
+    domain = FakeDomain('foo_master')
+    with DomainEvents(FakeConnection(events=False)) as events:
+        threading.Timer(0.1, lambda: setattr(domain, 'active', False)).start()
+        assert events.wait_stopped([domain], 10) == []
+        assert not events.wait_for(domain, 10)
+
+
+def test_wait_for_reboot():
+    conn = FakeConnection()
+    domain = FakeDomain('foo_master')
+    with DomainEvents(conn, libvirt.VIR_DOMAIN_EVENT_ID_REBOOT) as events:
+        (callback, opaque) = conn.callbacks[libvirt.VIR_DOMAIN_EVENT_ID_REBOOT]
+        assert not events.wait_for(domain, 0.1)
+        threading.Timer(0.1, lambda: callback(conn, domain, opaque)).start()
+        assert events.wait_for(domain, 10)
+
+
+def test_reconnect(monkeypatch):
+    opened = []
+
+    def _open(_uri):
+        opened.append(FakeConnection())
+        return opened[-1]
+    monkeypatch.setattr(libvirt, 'open', _open)
+    monkeypatch.setattr(Box, '_connections', {})
+    monkeypatch.setattr(Box, '_reconnect_callbacks', {})
+    monkeypatch.setattr(Box, '_start_event_loop', classmethod(lambda cls: None))
+    uri = 'qemu+ssh://virthost/system'
+    conn = Box.libvirt_connection(uri)
+    assert Box.libvirt_connection(uri) is conn
+    domain = FakeDomain('foo_master')
+    with DomainEvents(conn, uri=uri) as events:
+        conn.alive = False
+        new_conn = Box.libvirt_connection(uri)
+        assert opened == [conn, new_conn]
+        assert events.conn is new_conn
+        threading.Timer(0.1, lambda: new_conn.stop(domain)).start()
+        assert events.wait_stopped([domain], 10) == []
+    assert not new_conn.callbacks
+    assert Box._reconnect_callbacks == {uri: []}
+
+
+def test_backoff(monkeypatch):
+    delays = []
+    monkeypatch.setattr(tools.time, 'sleep', delays.append)
+    results = iter([False, False, False, False, 'ready'])
+    assert tools.backoff(lambda: next(results), 60, initial=1, maximum=4) == 'ready'
+    assert delays == [1, 2, 4, 4]
+    assert not tools.backoff(lambda: False, 0)
+
+
+def test_ssh_banner():
+    with socket.socket() as server:
+        server.bind(('127.0.0.1', 0))
+        server.listen(1)
+        port = server.getsockname()[1]
+
+        def _serve():
+            (client, _) = server.accept()
+            with client:
+                client.sendall(b'SSH-2.0-OpenSSH\r\n')
+        thread = threading.Thread(target=_serve)
+        thread.start()
+        assert tools.ssh_banner('127.0.0.1', port)
+        thread.join()
+    assert not tools.ssh_banner('127.0.0.1', port, timeout=0.5)
@@ -0,0 +1,62 @@
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+from seslib import tools
+from seslib.deployment import Deployment
+from seslib.exceptions import CommandsFailed
+
+
+def _python(code):
+    return [sys.executable, '-c', code]
+
+
+def test_run_chains_stops_at_first_failure():
+    results = tools.run_chains({
+        'a': [_python("print('a1')"), _python("import sys; sys.exit(2)"), _python("print('a3')")],
+        'b': [_python("print('b1')"), _python("print('b2')")],
+    })
+    assert [r.returncode for r in results['a']] == [0, 2]
+    assert [r.output for r in results['b']] == ['b1\n', 'b2\n']
+
+
+def test_run_chains_timeout_covers_whole_chain():
+    sleep = _python("import time; time.sleep(0.4)")
+    results = tools.run_chains({'a': [sleep, sleep, sleep]}, timeout=0.6)
+    assert [r.timed_out for r in results['a']] == [False, True]
+
+
+def _fake_deployment(*nodes):
+    return SimpleNamespace(dep_id='foo', nodes={node: None for node in nodes},
+                           _ssh_config_fresh=set(nodes))
+
+
+def test_for_each_node():
+    dep = _fake_deployment('master', 'node1')
+    lines = []
+    results = Deployment.for_each_node(
+        dep,
+        lambda node: [_python("print('hello from {}')".format(node))],
+        log_handler=lines.append
+    )
+    assert list(results) == ['master', 'node1']
+    assert results['node1'].ok
+    assert results['node1'].output == 'hello from node1\n'
+    assert sorted(lines) == ['[master] hello from master\n', '[node1] hello from node1\n']
+
+
+def test_for_each_node_failure():
+    dep = _fake_deployment('master', 'node1')
+
+    def _chain(node):
+        if node == 'node1':
+            return [_python("import sys; sys.exit('no luck')")]
+        return [_python("print('ok')")]
+    results = Deployment.for_each_node(dep, _chain, check=False)
+    assert results['master'].ok
+    assert not results['node1'].ok
+    with pytest.raises(CommandsFailed) as excinfo:
+        Deployment.for_each_node(dep, _chain)
+    assert len(excinfo.value.failed) == 1
+    assert excinfo.value.failed[0].name == 'node1'
@@ -0,0 +1,135 @@
+import base64
+import os
+from types import SimpleNamespace
+
+import pytest
+import yaml
+
+# seslib needs libvirt
+libvirt = pytest.importorskip('libvirt')
+
+from seslib.constant import Constant  # noqa: E402
+from seslib.deployment import Disk  # noqa: E402
+from seslib.libvirt_engine import LibvirtEngine  # noqa: E402
+from seslib.node import Node  # noqa: E402
+
+
+def _settings():
+    return SimpleNamespace(
+        domain='{}.test',
+        public_network='10.20.99.',
+        libvirt_host=None,
+        libvirt_user=None,
+        libvirt_use_ssh=False,
+        libvirt_private_key_file=None,
+        libvirt_storage_pool='default-pool',
+        baked_image=None,
+    )
+
+
+@pytest.fixture(name='engine')
+def fixture_engine():
+    nodes = {
+        'master': Node('master', 'master.foo.test', ['master'], None,
+                       public_address='10.20.99.200', ram=1024, cpus=1),
+        'node1': Node('node1', 'node1.foo.test', ['storage'], None,
+                      public_address='10.20.99.201', storage_disks=[Disk(1), Disk(1)],
+                      ram=1024, cpus=1),
+    }
+    return LibvirtEngine('foo', '/nonexistent', _settings(), nodes, domain_type='test')
+
+
+@pytest.fixture(name='test_engine')
+def fixture_test_engine(engine):
+    try:
+        libvirt.open('test:///default').close()
+    except libvirt.libvirtError as error:
+        pytest.skip("libvirt test driver not available: {}".format(error))
+    engine.uri = 'test:///default'
+    yield engine
+    engine.destroy()
+
+
+def _base_volume(engine):
+    return engine.pool.createXML(
+        "<volume><name>box.img</name><capacity unit='G'>1</capacity>"
+        "<target><format type='qcow2'/></target></volume>"
+    )
+
+
+def test_lifecycle(test_engine):
+    engine = test_engine
+    base_volume = _base_volume(engine)
+    try:
+        engine.define_network()
+        for node in engine.nodes.values():
+            engine.define_domain(node, base_volume)
+        assert sorted(name for name in engine.pool.listVolumes() if name.startswith('foo_')) == \
+            ['foo_master.img', 'foo_node1-vdb.qcow2', 'foo_node1-vdc.qcow2', 'foo_node1.img']
+
+        engine.start()
+        assert engine.conn.networkLookupByName('sesdev-foo').isActive()
+        assert engine.conn.lookupByName('foo_master').isActive()
+        assert engine.conn.lookupByName('foo_node1').isActive()
+        assert engine.stop(['node1'], timeout=10) == []
+        assert engine.conn.lookupByName('foo_master').isActive()
+        assert not engine.conn.lookupByName('foo_node1').isActive()
+
+        engine.destroy()
+        assert 'foo_master' not in [domain.name() for domain in engine.conn.listAllDomains()]
+        assert not [name for name in engine.pool.listVolumes() if name.startswith('foo_')]
+        assert 'sesdev-foo' not in engine.conn.listNetworks()
+    finally:
+        base_volume.delete(0)
+
+
+def test_statuses(engine):
+    assert engine.statuses({'foo_master': 'running', 'foo_node1': None}) == \
+        {'master': 'running', 'node1': 'unknown'}
+    assert engine.statuses({}) == {'master': 'not deployed', 'node1': 'not deployed'}
+
+
+def test_ssh_configs(engine):
+    assert engine.ssh_configs() == {'master': ('10.20.99.200', None),
+                                    'node1': ('10.20.99.201', None)}
+    engine.settings.libvirt_use_ssh = True
+    engine.settings.libvirt_host = 'virthost'
+    assert engine.ssh_configs()['node1'] == ('10.20.99.201', 'ssh virthost -W %h:%p')
+    # a bare file name is one in ~/.ssh, as for the libvirt URI
+    engine.settings.libvirt_private_key_file = 'id_virthost'
+    assert engine.ssh_configs()['node1'][1] == \
+        'ssh -i {}/.ssh/id_virthost virthost -W %h:%p'.format(os.path.expanduser('~'))
+
+
+def test_cloud_init_seed_user_data(engine, tmp_path, monkeypatch):
+    (tmp_path / 'keys').mkdir()
+    (tmp_path / 'keys' / 'sesdev').write_text('private key')
+    (tmp_path / 'keys' / 'sesdev.pub').write_text('public key')
+    (tmp_path / 'provision_master.sh').write_text('echo provisioning')
+    (tmp_path / 'qa').mkdir()
+    (tmp_path / 'qa' / 'health-ok.sh').write_text('true')
+    monkeypatch.setattr(Constant, 'PATH_TO_QA', str(tmp_path / 'qa'), raising=False)
+    engine.dep_dir = str(tmp_path)
+
+    user_data = engine._render('user-data.j2',
+                               node=engine.nodes['master'],
+                               master=True,
+                               files=engine._seed_files('master', True),
+                               log=LibvirtEngine.SEED_PROVISION_LOG,
+                               marker=LibvirtEngine.SEED_MARKER,
+                               marker_dir='/var/lib/sesdev')
+    assert user_data.startswith('#cloud-config\n')
+    config = yaml.safe_load(user_data)
+    assert config['fqdn'] == 'master.foo.test'
+    files = {entry['path']: entry for entry in config['write_files']}
+    assert sorted(files) == ['/etc/hosts',
+                             '/home/vagrant/.ssh/sesdev',
+                             '/home/vagrant/.ssh/sesdev.pub',
+                             '/home/vagrant/provision_master.sh',
+                             '/home/vagrant/sesdev-qa/health-ok.sh']
+    assert files['/home/vagrant/.ssh/sesdev']['permissions'] == '0600'
+    assert files['/etc/hosts']['append']
+    assert base64.b64decode(files['/etc/hosts']['content']).decode() == \
+        '10.20.99.200 master.foo.test master\n10.20.99.201 node1.foo.test node1\n'
+    assert 'provision_master.sh' in config['runcmd'][-1][-1]
+    assert LibvirtEngine.SEED_MARKER in config['runcmd'][-1][-1]
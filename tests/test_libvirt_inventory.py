@@ -0,0 +1,112 @@
+import pytest
+
+# seslib needs libvirt
+libvirt = pytest.importorskip('libvirt')
+
+from seslib.box import Box  # noqa: E402
+from seslib.inventory import LibvirtInventory  # noqa: E402
+from seslib.settings import Settings  # noqa: E402
+
+DOMAIN_XML = """
+<domain>
+  <devices>
+    <disk type='file'>
+      <source file='/var/lib/libvirt/images/{name}.img'/>
+    </disk>
+    <interface type='network'>
+      <source network='vagrant-libvirt'/>
+    </interface>
+    <interface type='network'>
+      <source network='{network}'/>
+    </interface>
+  </devices>
+</domain>
+"""
+
+
+class FakeObject():
+    def __init__(self, host, name, network=None):
+        self.host = host
+        self._name = name
+        self.network = network
+        self.xml_calls = 0
+
+    def name(self):
+        return self._name
+
+    def XMLDesc(self, _flags):
+        self.xml_calls += 1
+        return DOMAIN_XML.format(name=self._name, network=self.network)
+
+    def delete(self):
+        self.host.volumes.remove(self)
+
+
+class FakeHost():
+    def __init__(self):
+        self.calls = []
+        self.domains = [FakeObject(self, 'ci-1_master', 'ci-1-private'),
+                        FakeObject(self, 'ci-1_node1', 'ci-1-private'),
+                        FakeObject(self, 'ci-10_master', 'ci-10-private')]
+        self.volumes = [FakeObject(self, 'ci-1_master.img'),
+                        FakeObject(self, 'ci-1_node1-vdb.qcow2'),
+                        FakeObject(self, 'ci-10_master.img'),
+                        FakeObject(self, 'leap-15.2_vagrant_box_image_0_box.img'),
+                        FakeObject(self, 'sles-15-sp2_vagrant_box_image_0_box.img'),
+                        FakeObject(self, 'sles-15-sp2_vagrant_box_image_1_box.img'),
+                        FakeObject(self, 'sesdev-baked-ses7.qcow2')]
+
+    def listAllDomains(self, _flags):
+        self.calls.append('listAllDomains')
+        return self.domains
+
+    def storagePoolLookupByName(self, _name):
+        return self
+
+    def listNetworks(self):
+        return ['vagrant-libvirt', 'ci-1-private']
+
+    @staticmethod
+    def listDefinedNetworks():
+        return ['ci-10-private']
+
+    def refresh(self, _flags):
+        pass
+
+    def listAllVolumes(self, _flags):
+        self.calls.append('listAllVolumes')
+        return self.volumes
+
+    def storageVolLookupByName(self, name):
+        return [volume for volume in self.volumes if volume.name() == name][0]
+
+
+def test_inventory():
+    host = FakeHost()
+    inventory = LibvirtInventory(host, 'default')
+    assert [volume.name() for volume in inventory.volumes('ci-1')] == \
+        ['ci-1_master.img', 'ci-1_node1-vdb.qcow2']
+    assert [domain.name() for domain in inventory.domains('ci-10')] == ['ci-10_master']
+    assert inventory.volumes('leap-15.2') == []
+    assert len(inventory.box_images('sles-15-sp2')) == 2
+    assert inventory.networks('ci-1') == ['ci-1-private', 'vagrant-libvirt']
+    assert inventory.networks('ci-1', exclude=['vagrant-libvirt']) == ['ci-1-private']
+    inventory.networks('ci-1')
+    assert [domain.xml_calls for domain in host.domains] == [1, 1, 0]
+    assert inventory.network_names == {'vagrant-libvirt', 'ci-1-private', 'ci-10-private'}
+
+
+def test_box_lookups(monkeypatch):
+    host = FakeHost()
+    monkeypatch.setattr(Box, 'inventory', classmethod(lambda cls: []))
+    monkeypatch.setattr(Box, 'libvirt_connection', classmethod(lambda cls, uri: host))
+    box = Box(Settings())
+    assert box.get_images_by_deployment('ci-1') == ['ci-1_master.img', 'ci-1_node1-vdb.qcow2']
+    assert box.get_networks_by_deployment('ci-10') == ['ci-10-private']
+    assert box.get_image_by_box('opensuse/Leap-15.2') is None
+    image = box.get_image_by_box('leap-15.2')
+    assert image == 'leap-15.2_vagrant_box_image_0_box.img'
+    assert host.calls == ['listAllVolumes', 'listAllDomains']
+    box.remove_image(image)
+    assert box.get_image_by_box('leap-15.2') is None
+    assert host.calls == ['listAllVolumes', 'listAllDomains'] * 2
@@ -0,0 +1,101 @@
+import os
+import stat
+import threading
+
+import pytest
+
+from seslib.lock import DeploymentLock, atomic_write, locked
+
+
+pytestmark = pytest.mark.usefixtures('working_dir')
+
+
+def test_atomic_write(tmp_path):
+    path = str(tmp_path / 'metadata')
+    atomic_write(path, 'old')
+    atomic_write(path, b'new', mode=0o600)
+    with open(path, 'rb') as file:
+        assert file.read() == b'new'
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+    assert os.listdir(str(tmp_path)) == ['metadata']
+
+
+def _blocks(lock_method):
+    """Whether taking the lock in another thread has to wait"""
+    acquired = threading.Event()
+
+    def _take():
+        with lock_method():
+            acquired.set()
+    thread = threading.Thread(target=_take, daemon=True)
+    thread.start()
+    blocked = not acquired.wait(0.2)
+    return (blocked, thread, acquired)
+
+
+def test_shared_and_exclusive():
+    lock = DeploymentLock('foo')
+    with lock.shared():
+        (blocked, _, _) = _blocks(DeploymentLock('foo').shared)
+        assert not blocked
+        (blocked, thread, acquired) = _blocks(DeploymentLock('foo').exclusive)
+        assert blocked
+    assert acquired.wait(5)
+    thread.join()
+
+
+def test_reentrant():
+    lock = DeploymentLock('foo')
+    with lock.exclusive():
+        with lock.shared():
+            (blocked, thread, acquired) = _blocks(DeploymentLock('foo').shared)
+            assert blocked
+        # still exclusive after the nested shared hold
+        assert not acquired.wait(0.2)
+    assert acquired.wait(5)
+    thread.join()
+    with lock.shared():
+        with lock.exclusive():
+            assert _blocks(DeploymentLock('foo').shared)[0]
+        # back to shared
+        (blocked, thread, _) = _blocks(DeploymentLock('foo').shared)
+        assert not blocked
+        thread.join()
+
+
+def test_remove():
+    lock = DeploymentLock('foo')
+    holding = threading.Event()
+    release = threading.Event()
+
+    def _hold():
+        with DeploymentLock('foo').exclusive():
+            holding.set()
+            release.wait(5)
+    with lock.exclusive():
+        (blocked, thread, acquired) = _blocks(DeploymentLock('foo').exclusive)
+        assert blocked
+        lock.remove()
+        # one coming later locks a new lock file right away
+        holder = threading.Thread(target=_hold, daemon=True)
+        holder.start()
+        assert holding.wait(5)
+    # the waiting one gets the flock on the removed file, and moves on to the
+    # new one
+    assert not acquired.wait(0.2)
+    release.set()
+    assert acquired.wait(5)
+    thread.join()
+    holder.join()
+
+
+def test_locked():
+    class Thing():
+        def __init__(self):
+            self.lock = DeploymentLock('foo')
+
+        @locked(exclusive=True)
+        def change(self):
+            return _blocks(DeploymentLock('foo').shared)[0]
+
+    assert Thing().change()
@@ -0,0 +1,82 @@
+import pytest
+
+# seslib needs libvirt
+libvirt = pytest.importorskip('libvirt')
+
+from seslib.box import Box  # noqa: E402
+from seslib.managed_save import ManagedSave  # noqa: E402
+
+
+class FakeDomain():
+    def __init__(self, name, active=True, saved=False):
+        self._name = name
+        self.active = active
+        self.saved = saved
+        self.calls = []
+
+    def name(self):
+        return self._name
+
+    def UUIDString(self):
+        return 'uuid-{}'.format(self._name)
+
+    def isActive(self):
+        return self.active
+
+    def hasManagedSaveImage(self, _flags):
+        return self.saved
+
+    def managedSave(self, _flags):
+        self.calls.append('managedSave')
+        (self.active, self.saved) = (False, True)
+
+    def create(self):
+        self.calls.append('create')
+        (self.active, self.saved) = (True, False)
+
+
+class FakeConnection():
+    def __init__(self, domains):
+        self.domains = domains
+
+    def lookupByName(self, name):
+        return self.domains[name]
+
+    def getAllDomainStats(self, _stats):
+        stats = []
+        for domain in self.domains.values():
+            if domain.active:
+                state = (libvirt.VIR_DOMAIN_RUNNING, 1)
+            elif domain.saved:
+                state = (libvirt.VIR_DOMAIN_SHUTOFF, libvirt.VIR_DOMAIN_SHUTOFF_SAVED)
+            else:
+                state = (libvirt.VIR_DOMAIN_SHUTOFF, 1)
+            stats.append((domain, {'state.state': state[0], 'state.reason': state[1]}))
+        return stats
+
+
+@pytest.fixture(name='domains')
+def fixture_domains(monkeypatch):
+    domains = {'foo_master': FakeDomain('foo_master'),
+               'foo_node1': FakeDomain('foo_node1'),
+               'foo_node2': FakeDomain('foo_node2', active=False)}
+    conn = FakeConnection(domains)
+    monkeypatch.setattr(Box, 'libvirt_connection', classmethod(lambda cls, uri: conn))
+    return domains
+
+
+def _managed_save():
+    return ManagedSave('foo', 'test:///default', ['master', 'node1', 'node2'])
+
+
+def test_save_and_restore(domains):
+    assert _managed_save().save() == ['master', 'node1']
+    assert domains['foo_node2'].calls == []
+    states = Box.domain_states('test:///default')
+    assert (states['foo_master'], states['foo_node2']) == ('saved', 'stopped')
+
+    assert _managed_save().restore(['node1', 'node2']) == ['node1']
+    assert domains['foo_node1'].calls == ['managedSave', 'create']
+    assert Box.domain_states('test:///default')['foo_node1'] == 'running'
+    assert _managed_save().restore() == ['master']
+    assert _managed_save().restore() == []
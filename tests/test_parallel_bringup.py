@@ -0,0 +1,52 @@
+from types import SimpleNamespace
+
+from seslib import tools
+from seslib.deployment import Deployment
+
+
+def _fake_deployment(tmp_path, existing):
+    dep = SimpleNamespace(
+        dep_id='foo',
+        existing=existing,
+        nodes={'node1': None, 'master': None, 'node2': None},
+        master=SimpleNamespace(name='master'),
+        settings=SimpleNamespace(parallel_bringup=2),
+        _dep_dir=str(tmp_path),
+    )
+    dep._run_node_chains = lambda *args: Deployment._run_node_chains(dep, *args)
+    return dep
+
+
+def _record_run_chains(monkeypatch):
+    calls = []
+
+    def _run_chains(chains, callback=None, jobs=None, timeout=None):
+        calls.append(([spec.command[1:] for specs in chains.values() for spec in specs], jobs))
+        results = {}
+        for name in chains:
+            callback(name, 'hello from {}\n'.format(name))
+            results[name] = [tools.CommandResult(['vagrant'], 0, name=name)]
+        return results
+    monkeypatch.setattr(tools, 'run_chains', _run_chains)
+    return calls
+
+
+def test_parallel_bringup_new_deployment(tmp_path, monkeypatch):
+    calls = _record_run_chains(monkeypatch)
+    lines = []
+    Deployment._vagrant_parallel_up(_fake_deployment(tmp_path, False), lines.append)
+    up = ['up', '--no-destroy-on-error', '--no-provision']
+    assert calls == [
+        ([up + ['master']], 1),
+        ([up + ['node1'], up + ['node2']], 2),
+        ([['provision', 'master'], ['provision', 'node1'], ['provision', 'node2']], 3),
+    ]
+    assert '[node1] hello from node1\n' in lines
+    assert (tmp_path / 'logs' / 'node2.log').read_text() == 'hello from node2\n' * 2
+
+
+def test_parallel_bringup_existing_deployment(tmp_path, monkeypatch):
+    calls = _record_run_chains(monkeypatch)
+    Deployment._vagrant_parallel_up(_fake_deployment(tmp_path, True), lambda line: None)
+    up = ['up', '--no-destroy-on-error', '--no-provision']
+    assert calls == [([up + ['master'], up + ['node1'], up + ['node2']], 2)]
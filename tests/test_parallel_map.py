@@ -0,0 +1,39 @@
+import threading
+import time
+
+import pytest
+
+from seslib import tools
+
+
+def test_parallel_map_keeps_order():
+    def _slow_square(num):
+        time.sleep(0.01 * (5 - num))
+        return num * num
+    assert tools.parallel_map(_slow_square, range(5), jobs=5) == [0, 1, 4, 9, 16]
+    assert tools.parallel_map(_slow_square, [], jobs=5) == []
+
+
+def test_parallel_map_is_bounded():
+    running = []
+    peak = []
+    lock = threading.Lock()
+
+    def _track(_):
+        with lock:
+            running.append(1)
+            peak.append(len(running))
+        time.sleep(0.01)
+        with lock:
+            running.pop()
+    tools.parallel_map(_track, range(12), jobs=3)
+    assert max(peak) <= 3
+
+
+def test_parallel_map_raises_first_failure():
+    def _fail_odd(num):
+        if num % 2:
+            raise ValueError(num)
+        return num
+    with pytest.raises(ValueError, match='1'):
+        tools.parallel_map(_fail_odd, range(6), jobs=3)
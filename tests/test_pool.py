@@ -0,0 +1,151 @@
+import os
+import sys
+
+from types import SimpleNamespace
+
+import pytest
+
+from seslib import pool
+from seslib.constant import Constant
+from seslib.exceptions import CmdException, DeploymentDoesNotExists, PoolEmpty, \
+                              PoolNotConfigured
+from seslib.pool import DeploymentPool
+
+
+class FakeDeployment():
+    registry = {}
+
+    def __init__(self, dep_id, settings, status='stopped'):
+        self.dep_id = dep_id
+        self.settings = settings
+        self.nodes = {'master': SimpleNamespace(status=status)}
+        self.clone_error = None
+        self.destroy_error = False
+
+    @classmethod
+    def add(cls, dep_id, version, status='stopped', claimed_by=None, cloned_from=None):
+        cls.registry[dep_id] = cls(dep_id, SimpleNamespace(pool=version,
+                                                           pool_claimed_by=claimed_by,
+                                                           cloned_from=cloned_from),
+                                   status)
+        os.makedirs(os.path.join(Constant.A_WORKING_DIR, dep_id))
+        return cls.registry[dep_id]
+
+    def set_pool(self, version, claimed_by=None):
+        self.settings.pool = version
+        self.settings.pool_claimed_by = claimed_by
+
+    def stop(self, _log_handler):
+        self.nodes['master'].status = 'stopped'
+
+    def clone(self, _log_handler, new_id):
+        clone = self.add(new_id, None, cloned_from=self.dep_id)
+        if self.clone_error:
+            # left over if destroying it failed as well
+            clone.destroy_error = self.destroy_error
+            if not self.destroy_error:
+                self.destroy_many([clone], None)
+            raise self.clone_error
+        return clone
+
+    @classmethod
+    def load_many(cls, dep_ids, load_status=True):
+        return [cls.registry[dep_id] for dep_id in dep_ids]
+
+    @classmethod
+    def prepare(cls, dep_id, settings):
+        return cls(dep_id, settings, status='not_created')
+
+    @classmethod
+    def create_many(cls, deps, _log_handler):
+        for dep in deps:
+            dep.nodes['master'].status = 'running'
+            cls.registry[dep.dep_id] = dep
+            os.makedirs(os.path.join(Constant.A_WORKING_DIR, dep.dep_id))
+        return {dep.dep_id: {'status': 'running'} for dep in deps}
+
+    @classmethod
+    def destroy_many(cls, deps, _log_handler):
+        for dep in deps:
+            if not dep.destroy_error:
+                del cls.registry[dep.dep_id]
+                os.rmdir(os.path.join(Constant.A_WORKING_DIR, dep.dep_id))
+        return [dep.dep_id for dep in deps if dep.destroy_error]
+
+
+class FakeRecord():
+    @classmethod
+    def list(cls):
+        return list(FakeDeployment.registry.values())
+
+    @classmethod
+    def load(cls, dep_id):
+        if dep_id not in FakeDeployment.registry:
+            raise DeploymentDoesNotExists(dep_id)
+        return FakeDeployment.registry[dep_id]
+
+
+@pytest.fixture(name='deployment_pool')
+def fixture_deployment_pool(working_dir, monkeypatch):
+    monkeypatch.setattr(FakeDeployment, 'registry', {})
+    monkeypatch.setattr(pool, 'Deployment', FakeDeployment)
+    monkeypatch.setattr(pool, 'DeploymentRecord', FakeRecord)
+    return DeploymentPool('pacific')
+
+
+def test_fill(deployment_pool):
+    with pytest.raises(PoolNotConfigured):
+        deployment_pool.fill(print)
+    FakeDeployment.add('pool-pacific-1', 'pacific')
+    # left over by an interrupted fill
+    FakeDeployment.add('pool-pacific-2', 'pacific', status='running')
+    FakeDeployment.add('pool-pacific-3', 'pacific', claimed_by='ci-1')
+    FakeDeployment.add('pool-octopus-1', 'octopus')
+    results = deployment_pool.fill(print, 3, {'version': 'pacific'})
+    assert sorted(results) == ['pool-pacific-2', 'pool-pacific-4']
+    assert deployment_pool.members() == ['pool-pacific-1', 'pool-pacific-2', 'pool-pacific-4']
+    assert all(pool._parked(dep) for dep in FakeDeployment.registry.values())
+    settings = FakeDeployment.registry['pool-pacific-4'].settings
+    assert (settings.pool, settings.vm_engine) == ('pacific', 'libvirt-native')
+    assert deployment_pool.configuration() == {'size': 3, 'settings': {'version': 'pacific'}}
+
+    assert deployment_pool.fill(print) == {}
+    deployment_pool.fill(print, 1, {'version': 'pacific'})
+    assert deployment_pool.members() == ['pool-pacific-1']
+
+
+def test_claim(deployment_pool):
+    FakeDeployment.add('pool-pacific-1', 'pacific', claimed_by='ci-1')
+    member = FakeDeployment.add('pool-pacific-2', 'pacific')
+    FakeDeployment.add('pool-pacific-3', 'pacific', status='running')
+    member.clone_error = CmdException('ssh', 255, 'boom')
+    with pytest.raises(CmdException):
+        deployment_pool.claim('ci-2', print)
+    # back into the pool
+    assert member.settings.pool_claimed_by is None
+
+    member.destroy_error = True
+    with pytest.raises(CmdException):
+        deployment_pool.claim('ci-2', print)
+    # out of the pool, with the clone left over
+    assert member.settings.pool_claimed_by == 'ci-2'
+    assert deployment_pool.members() == ['pool-pacific-3']
+    member.settings.pool_claimed_by = None
+    FakeDeployment.registry['ci-2'].destroy_error = False
+    FakeDeployment.destroy_many([FakeDeployment.registry['ci-2']], print)
+
+    (member.clone_error, member.destroy_error) = (None, False)
+    assert deployment_pool.claim('ci-2', print).dep_id == 'ci-2'
+    assert member.settings.pool_claimed_by == 'ci-2'
+    assert deployment_pool.members() == ['pool-pacific-3']
+    with pytest.raises(PoolEmpty):
+        deployment_pool.claim('ci-3', print)
+
+
+def test_refill_in_background(deployment_pool, monkeypatch):
+    started = []
+    monkeypatch.setattr(pool.subprocess, 'Popen',
+                        lambda args, **kwargs: started.append(args) or SimpleNamespace(pid=1))
+    deployment_pool.refill_in_background()
+    # whatever this process was started as
+    assert started == [[sys.executable, '-m', 'sesdev', 'pool', 'fill', 'pacific']]
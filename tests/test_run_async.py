@@ -0,0 +1,56 @@
+import sys
+
+import pytest
+
+from seslib import tools
+from seslib.exceptions import CmdException
+
+
+def _python(code):
+    return [sys.executable, '-c', code]
+
+
+def test_run_async_lines_and_multibyte_split():
+    # "ä" is written one byte at a time, with a flush in between
+    code = (
+        "import os, sys, time\n"
+        "os.write(1, b'first\\nsec')\n"
+        "time.sleep(0.05)\n"
+        "os.write(1, b'ond \\xc3')\n"
+        "time.sleep(0.05)\n"
+        "os.write(1, b'\\xa4\\nno newline')\n"
+    )
+    output = []
+    result = tools.run_async(_python(code), output.append)
+    assert output[1:] == ['first\n', 'second \u00e4\n', 'no newline']
+    assert result.returncode == 0
+
+
+def test_line_splitter():
+    splitter = tools._LineSplitter()
+    # a CRLF split between chunks is one line end
+    assert splitter.feed(b'first\r') == []
+    assert splitter.feed(b'\nprogress 1\rprogress 2\rform\x0cfeed\n') == \
+        ['first\r\n', 'progress 1\r', 'progress 2\r', 'form\x0cfeed\n']
+    assert splitter.feed(b'last\r') == []
+    assert splitter.feed(b'') == ['last\r']
+
+
+def test_run_async_drains_stderr():
+    # more stderr than fits into a pipe buffer, before any stdout
+    code = (
+        "import sys\n"
+        "for i in range(20000):\n"
+        "    sys.stderr.write('error line {}\\n'.format(i))\n"
+        "print('done')\n"
+        "sys.exit(3)\n"
+    )
+    output = []
+    result = tools.run_async(_python(code), output.append, check=False, stderr_lines=2)
+    assert output[1:] == ['done\n']
+    assert result.returncode == 3
+    assert result.stderr_tail == ['error line 19998', 'error line 19999']
+    with pytest.raises(CmdException) as excinfo:
+        tools.run_async(_python(code), output.append, stderr_lines=1)
+    assert excinfo.value.retcode == 3
+    assert excinfo.value.stderr == 'error line 19999'
@@ -0,0 +1,53 @@
+import sys
+import time
+
+import pytest
+
+from seslib import tools
+from seslib.exceptions import CommandsFailed
+
+
+def _python(code):
+    return [sys.executable, '-c', code]
+
+
+def test_run_many_results_in_order():
+    specs = [
+        tools.CommandSpec(_python("import time; time.sleep(0.2); print('a1'); print('a2')"),
+                          name='a'),
+        tools.CommandSpec(_python("print('b1'); print('b2')"), name='b'),
+    ]
+    lines = []
+    results = tools.run_many(specs, callback=lambda name, line: lines.append((name, line)))
+    assert [r.name for r in results] == ['a', 'b']
+    assert [r.output for r in results] == ['a1\na2\n', 'b1\nb2\n']
+    assert [line for (name, line) in lines if name == 'a'] == ['a1\n', 'a2\n']
+    assert [line for (name, line) in lines if name == 'b'] == ['b1\n', 'b2\n']
+
+
+def test_run_many_is_bounded():
+    sleep = _python("import time; time.sleep(0.3)")
+    started = time.monotonic()
+    tools.run_many([sleep] * 4, jobs=4)
+    parallel = time.monotonic() - started
+    started = time.monotonic()
+    tools.run_many([sleep] * 4, jobs=2)
+    bounded = time.monotonic() - started
+    assert parallel < 1.0
+    assert bounded >= 0.6
+
+
+def test_run_many_aggregates_failures():
+    specs = [
+        tools.CommandSpec(_python("print('ok')"), name='good'),
+        tools.CommandSpec(_python("import sys; sys.exit('broken')"), name='bad'),
+        tools.CommandSpec(_python("import time; time.sleep(10)"), name='slow', timeout=0.3),
+    ]
+    with pytest.raises(CommandsFailed) as excinfo:
+        tools.run_many(specs)
+    assert [r.name for r in excinfo.value.failed] == ['bad', 'slow']
+    assert excinfo.value.failed[0].stderr_tail == ['broken']
+    assert excinfo.value.failed[1].timed_out
+    assert 'broken' in str(excinfo.value)
+    results = tools.run_many(specs[:2], check=False)
+    assert [r.returncode for r in results] == [0, 1]
@@ -0,0 +1,161 @@
+import xml.etree.ElementTree as ET
+
+import pytest
+
+# seslib needs libvirt
+libvirt = pytest.importorskip('libvirt')
+
+from seslib.box import Box  # noqa: E402
+from seslib.exceptions import SnapshotAlreadyExists, SnapshotRevertNotSupported  # noqa: E402
+from seslib.snapshot import DeploymentSnapshots  # noqa: E402
+
+DOMAIN_XML = """
+<domain>
+  <devices>
+    <disk type='file' device='disk'>
+      <source file='/pool/foo_{name}.img'/>
+      <target dev='vda'/>
+    </disk>
+    <disk type='file' device='disk'>
+      <source file='/pool/foo_{name}-vdb.qcow2'/>
+      <target dev='vdb'/>
+    </disk>
+    <disk type='file' device='cdrom'>
+      <source file='/pool/foo_{name}-seed.iso'/>
+      <target dev='sda'/>
+    </disk>
+  </devices>
+</domain>
+"""
+
+
+class FakeSnapshot():
+    def __init__(self, domain, xml):
+        self.domain = domain
+        self.tree = ET.fromstring(xml)
+        self.tree.append(ET.fromstring('<creationTime>1000</creationTime>'))
+        self.tree.append(ET.fromstring('<state>{}</state>'.format(
+            'paused' if domain.active else 'shutoff')))
+
+    def getName(self):
+        return self.tree.findtext('name')
+
+    def getXMLDesc(self, _flags):
+        return ET.tostring(self.tree, encoding='unicode')
+
+    def delete(self, _flags):
+        self.domain.calls.append('delete')
+        self.domain.snapshots.remove(self)
+
+
+class FakeDomain():
+    def __init__(self, name, active=True, fail=False):
+        self.name = name
+        self.active = active
+        self.fail = fail
+        self.snapshots = []
+        self.calls = []
+
+    def XMLDesc(self, _flags):
+        return DOMAIN_XML.format(name=self.name)
+
+    def state(self):
+        return [libvirt.VIR_DOMAIN_RUNNING if self.active else libvirt.VIR_DOMAIN_SHUTOFF, 0]
+
+    def isActive(self):
+        return self.active
+
+    def suspend(self):
+        self.calls.append('suspend')
+
+    def resume(self):
+        self.calls.append('resume')
+
+    def snapshotCreateXML(self, xml, flags):
+        if self.fail:
+            raise libvirt.libvirtError('no space left')
+        self.calls.append(('snapshot', flags))
+        self.snapshots.append(FakeSnapshot(self, xml))
+
+    def listAllSnapshots(self, _flags):
+        return list(self.snapshots)
+
+    def snapshotLookupByName(self, name, _flags):
+        for snapshot in self.snapshots:
+            if snapshot.getName() == name:
+                return snapshot
+        raise libvirt.libvirtError('no such snapshot')
+
+    def revertToSnapshot(self, _snapshot, flags):
+        self.calls.append(('revert', flags))
+
+
+class FakeConnection():
+    def __init__(self, domains, version=9009000):
+        self.domains = domains
+        self.version = version
+
+    def lookupByName(self, name):
+        return self.domains[name]
+
+    def getLibVersion(self):
+        return self.version
+
+
+@pytest.fixture(name='domains')
+def fixture_domains(monkeypatch):
+    domains = {'foo_master': FakeDomain('master'),
+               'foo_node1': FakeDomain('node1'),
+               'foo_node2': FakeDomain('node2', active=False)}
+    conn = FakeConnection(domains)
+    monkeypatch.setattr(Box, 'libvirt_connection', classmethod(lambda cls, uri: conn))
+    return domains
+
+
+def _snapshots():
+    return DeploymentSnapshots('foo', 'test:///default', ['master', 'node1', 'node2'])
+
+
+def test_snapshot_xml(domains):
+    tree = ET.fromstring(_snapshots()._snapshot_xml(domains['foo_master'], 'clean', True))
+    assert tree.find('memory').get('file') == '/pool/foo_master.snap-clean.mem'
+    disks = {disk.get('name'): disk for disk in tree.findall('./disks/disk')}
+    assert disks['vdb'].get('snapshot') == 'external'
+    assert disks['vdb'].find('source').get('file') == '/pool/foo_master-vdb.snap-clean.qcow2'
+    assert disks['sda'].get('snapshot') == 'no'
+    tree = ET.fromstring(_snapshots()._snapshot_xml(domains['foo_node2'], 'clean', False))
+    assert tree.find('memory').get('snapshot') == 'no'
+
+
+def test_snapshot_save(domains):
+    _snapshots().save('clean')
+    for name in ['foo_master', 'foo_node1']:
+        assert domains[name].calls == ['suspend', ('snapshot', 0), 'resume']
+    assert domains['foo_node2'].calls == [
+        ('snapshot', libvirt.VIR_DOMAIN_SNAPSHOT_CREATE_DISK_ONLY)]
+    assert _snapshots().list() == [{'name': 'clean', 'created': 1000,
+                                    'nodes': ['master', 'node1', 'node2']}]
+    with pytest.raises(SnapshotAlreadyExists):
+        _snapshots().save('clean')
+
+
+def test_snapshot_save_rolls_back(domains):
+    domains['foo_node1'].fail = True
+    with pytest.raises(libvirt.libvirtError):
+        _snapshots().save('clean')
+    assert _snapshots().list() == []
+    assert domains['foo_node1'].calls == ['suspend', 'resume']
+
+
+def test_snapshot_restore(domains, monkeypatch):
+    _snapshots().save('clean')
+    assert _snapshots().restore('clean') == ['master', 'node1']
+    assert domains['foo_master'].calls[-2:] == [
+        ('revert', libvirt.VIR_DOMAIN_SNAPSHOT_REVERT_PAUSED), 'resume']
+    assert domains['foo_node2'].calls[-1] == (
+        'revert', libvirt.VIR_DOMAIN_SNAPSHOT_REVERT_PAUSED)
+
+    conn = FakeConnection(domains, version=8000000)
+    monkeypatch.setattr(Box, 'libvirt_connection', classmethod(lambda cls, uri: conn))
+    with pytest.raises(SnapshotRevertNotSupported):
+        _snapshots().restore('clean')
@@ -0,0 +1,96 @@
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from seslib.constant import Constant
+from seslib.deployment import Deployment
+from seslib.exceptions import CmdException
+from seslib.node import Node
+from seslib.settings import Settings
+from seslib.state import StateStore
+
+
+VAGRANT_SSH_CONFIG = """Host master
+  HostName 192.168.121.10
+  User vagrant
+  Port 22
+  IdentityFile /root/.sesdev/foo/.vagrant/machines/master/libvirt/private_key
+
+Host node1
+  HostName 192.168.121.11
+  User vagrant
+  ProxyCommand ssh 'libvirt.example.com' -l 'root' -i '/root/.ssh/id_rsa' nc %h %p
+"""
+
+
+def test_parse_vagrant_ssh_config():
+    assert Deployment._parse_vagrant_ssh_config(VAGRANT_SSH_CONFIG) == {
+        'master': ('192.168.121.10', None),
+        'node1': ('192.168.121.11',
+                  "ssh 'libvirt.example.com' -l 'root' -i '/root/.ssh/id_rsa' nc %h %p"),
+    }
+
+
+def _fake_deployment():
+    dep = SimpleNamespace(dep_id='foo', _ssh_config_fresh=set(), refreshed=[])
+    dep._refresh_ssh_config = lambda name: (dep.refreshed.append(name),
+                                            dep._ssh_config_fresh.add(name))
+    return dep
+
+
+@pytest.mark.usefixtures('working_dir')
+def test_ssh_config_from_index():
+    nodes = {'master': Node('master', 'master.foo.test', ['master'], None)}
+    StateStore().save_deployment('foo', {'id': 'foo', 'settings': Settings()}, nodes.values())
+    StateStore().set_ssh_config('foo', 'master', '192.168.121.10', None, '/key')
+    dep = _fake_deployment()
+    dep.nodes = nodes
+    dep._ssh_config_lock = threading.Lock()
+    # no cache file
+    dep._read_ssh_config_cache = lambda: {}
+    assert Deployment._vagrant_ssh_config(dep, 'master') == ('192.168.121.10', None, '/key')
+    assert not dep.refreshed
+
+
+def test_retry_on_ssh_failure():
+    dep = _fake_deployment()
+    results = iter([CmdException(['ssh'], 255, ''), 'output'])
+
+    def _run():
+        result = next(results)
+        if isinstance(result, Exception):
+            raise result
+        return result
+    assert Deployment._retry_on_ssh_failure(dep, 'master', _run) == 'output'
+    assert dep.refreshed == ['master']
+
+    # only once per node and process
+    results = iter([CmdException(['ssh'], 255, ''), 'output'])
+    with pytest.raises(CmdException):
+        Deployment._retry_on_ssh_failure(dep, 'master', _run)
+
+    # exit status returned rather than raised
+    results = iter([255, 0])
+    assert Deployment._retry_on_ssh_failure(dep, 'node1', lambda: next(results)) == 0
+    assert dep.refreshed == ['master', 'node1']
+
+
+def test_no_retry_on_command_failure():
+    dep = _fake_deployment()
+
+    def _run():
+        raise CmdException(['ssh'], 1, '')
+    with pytest.raises(CmdException):
+        Deployment._retry_on_ssh_failure(dep, 'master', _run)
+    assert not dep.refreshed
+
+
+def test_ssh_mux_dir(tmp_path, monkeypatch):
+    dep = SimpleNamespace(_dep_dir=str(tmp_path / 'foo'))
+    monkeypatch.setattr(Constant, 'SSH_CONTROL_DIR_MAX_LENGTH', 1000)
+    assert Deployment._ssh_mux_dir.fget(dep) == str(tmp_path / 'foo' / 'mux')
+    monkeypatch.setattr(Constant, 'SSH_CONTROL_DIR_MAX_LENGTH', 10)
+    mux_dir = Deployment._ssh_mux_dir.fget(dep)
+    assert not mux_dir.startswith(str(tmp_path))
+    assert mux_dir == Deployment._ssh_mux_dir.fget(dep)
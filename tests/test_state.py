@@ -0,0 +1,85 @@
+import json
+import os
+import sqlite3
+
+from seslib.constant import Constant
+from seslib.deployment import DeploymentRecord
+from seslib.node import Node
+from seslib.settings import Settings, SettingsEncoder
+from seslib.state import SCHEMA_VERSION, StateStore
+
+
+def _save(store, dep_id, public_network, node_names=('master', 'node1')):
+    settings = Settings(version='ses7', os='sles-15-sp2', public_network=public_network)
+    nodes = [Node(name, '{}.{}.test'.format(name, dep_id), [], '') for name in node_names]
+    store.save_deployment(dep_id, {'id': dep_id, 'settings': settings}, nodes)
+    return nodes
+
+
+def test_state_store(tmp_path):
+    store = StateStore(str(tmp_path / 'state.db'))
+    assert not store.exists()
+    _save(store, 'foo', '10.20.7.')
+    _save(store, 'foo-bar', '10.20.8.')
+    nodes = _save(store, 'baz', None, node_names=('master',))
+    assert store.exists()
+
+    assert [m['id'] for m in store.deployments()] == ['baz', 'foo', 'foo-bar']
+    assert [m['id'] for m in store.deployments('foo*')] == ['foo', 'foo-bar']
+    assert [m['id'] for m in store.deployments('[!f]*')] == ['baz']
+    assert store.deployments('foo')[0]['settings']['os'] == 'sles-15-sp2'
+    assert store.networks_in_use() == ({'10.20.7.', '10.20.8.'}, set())
+
+    nodes[0].status = 'running'
+    store.set_node_statuses('baz', nodes)
+    assert store.node_statuses('baz')['master'][0] == 'running'
+
+    store.set_ssh_config('baz', 'master', '192.168.121.2', None, '/key')
+    store.set_ssh_config('baz', 'nonexistent', '192.168.121.3', None, '/key')
+    assert store.ssh_config('baz', 'master') == ('192.168.121.2', None, '/key')
+    assert store.ssh_config('baz', 'nonexistent') is None
+    store.clear_ssh_configs('baz')
+    assert store.ssh_config('baz', 'master') is None
+
+    # re-saving drops nodes which are gone
+    _save(store, 'foo', '10.20.7.', node_names=('master',))
+    assert list(store.node_statuses('foo')) == ['master']
+
+    store.remove_deployment('foo')
+    assert [m['id'] for m in store.deployments()] == ['baz', 'foo-bar']
+    assert store.node_statuses('foo') == {}
+
+
+def test_schema_upgrade(tmp_path):
+    path = str(tmp_path / 'state.db')
+    conn = sqlite3.connect(path)
+    # as left by an older sesdev, without the node tables
+    conn.executescript("CREATE TABLE deployments (id TEXT PRIMARY KEY, version TEXT, os TEXT, "
+                       "public_network TEXT, cluster_network TEXT, metadata TEXT NOT NULL, "
+                       "updated REAL NOT NULL); PRAGMA user_version = 2;")
+    conn.close()
+    store = StateStore(path)
+    assert store.deployments() == []
+    _save(store, 'foo', '10.20.7.')
+    assert list(store.node_statuses('foo')) == ['master', 'node1']
+    conn = sqlite3.connect(path)
+    tables = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+    assert tables == ['deployments', 'nodes', 'ssh_configs']
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+    conn.close()
+
+
+def test_reindex(working_dir):
+    store = StateStore()
+    _save(store, 'gone', '10.20.9.')
+    # directory removed behind sesdev's back
+    assert [r.dep_id for r in DeploymentRecord.list()] == []
+    # deployment created behind sesdev's back
+    os.makedirs(str(working_dir / 'new'))
+    with open(str(working_dir / 'new' / Constant.METADATA_FILENAME), 'w') as file:
+        json.dump({'id': 'new', 'settings': Settings(public_network='10.20.10.')},
+                  file, cls=SettingsEncoder)
+    assert [r.dep_id for r in DeploymentRecord.reindex()] == ['new']
+    assert [m['id'] for m in store.deployments()] == ['new']
+    assert store.networks_in_use() == ({'10.20.10.'}, set())
@@ -0,0 +1,98 @@
+import json
+import os
+import subprocess
+
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from seslib.exceptions import SubnetsExhausted
+from seslib.subnets import SubnetAllocator
+
+
+def _allocator(tmp_path):
+    return SubnetAllocator(str(tmp_path / 'subnets.json'))
+
+
+def test_reserve_lowest_free(tmp_path):
+    allocator = _allocator(tmp_path)
+    assert allocator.reserve('foo', ['public', 'cluster']) == \
+        {'public': '10.20.2.', 'cluster': '10.21.2.'}
+    in_use = {'public': {'10.20.3.', '192.168.1.'}}
+    assert allocator.reserve('bar', ['public'], in_use) == {'public': '10.20.4.'}
+    # reserving again for the same deployment replaces its reservation
+    assert allocator.reserve('foo', ['public']) == {'public': '10.20.2.'}
+    allocator.release('foo')
+    with open(allocator.path, encoding='utf-8') as file:
+        assert json.load(file) == {'cluster': {}, 'public': {'4': {'id': 'bar',
+                                                                   'pid': os.getpid()}}}
+
+
+def test_stale_reservations_are_dropped(tmp_path):
+    allocator = _allocator(tmp_path)
+    with subprocess.Popen(['true']) as process:
+        process.wait()
+    with open(allocator.path, 'w', encoding='utf-8') as file:
+        json.dump({'public': {'2': {'id': 'gone', 'pid': process.pid},
+                              '3': {'id': 'kept', 'pid': process.pid}}}, file)
+    os.makedirs(str(tmp_path / 'kept'))
+    assert allocator.reserve('foo', ['public']) == {'public': '10.20.2.'}
+
+
+def test_exhausted(tmp_path):
+    allocator = _allocator(tmp_path)
+    in_use = {'public': {'10.20.{}.'.format(number) for number in range(2, 200)}}
+    assert allocator.reserve('foo', ['public'], in_use) == {'public': '10.20.200.'}
+    with pytest.raises(SubnetsExhausted):
+        allocator.reserve('bar', ['public'], in_use)
+
+
+def test_concurrent_reservations(tmp_path):
+    allocator = _allocator(tmp_path)
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        networks = list(executor.map(
+            lambda number: allocator.reserve('dep{}'.format(number), ['public'])['public'],
+            range(32)))
+    assert len(set(networks)) == 32
+
+
+class FakeNetwork():
+    def __init__(self, xml):
+        self.xml = xml
+
+    def XMLDesc(self, _flags):
+        return self.xml
+
+
+class FakeHost():
+    def listAllNetworks(self, _flags):
+        return [FakeNetwork("<network><ip address='10.20.2.1' netmask='255.255.255.0'/>"
+                            "</network>"),
+                FakeNetwork("<network><ip address='10.21.7.1' prefix='24'/>"
+                            "<ip family='ipv6' address='fd00::1' prefix='64'/></network>"),
+                FakeNetwork("<network><ip address='10.0.0.1' netmask='255.0.0.0'/></network>"),
+                FakeNetwork("<network><forward mode='bridge'/></network>")]
+
+
+def test_on_host(tmp_path):
+    on_host = SubnetAllocator.on_host(FakeHost())
+    assert on_host == {'10.20.2.', '10.21.7.'}
+    # a network left on the host is not handed out again
+    assert _allocator(tmp_path).reserve('foo', ['public', 'cluster'],
+                                        {'public': on_host, 'cluster': on_host}) == \
+        {'public': '10.20.3.', 'cluster': '10.21.2.'}
+
+
+def test_requested(tmp_path):
+    allocator = _allocator(tmp_path)
+    assert allocator.reserve('foo', ['public', 'cluster'],
+                             requested={'public': '10.20.2.', 'cluster': '192.168.100.'}) == \
+        {'public': '10.20.2.', 'cluster': '192.168.100.'}
+    # another deployment asking for the same networks (not saved yet, so
+    # unknown to the state index) gets networks of its own
+    assert allocator.reserve('bar', ['public', 'cluster'],
+                             requested={'public': '10.20.2.', 'cluster': '192.168.100.'}) == \
+        {'public': '10.20.3.', 'cluster': '10.21.2.'}
+    allocator.release('foo')
+    assert allocator.reserve('baz', ['cluster'], requested={'cluster': '192.168.100.'}) == \
+        {'cluster': '192.168.100.'}
@@ -0,0 +1,164 @@
+import contextlib
+
+from types import SimpleNamespace
+
+import pytest
+
+# seslib needs libvirt
+libvirt = pytest.importorskip('libvirt')
+
+from seslib.box import Box  # noqa: E402
+from seslib.deployment import Deployment  # noqa: E402
+from seslib.teardown import LibvirtTeardown  # noqa: E402
+
+DOMAIN_XML = """
+<domain>
+  <devices>
+    <interface type='network'>
+      <source network='vagrant-libvirt'/>
+    </interface>
+    <interface type='network'>
+      <source network='{network}'/>
+    </interface>
+  </devices>
+</domain>
+"""
+
+
+class FakeResource():
+    def __init__(self, host, kind, name, active=False, network=None, fail=False):
+        self.host = host
+        self.kind = kind
+        self._name = name
+        self.active = active
+        self.network = network
+        self.fail = fail
+
+    def name(self):
+        return self._name
+
+    def isActive(self):
+        return self.active
+
+    def XMLDesc(self, _flags):
+        return DOMAIN_XML.format(network=self.network)
+
+    def _remove(self, operation):
+        if self.fail:
+            raise libvirt.libvirtError('{} {} failed'.format(operation, self._name))
+        self.host.removed.append((self.kind, self._name))
+
+    def destroy(self):
+        self.host.removed.append(('destroy', self._name))
+        self.active = False
+
+    def undefineFlags(self, _flags):
+        self._remove('undefine')
+
+    def undefine(self):
+        self._remove('undefine')
+
+    def delete(self, _flags):
+        self._remove('delete')
+
+
+class FakeHost():
+    def __init__(self):
+        self.removed = []
+        self.domains = [FakeResource(self, 'domain', 'ci-1_master', True, 'ci-1-private'),
+                        FakeResource(self, 'domain', 'ci-1_node1', False, 'ci-1-private'),
+                        FakeResource(self, 'domain', 'ci-2_master', True, 'sesdev-ci-2'),
+                        FakeResource(self, 'domain', 'other_master', True, 'other-private')]
+        self.volumes = [FakeResource(self, 'volume', 'ci-1_master.img'),
+                        FakeResource(self, 'volume', 'ci-1_node1-vdb.qcow2'),
+                        FakeResource(self, 'volume', 'ci-2_master.img', fail=True),
+                        FakeResource(self, 'volume', 'ci-10_master.img'),
+                        FakeResource(self, 'volume', 'sesdev-baked-ses7.qcow2')]
+        self.networks = {name: FakeResource(self, 'network', name, True)
+                         for name in ['sesdev-ci-2', 'ci-1-private', 'vagrant-libvirt']}
+
+    # the connection
+    def listAllDomains(self, _flags):
+        return self.domains
+
+    def storagePoolLookupByName(self, _name):
+        return self
+
+    def listNetworks(self):
+        return list(self.networks)
+
+    @staticmethod
+    def listDefinedNetworks():
+        return []
+
+    def networkLookupByName(self, name):
+        return self.networks[name]
+
+    # the storage pool
+    def refresh(self, _flags):
+        pass
+
+    def listAllVolumes(self, _flags):
+        return self.volumes
+
+
+def test_inventory():
+    inventory = LibvirtTeardown(FakeHost(), 'default', ['ci-1', 'ci-2']).inventory()
+    assert [domain.name() for domain in inventory['ci-1']['domains']] == \
+        ['ci-1_master', 'ci-1_node1']
+    assert [volume.name() for volume in inventory['ci-1']['volumes']] == \
+        ['ci-1_master.img', 'ci-1_node1-vdb.qcow2']
+    assert inventory['ci-1']['networks'] == []
+    assert inventory['ci-2']['networks'] == ['sesdev-ci-2']
+
+    inventory = LibvirtTeardown(FakeHost(), 'default', ['ci-1'], True).inventory()
+    assert inventory['ci-1']['networks'] == ['ci-1-private']
+
+
+def test_run():
+    host = FakeHost()
+    errors = LibvirtTeardown(host, 'default', ['ci-1', 'ci-2'], True).run()
+    assert not errors['ci-1']
+    assert [str(error) for error in errors['ci-2']] == ['delete ci-2_master.img failed']
+    kinds = [kind for (kind, _) in host.removed if kind != 'destroy']
+    # all domains go first, the networks last
+    assert kinds.index('volume') > max(i for (i, kind) in enumerate(kinds) if kind == 'domain')
+    assert kinds[-2:] == ['network', 'network']
+    assert sorted(name for (kind, name) in host.removed if kind == 'domain') == \
+        ['ci-1_master', 'ci-1_node1', 'ci-2_master']
+    assert sorted(name for (kind, name) in host.removed if kind == 'network') == \
+        ['ci-1-private', 'sesdev-ci-2']
+    assert ('volume', 'ci-10_master.img') not in host.removed
+
+
+class FakeDeployment():
+    def __init__(self, dep_id, forgotten):
+        self.dep_id = dep_id
+        self.settings = SimpleNamespace(libvirt_storage_pool=None)
+        self.engine = True  # libvirt-native
+        self.lock = SimpleNamespace(exclusive=contextlib.nullcontext)
+        self.forgotten = forgotten
+
+    def close_ssh_masters(self):
+        pass
+
+    def forget(self):
+        self.forgotten.append(self.dep_id)
+
+
+@pytest.mark.usefixtures('working_dir')
+def test_destroy_many(monkeypatch):
+    monkeypatch.setattr(Box, 'libvirt_uri_from_settings', lambda _settings: 'qemu:///system')
+    monkeypatch.setattr(Box, 'libvirt_connection', lambda _uri: FakeHost())
+    forgotten = []
+    deps = [FakeDeployment('ci-1', forgotten), FakeDeployment('ci-2', forgotten)]
+    # what sesdev keeps of ci-2 is needed to try destroying it again
+    assert Deployment.destroy_many(deps, print) == ['ci-2']
+    assert forgotten == ['ci-1']
+
+    def _unreachable(_uri):
+        raise libvirt.libvirtError('cannot connect')
+    monkeypatch.setattr(Box, 'libvirt_connection', _unreachable)
+    forgotten.clear()
+    assert Deployment.destroy_many(deps, print) == ['ci-1', 'ci-2']
+    assert not forgotten